@@ -0,0 +1,137 @@
+#
+#   Scaling benchmark: per-step latency of the server versus the terrain resolution
+#   For each resolution, a server thread runs the hot path of ServerSimulator.py (receive into the
+#   FrameStore, derived maps, vegetation statistics, reply) on the unified endpoint, and the stand-in
+#   client measures the round trips. The background work of a saved step (normalization, figure, PNGs)
+#   is timed separately, since it no longer delays the reply.
+#
+
+import io
+import json
+import threading
+import time
+import zmq
+import numpy as np
+from PIL import Image
+from ClientSimulator import synthetic_frame
+from FrameProtocol import send_frame, recv_frame
+from FrameStore import FrameStore, normalize
+from SimulationRenderer import SimulationRenderer
+
+# Settings
+resolutions = [257, 513, 1025, 2049]
+numSteps = 100
+warmupSteps = 5
+endpoint = "tcp://127.0.0.1:5590"
+outputFile = "benchmark-resolution.json"
+
+
+def serve(context, ready):
+    socket = context.socket(zmq.REP)
+    socket.bind(endpoint)
+    ready.set()
+
+    store = None
+    for idx in range(1, numSteps + warmupSteps + 1):
+        if store is None:
+            store, step = FrameStore.from_unified_socket(socket)
+        else:
+            store.advance()
+            store.recv_frame_into(socket)
+
+        if idx == 4:
+            store.set_reference()
+        store.update_derived()
+
+        send_frame(socket, idx, store.shape, {
+            "vegetation": store.vegetation_normalized,
+            "height": store.difference,
+            "pressure": store.pressure,
+            "young": store.initial_young,
+            "distance": store.distance,
+        })
+
+        # Vegetation statistics, as in the server loop
+        mask = store.initial_vegetation != 0
+        np.mean(store.vegetation[mask] / store.initial_vegetation[mask] * 100)
+
+    socket.close()
+
+
+def time_round_trips(size):
+    context = zmq.Context()
+    ready = threading.Event()
+    server = threading.Thread(target=serve, args=(context, ready))
+    server.start()
+    ready.wait()
+
+    socket = context.socket(zmq.REQ)
+    socket.connect(endpoint)
+    frames = [synthetic_frame(step, size) for step in range(1, 3)]
+
+    times = []
+    for step in range(1, numSteps + warmupSteps + 1):
+        start = time.perf_counter()
+        send_frame(socket, step, (size, size), frames[step % len(frames)])
+        recv_frame(socket)
+        if step > warmupSteps:
+            times.append(time.perf_counter() - start)
+
+    server.join()
+    socket.close()
+    context.term()
+    return np.asarray(times) * 1000
+
+
+def time_background(size, repeats=5):
+    # Normalization, figure update and the nine PNG encodes of a saved step
+    frame = synthetic_frame(50, size)
+    renderer = SimulationRenderer((size, size), headless=True)
+    normalized = np.zeros((size, size), dtype=np.float32)
+    rgb = np.zeros((size, size, 3), dtype=np.uint8)
+
+    times = []
+    for repeat in range(repeats):
+        start = time.perf_counter()
+        normalize(frame["pressure"], 0, 5000000, out=normalized)
+        renderer.update({"pressure": normalized + repeat}, [1, 2], [100, 99], 1.0)
+        for channel in range(3):
+            np.copyto(rgb[..., channel], normalized, casting='unsafe')
+        buffer = io.BytesIO()
+        for _ in range(2):
+            Image.fromarray(rgb).save(buffer, format="png")
+        for _ in range(6):
+            Image.fromarray(rgb[..., 0]).save(buffer, format="png")
+        Image.fromarray(renderer.to_array()).save(buffer, format="png")
+        times.append(time.perf_counter() - start)
+    return np.asarray(times) * 1000
+
+
+if __name__ == "__main__":
+    results = []
+    print(f"{'size':>6} {'MB/step':>8} {'p50 ms':>8} {'p95 ms':>8} {'steps/s':>8} {'background ms':>14}")
+    for size in resolutions:
+        roundTrips = time_round_trips(size)
+        background = time_background(size)
+        megabytes = sum(array.nbytes for array in synthetic_frame(1, size).values()) / 1e6
+
+        result = {
+            "size": size,
+            "megabytes_per_step": megabytes,
+            "round_trip_ms": {
+                "mean": float(roundTrips.mean()),
+                "p50": float(np.percentile(roundTrips, 50)),
+                "p95": float(np.percentile(roundTrips, 95)),
+                "p99": float(np.percentile(roundTrips, 99)),
+            },
+            "steps_per_second": float(1000 / roundTrips.mean()),
+            "background_ms": float(np.median(background)),
+        }
+        results.append(result)
+        print(f"{size:>6} {megabytes:>8.1f} {result['round_trip_ms']['p50']:>8.2f} "
+              f"{result['round_trip_ms']['p95']:>8.2f} {result['steps_per_second']:>8.1f} "
+              f"{result['background_ms']:>14.1f}")
+
+    with open(outputFile, "w") as file:
+        json.dump({"steps": numSteps, "results": results}, file, indent=2)
+    print(f"Results saved to {outputFile}")
@@ -0,0 +1,363 @@
+#
+#   Benchmark suite of the Python servers, offline and CPU-only
+#   Each server script runs unchanged in its own process (settings overridden below: no sleep, no window,
+#   outputs in a temporary folder) and the stand-in Unity client of ClientSimulator.py sends it seeded
+#   synthetic frames (float32 maps, double Young map) for each terrain resolution, closed-loop or at a fixed rate.
+#   Measured per server and resolution:
+#       round trip   -> send of the maps until every reply is received. In closed loop (rate = 0) it includes
+#                       the work the server still does after the previous reply; with a rate below the
+#                       throughput of the server, it is the latency of the reply alone
+#       throughput   -> steps/s and MB/s over the measured steps
+#       memory       -> RSS of the server process after the warmup, at the end, and its growth per 100 steps
+#       stages       -> per-stage p50/p95/p99 of servers with StageMetrics (ServerSimulator.py), and the top
+#                       functions of a cProfile run when profileTop > 0 (separate run, the profiler slows it down)
+#   Results go to outputFile as JSON. With a baselineFile (an earlier outputFile), the changes are printed.
+#
+
+import cProfile
+import json
+import os
+import platform
+import pstats
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import zmq
+import numpy as np
+from ClientSimulator import connect_legacy_sockets, synthetic_frame, step_legacy, step_unified
+from FrameProtocol import UNIFIED_PORT
+
+# Settings
+# Server script -> settings replaced in its source (the first top-level assignment of each name)
+servers = {
+    "ServerSimulator.py": {"sleepTime": 0, "useUnifiedEndpoint": False,
+                           "metricsHttpPort": 8799, "metricsReportEvery": 1, "printMetrics": False},
+    "ServerDataCollection.py": {"sleepTime": 0, "showFigure": False},
+    "ServerData3D.py": {"sleepTime": 0},
+}
+sizes = [257, 513, 1025, 2049]
+numSteps = {257: 200, 513: 100, 1025: 40, 2049: 20}  # Measured steps per resolution
+warmupSteps = 5  # Not measured - the first step includes the start of the server
+rate = 0  # Steps per second sent by the client, 0 for closed loop (next step as soon as the replies arrive)
+distinctFrames = 4  # Frames generated up front and sent in turn (about 84MB each at 2049)
+replyTimeout = 120  # Seconds without reply before a run is reported as failed
+profileTop = 0  # > 0 also runs each server under cProfile and keeps its top functions
+keepOutput = False  # True keeps the figures and images written by the servers
+host = "localhost"
+outputFile = "benchmark-servers.json"
+baselineFile = None  # e.g. an earlier benchmark-servers.json
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# =============================================================
+
+# Server process
+
+def override_settings(source, overrides):
+    """Source of a server script with the first top-level assignment of each setting replaced."""
+    for name, value in overrides.items():
+        source, count = re.subn(rf"^{re.escape(name)}\s*=.*$", f"{name} = {value!r}", source, count=1, flags=re.M)
+        if count == 0:
+            raise ValueError(f"No top-level setting '{name}' to override")
+    return source
+
+
+def run_server(script, overrides, profilePath=None):
+    """Runs a server script with its settings overridden, until SIGINT. Called in the server process."""
+    path = os.path.join(SCRIPT_DIR, script)
+    with open(path) as file:
+        code = compile(override_settings(file.read(), overrides), path, "exec")
+    sys.argv = [path]
+
+    namespace = {"__name__": "__main__", "__file__": path}
+    profiler = cProfile.Profile() if profilePath else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        exec(code, namespace)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Further SIGINTs of stop_server must not interrupt the profile or the atexit handlers
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profilePath)
+        # Sockets closed first: a context collected with open sockets blocks in term()
+        if isinstance(namespace.get("context"), zmq.Context):
+            namespace["context"].destroy(linger=0)
+
+
+def start_server(script, overrides, directory, profilePath=None):
+    environment = dict(os.environ, MPLBACKEND="Agg", PYTHONPATH=SCRIPT_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    command = f"from BenchmarkServers import run_server; run_server({script!r}, {overrides!r}, {profilePath!r})"
+    log = open(os.path.join(directory, "server.log"), "wb")
+    process = subprocess.Popen([sys.executable, "-c", command], cwd=directory, env=environment,
+                               stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+    return process
+
+
+def stop_server(process, timeout=60):
+    # SIGINT, so the atexit handlers flush the images and the profile is written. Sent again every second:
+    # an interrupt in the middle of a step can be swallowed by the libraries, the next one lands in recv()
+    deadline = time.perf_counter() + timeout
+    while process.poll() is None and time.perf_counter() < deadline:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(1)
+        except subprocess.TimeoutExpired:
+            pass
+    if process.poll() is None:
+        process.kill()
+        process.wait()
+
+
+def rss_mb(pid):
+    """Resident memory of a process (Linux), None where /proc is not available."""
+    try:
+        with open(f"/proc/{pid}/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+
+def log_tail(directory, lines=20):
+    with open(os.path.join(directory, "server.log"), "rb") as file:
+        return file.read().decode("utf-8", "replace").splitlines()[-lines:]
+
+
+# =============================================================
+
+# Client
+
+def connect(context, unified):
+    if unified:
+        socket = context.socket(zmq.REQ)
+        socket.connect(f"tcp://{host}:{UNIFIED_PORT}")
+        sockets = {"frame": socket}
+    else:
+        sockets = connect_legacy_sockets(context)
+    for socket in sockets.values():
+        socket.setsockopt(zmq.RCVTIMEO, replyTimeout * 1000)
+        socket.setsockopt(zmq.LINGER, 0)
+    return sockets
+
+
+def drive(process, sockets, unified, frames, steps):
+    """
+    Sends warmupSteps + steps frames. Returns the round trips of the measured steps (ms), their total
+    duration (s) and RSS samples of the server.
+    """
+    roundTrips, memory = [], []
+    first = None
+    deadline = time.perf_counter()
+    for step in range(1, warmupSteps + steps + 1):
+        if rate > 0:
+            deadline += 1 / rate
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        frame = frames[step % len(frames)]
+        start = time.perf_counter()
+        try:
+            if unified:
+                step_unified(sockets["frame"], step, frame)
+            else:
+                step_legacy(sockets, frame)
+        except zmq.Again:
+            state = "exited" if process.poll() is not None else "did not reply"
+            raise RuntimeError(f"Server {state} at step {step}") from None
+        end = time.perf_counter()
+
+        if step > warmupSteps:
+            if first is None:
+                first = start
+            roundTrips.append(end - start)
+            if (step - warmupSteps) % 5 == 1 or step == warmupSteps + steps:
+                memory.append((step - warmupSteps, rss_mb(process.pid)))
+    return np.asarray(roundTrips) * 1000, end - first, memory
+
+
+def distribution(times):
+    if len(times) == 0:
+        return None
+    return {
+        "mean": float(times.mean()),
+        "p50": float(np.percentile(times, 50)),
+        "p95": float(np.percentile(times, 95)),
+        "p99": float(np.percentile(times, 99)),
+        "max": float(times.max()),
+    }
+
+
+def memory_growth(samples):
+    samples = [(step, rss) for step, rss in samples if rss is not None]
+    if len(samples) < 2:
+        return None
+    steps, rss = np.asarray(samples, dtype=np.float64).T
+    return {
+        "start_mb": float(rss[0]),
+        "end_mb": float(rss[-1]),
+        "peak_mb": float(rss.max()),
+        "growth_mb_per_100_steps": float(np.polyfit(steps, rss, 1)[0] * 100),
+    }
+
+
+def fetch_stages(sockets, unified, frame, steps, overrides):
+    """
+    Stage timers of a server with StageMetrics. The server reports at the end of a step once
+    metricsReportEvery seconds have passed, so one more (unmeasured) frame is sent after that delay.
+    """
+    time.sleep(overrides.get("metricsReportEvery", 30))
+    if unified:
+        step_unified(sockets["frame"], steps + 1, frame)
+    else:
+        step_legacy(sockets, frame)
+
+    deadline = time.perf_counter() + 5
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{overrides['metricsHttpPort']}/metrics", timeout=5) as response:
+                report = json.load(response)
+        except (OSError, ValueError):
+            return None
+        if report.get("steps", 0) >= steps:
+            return {"stages": report["stages_total"], "gauges": report["gauges"]}
+        time.sleep(0.05)
+    return None
+
+
+def top_functions(profilePath, steps, count):
+    """Functions with the most own time, per step (the start of the server, imports included, is spread over the steps)."""
+    stats = pstats.Stats(profilePath)
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:count]
+    return [{
+        "function": f"{os.path.basename(filename)}:{line}({name})",
+        "calls": calls,
+        "own_ms_per_step": total / steps * 1000,
+        "cumulative_ms_per_step": cumulative / steps * 1000,
+    } for (filename, line, name), (_, calls, total, cumulative, _) in rows]
+
+
+# =============================================================
+
+def run(script, overrides, size, frames, steps, profile=False):
+    unified = overrides.get("useUnifiedEndpoint", False)
+    directory = tempfile.mkdtemp(prefix="benchmark-")
+    profilePath = os.path.join(directory, "server.prof") if profile else None
+    process = start_server(script, overrides, directory, profilePath)
+
+    context = zmq.Context()
+    sockets = connect(context, unified)
+    result = {"server": script, "size": size, "mode": "unified" if unified else "legacy", "steps": steps}
+    try:
+        roundTrips, measured, memory = drive(process, sockets, unified, frames, steps)
+        megabytes = sum(array.nbytes for array in frames[0].values()) / 1e6
+        result.update({
+            "round_trip_ms": distribution(roundTrips),
+            "steps_per_second": steps / measured,
+            "megabytes_per_second": steps * megabytes / measured,
+            "measured_seconds": measured,
+            "memory": memory_growth(memory),
+        })
+        if "metricsHttpPort" in overrides:
+            result["stage_metrics"] = fetch_stages(sockets, unified, frames[0], warmupSteps + steps, overrides)
+    except RuntimeError as error:
+        result["error"] = str(error)
+        result["log"] = log_tail(directory)
+    finally:
+        for socket in sockets.values():
+            socket.close()
+        context.term()
+        stop_server(process)
+
+    if profile and "error" not in result:
+        try:
+            result = {"server": script, "size": size,
+                      "profile": top_functions(profilePath, warmupSteps + steps, profileTop)}
+        except (OSError, EOFError) as error:
+            result = {"server": script, "size": size, "error": f"No profile written: {error}"}
+    if keepOutput:
+        print(f"    output kept in {directory}")
+    else:
+        shutil.rmtree(directory, ignore_errors=True)
+    return result
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPT_DIR, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pyzmq": zmq.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(baseline, results):
+    """Prints the change of p50 round trip and throughput against an earlier run."""
+    previous = {(r["server"], r["size"], r.get("mode")): r for r in baseline["results"] if "round_trip_ms" in r}
+    print(f"Compared to {baselineFile} ({baseline['environment'].get('commit')}):")
+    for result in results:
+        old = previous.get((result["server"], result["size"], result.get("mode")))
+        if old is None or "round_trip_ms" not in result:
+            continue
+        roundTrip = result["round_trip_ms"]["p50"] / old["round_trip_ms"]["p50"] - 1
+        throughput = result["steps_per_second"] / old["steps_per_second"] - 1
+        print(f"    {result['server']:<24} {result['size']:>5}: p50 round trip {roundTrip:+7.1%}, "
+              f"steps/s {throughput:+7.1%}")
+
+
+if __name__ == "__main__":
+    info = environment()
+    print(f"Benchmark on {info['platform']}, {info['cpus']} CPUs, commit {info['commit']}")
+    print(f"{'server':<24} {'size':>5} {'p50 ms':>8} {'p95 ms':>8} {'steps/s':>8} {'MB/s':>7} {'RSS MB':>7} "
+          f"{'MB/100':>7}")
+
+    results = []
+    for size in sizes:
+        frames = [synthetic_frame(step, size) for step in range(1, distinctFrames + 1)]
+        steps = numSteps[size] if isinstance(numSteps, dict) else numSteps
+        for script, overrides in servers.items():
+            result = run(script, overrides, size, frames, steps)
+            results.append(result)
+            if "error" in result:
+                print(f"{script:<24} {size:>5} failed: {result['error']}")
+                continue
+
+            memory = result["memory"] or {"end_mb": float("nan"), "growth_mb_per_100_steps": float("nan")}
+            print(f"{script:<24} {size:>5} {result['round_trip_ms']['p50']:>8.2f} {result['round_trip_ms']['p95']:>8.2f} "
+                  f"{result['steps_per_second']:>8.1f} {result['megabytes_per_second']:>7.0f} "
+                  f"{memory['end_mb']:>7.0f} {memory['growth_mb_per_100_steps']:>7.1f}")
+
+            if profileTop > 0:
+                profiled = run(script, overrides, size, frames, steps, profile=True)
+                results.append(profiled)
+                for row in profiled.get("profile", [])[:5]:
+                    print(f"    {row['own_ms_per_step']:8.2f}ms/step {row['function']}")
+        del frames
+
+    settings = {"sizes": sizes, "numSteps": numSteps, "warmupSteps": warmupSteps, "rate": rate,
+                "distinctFrames": distinctFrames, "servers": servers}
+    with open(outputFile, "w") as file:
+        json.dump({"environment": info, "settings": settings, "results": results}, file, indent=2)
+    print(f"Results saved to {outputFile}")
+
+    if baselineFile:
+        with open(baselineFile) as file:
+            compare(json.load(file), results)
@@ -0,0 +1,158 @@
+#
+#   Builds the pix2pix dataset (A: *-input.png, B: *-output.png) from the collected TrainingData-* folders
+#   Replaces PrepareData.py + ShuffleData.py:
+#       1. Each source folder is listed once and the -input/-output files are paired by step id
+#       2. Pairs are numbered in memory (1..N, sources in order, steps ascending) and split into
+#          train/val/test with a seeded shuffle, so the same sources and seed always give the same dataset
+#       3. The assignment is written to a manifest, then the files are hardlinked (or copied) by a pool
+#          of workers into A/{train,val,test}/<index>.png and B/{train,val,test}/<index>.png
+#   If the build is interrupted, running it again reuses the manifest and only creates the missing files.
+#   Delete the manifest to build again from the sources.
+#
+
+import json
+import os
+import random
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+# Settings
+src_folders = ['frames/TrainData-13/TrainingData-1-Autumn-v3', 'frames/TrainData-13/TrainingData-2-Autumn-v3', 'frames/TrainData-13/TrainingData-3-Autumn-v3', 'frames/TrainData-13/TrainingData-4-Autumn-v3']
+# src_folders = ['frames/TrainData-v2-v3-pix2pix/Test/Data-v4-test']
+
+a_folder = 'frames/TrainData-13/A-shuf'
+b_folder = 'frames/TrainData-13/B-shuf'
+manifest_path = 'frames/TrainData-13/manifest.json'
+
+split = {"train": 0.8, "val": 0.1}  # The rest goes to test
+seed = 0
+use_hardlinks = True  # Falls back to copies across drives or on file systems without hardlinks
+workers = 16
+
+STEP_FILE = re.compile(r"^(\d+)-(input|output)\.png$")
+SPLITS = ("train", "val", "test")
+
+
+def scan_pairs(folders):
+    """[(input path, output path)] in source order, steps ascending. Unpaired files are reported and skipped."""
+    pairs = []
+    for folder in folders:
+        files = {}
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                match = STEP_FILE.match(entry.name)
+                if match:
+                    files.setdefault(int(match.group(1)), {})[match.group(2)] = entry.path
+
+        unpaired = [step for step, kinds in files.items() if len(kinds) != 2]
+        if unpaired:
+            print(f"{folder}: {len(unpaired)} steps without both input and output skipped, e.g. {sorted(unpaired)[:5]}")
+        pairs += [(files[step]["input"], files[step]["output"]) for step in sorted(files) if len(files[step]) == 2]
+        print(f"{folder}: {len(files) - len(unpaired)} pairs")
+    return pairs
+
+
+def assign_splits(count, split, seed):
+    """Split of each pair index (0..count-1), from a seeded shuffle as in ShuffleData.py."""
+    order = list(range(count))
+    random.Random(seed).shuffle(order)
+
+    numTrain = int(count * split["train"])
+    numVal = int(count * split["val"])
+    splits = [None] * count
+    for position, i in enumerate(order):
+        if position < numTrain:
+            splits[i] = "train"
+        elif position < numTrain + numVal:
+            splits[i] = "val"
+        else:
+            splits[i] = "test"
+    return splits
+
+
+def build_manifest(folders, split, seed):
+    pairs = scan_pairs(folders)
+    splits = assign_splits(len(pairs), split, seed)
+    return {
+        "sources": folders,
+        "split": split,
+        "seed": seed,
+        "entries": [{"index": i + 1, "split": s, "input": inputPath, "output": outputPath}
+                    for i, (s, (inputPath, outputPath)) in enumerate(zip(splits, pairs))],
+    }
+
+
+def load_or_build_manifest(path, folders, split, seed):
+    if os.path.exists(path):
+        with open(path) as file:
+            manifest = json.load(file)
+        if manifest["sources"] != folders or manifest["split"] != split or manifest["seed"] != seed:
+            raise ValueError(f"{path} was built with other sources, split or seed - delete it to rebuild")
+        print(f"Resuming from {path}: {len(manifest['entries'])} pairs")
+        return manifest
+
+    manifest = build_manifest(folders, split, seed)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w") as file:
+        json.dump(manifest, file)
+    os.replace(path + ".tmp", path)
+    return manifest
+
+
+def existing_files(folder):
+    """Names already in each split folder, listed once instead of one exists() per file."""
+    names = {}
+    for name in SPLITS:
+        os.makedirs(os.path.join(folder, name), exist_ok=True)
+        with os.scandir(os.path.join(folder, name)) as entries:
+            names[name] = {entry.name for entry in entries}
+    return names
+
+
+def materialize(src, dst, hardlink=True):
+    # Written under a temporary name, so an interrupted build never leaves a partial file behind
+    tmp = dst + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    if hardlink:
+        try:
+            os.link(src, tmp)
+            os.replace(tmp, dst)
+            return "linked"
+        except OSError:
+            pass
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+    return "copied"
+
+
+def build(manifest, a_folder, b_folder, hardlink=True, workers=16):
+    existing = {a_folder: existing_files(a_folder), b_folder: existing_files(b_folder)}
+
+    jobs = []
+    for entry in manifest["entries"]:
+        name = f"{entry['index']}.png"
+        for folder, src in ((a_folder, entry["input"]), (b_folder, entry["output"])):
+            if name not in existing[folder][entry["split"]]:
+                jobs.append((src, os.path.join(folder, entry["split"], name)))
+
+    total = 2 * len(manifest["entries"])
+    print(f"{total - len(jobs)} of {total} files already built, {len(jobs)} to go")
+
+    counts = {"linked": 0, "copied": 0}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for done, result in enumerate(pool.map(lambda job: materialize(*job, hardlink), jobs), 1):
+            counts[result] += 1
+            if done % 10000 == 0:
+                print(f"{done}/{len(jobs)} files")
+    return counts
+
+
+if __name__ == "__main__":
+    manifest = load_or_build_manifest(manifest_path, src_folders, split, seed)
+    counts = build(manifest, a_folder, b_folder, use_hardlinks, workers)
+
+    sizes = {name: sum(entry["split"] == name for entry in manifest["entries"]) for name in SPLITS}
+    print(f"Dataset: {sizes['train']} train, {sizes['val']} val, {sizes['test']} test pairs "
+          f"({counts['linked']} files linked, {counts['copied']} copied)")
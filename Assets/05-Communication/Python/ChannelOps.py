@@ -0,0 +1,192 @@
+#
+#   Channel operations on whole folders of images, in a pool of processes
+#   Replaces SeparateChannels.py, SeparateChannels-Test.py, ScaleUpInput.py and ReplaceVegetation.py: the
+#   operations are listed in the settings and applied in order to every image matching the pattern, as NumPy
+#   arrays (no per-pixel Python or PIL split/merge):
+#       ("scale", {"channel": 0, "factor": 5})                        -> channel * factor, clamped to the dtype
+#       ("swap", {"channels": (1, 2), "reference": path})             -> channels copied from a reference image
+#       ("clamp", {"channel": None, "low": 0, "high": 255})           -> channel (None: all) clipped to low..high
+#       ("split", {"suffixes": ("_r", "_g", "_b")})                    -> one grayscale image per channel
+#       ("tile", {"pair": ("real_A", "fake_B"), "suffix": "-templates", "figure": False})
+#             -> the six maps of the image and of its pair (name with pair[0] replaced by pair[1]) colored
+#                and tiled as in the "Simulation Maps" figure (ColormapLUT.py); figure=True for the
+#                matplotlib figure with titles, for publication
+#   Images are written to output_dir with the same name (plus suffix) when scale, swap or clamp change them.
+#   split and tile write their own files, from the image as it is at that point of the list.
+#
+
+import os
+import fnmatch
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+
+# Settings
+input_dir = 'frames/TrainData-12/TestData-1-Summer-v5'
+pattern = '*-input.png'
+output_dir = 'frames/TrainData-12/TestData-1-Summer-v5-MoreVegetation'
+suffix = ''  # Added to the name of the images written, e.g. '-scaled' to write next to the originals
+
+# ReplaceVegetation.py: initial vegetation and Young modulus of every input replaced with those of X
+operations = [
+    ("swap", {"channels": (1, 2), "reference": 'frames/TrainData-12/TestData-1-Summer-v5-MoreVegetation/X/4-input.png'}),
+]
+# ScaleUpInput.py: pressure 5 times higher
+# operations = [("scale", {"channel": 0, "factor": 5})]
+# SeparateChannels.py: channels as separate images, and the maps of the real input and fake output tiled
+# pattern = '*_real_A.png'
+# operations = [("split", {}), ("tile", {"pair": ("real_A", "fake_B"), "suffix": "-templates"})]
+
+workers = os.cpu_count()
+compressLevel = 6  # zlib level of the PNG files, from 1 (fast) to 9 (small)
+
+TRANSFORMS = ("scale", "swap", "clamp")
+INPUT_MAPS = ("pressure", "initial_vegetation", "initial_young")
+OUTPUT_MAPS = ("compression", "vegetation", "accumulation")
+
+_references = {}  # Reference images of the swap operations, loaded once per process
+
+
+def load_image(path):
+    return np.asarray(Image.open(path))
+
+
+def save_image(path, array, compressLevel=6):
+    # Written under a temporary name, so an interrupted run never leaves a partial image behind
+    root, ext = os.path.splitext(path)
+    tmp = root + ".tmp" + ext
+    Image.fromarray(array).save(tmp, compress_level=compressLevel)
+    os.replace(tmp, path)
+
+
+def _limits(dtype):
+    return (np.iinfo(dtype).min, np.iinfo(dtype).max) if dtype.kind in "ui" else (0.0, 1.0)
+
+
+def scale(image, channel=None, factor=1.0):
+    """Channel (None: all) multiplied by factor, rounded and clamped to the range of the dtype, as PIL point()."""
+    target = image if channel is None else image[..., channel]
+    low, high = _limits(image.dtype)
+    # In float64, as the lookup table of point(), then rounded half to even like its round()
+    scaled = target * float(factor)
+    if image.dtype.kind in "ui":
+        np.rint(scaled, out=scaled)
+    target[...] = np.clip(scaled, low, high)
+    return image
+
+
+def swap(image, channels, reference):
+    """Channels replaced by those of the reference image (same size)."""
+    if reference not in _references:
+        _references[reference] = load_image(reference)
+    source = _references[reference]
+    if source.shape[:2] != image.shape[:2]:
+        raise ValueError(f"{reference} is {source.shape[:2]}, the image is {image.shape[:2]}")
+    channels = list(channels)
+    image[..., channels] = source[..., channels]
+    return image
+
+
+def clamp(image, channel=None, low=0, high=255):
+    target = image if channel is None else image[..., channel]
+    np.clip(target, low, high, out=target)
+    return image
+
+
+def split(image, path, suffixes=("_r", "_g", "_b"), compressLevel=6):
+    root, ext = os.path.splitext(path)
+    for channel, channelSuffix in enumerate(suffixes):
+        save_image(root + channelSuffix + ext, np.ascontiguousarray(image[..., channel]), compressLevel)
+    return len(suffixes)
+
+
+def tile(image, source, path, pair=("real_A", "fake_B"), suffix="-templates", figure=False, compressLevel=6):
+    """Input maps from the image, output maps from its pair - The pair is read as it is on disk."""
+    directory, name = os.path.split(source)
+    if pair[0] not in name:
+        raise ValueError(f"{name} has no '{pair[0]}' to find its pair")
+    other = load_image(os.path.join(directory, name.replace(*pair)))
+    maps = dict(zip(INPUT_MAPS, np.moveaxis(image[..., :3], -1, 0)))
+    maps.update(zip(OUTPUT_MAPS, np.moveaxis(other[..., :3], -1, 0)))
+
+    root, ext = os.path.splitext(path)
+    if figure:
+        plot_figure(maps, root + suffix + ext)
+    else:
+        from ColormapLUT import MapTiler
+        save_image(root + suffix + ext, MapTiler(image.shape[:2]).render(maps), compressLevel)
+    return 1
+
+
+def plot_figure(maps, path):
+    # Titled matplotlib figure of the six maps (the former SeparateChannels.py output)
+    from matplotlib.figure import Figure
+    from ColormapLUT import TILE_PANELS
+    from SimulationRenderer import MAP_PANELS
+
+    fig = Figure(figsize=(10, 10))
+    axes = fig.subplots(nrows=3, ncols=2).flatten()
+    fig.suptitle("Simulation Maps", fontsize=14, fontweight='bold')
+    for ax, (name, cmap) in zip(axes, TILE_PANELS):
+        ax.set_title(MAP_PANELS[name][2])
+        ax.imshow(maps[name], cmap=cmap, interpolation='nearest', vmin=0, vmax=255)
+    fig.savefig(path)
+
+
+def process_image(source, output_dir, operations, suffix="", compressLevel=6):
+    """Applies the operations to one image. Returns the number of files written."""
+    image = np.array(load_image(source))  # Writable copy
+    root, ext = os.path.splitext(os.path.basename(source))
+    path = os.path.join(output_dir, root + suffix + ext)
+
+    written = 0
+    changed = False
+    for name, options in operations:
+        if name == "scale":
+            scale(image, **options)
+        elif name == "swap":
+            swap(image, **options)
+        elif name == "clamp":
+            clamp(image, **options)
+        elif name == "split":
+            written += split(image, path, compressLevel=compressLevel, **options)
+        elif name == "tile":
+            written += tile(image, source, path, compressLevel=compressLevel, **options)
+        changed |= name in TRANSFORMS
+
+    if changed:
+        save_image(path, image, compressLevel)
+        written += 1
+    return written
+
+
+def _process(args):
+    return process_image(*args)
+
+
+def run(input_dir, pattern, output_dir, operations, suffix="", workers=1, compressLevel=6):
+    """Processes every image of input_dir matching pattern. Returns (images, files written)."""
+    for name, _ in operations:
+        if name not in TRANSFORMS + ("split", "tile"):
+            raise ValueError(f"Unknown operation '{name}'")
+    os.makedirs(output_dir, exist_ok=True)
+
+    with os.scandir(input_dir) as entries:
+        sources = sorted(entry.path for entry in entries if entry.is_file() and fnmatch.fnmatch(entry.name, pattern))
+    jobs = [(source, output_dir, operations, suffix, compressLevel) for source in sources]
+    if not jobs:
+        return 0, 0
+
+    if workers <= 1:
+        return len(jobs), sum(map(_process, jobs))
+    # Chunks of images per task, so the pool is not dominated by the per-task overhead
+    chunksize = max(1, len(jobs) // (workers * 8))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return len(jobs), sum(pool.map(_process, jobs, chunksize=chunksize))
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    images, files = run(input_dir, pattern, output_dir, operations, suffix, workers, compressLevel)
+    print(f"{images} images, {files} files written in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,117 @@
+#
+#   Stand-in for the Unity client (ExportXXXMap.cs)
+#   Sends synthetic terrain maps to ServerSimulator.py, either on the five legacy REQ sockets
+#   or as one multipart message on the unified socket, and reports the round-trip times.
+#   Run it against ServerSimulator.py with the same useUnifiedEndpoint and sleepTime = 0.
+#
+
+import time
+import zmq
+import numpy as np
+from FrameProtocol import LEGACY_CHANNELS, UNIFIED_PORT, recv_frame, send_frame
+from ReplyEncoding import DeltaDecoder
+from PayloadCompression import PayloadCompressor
+
+# Settings
+useUnifiedEndpoint = False  # Must match ServerSimulator.py
+deltaReplies = False  # Unified mode: ask for delta replies, with the float64 maps as float32 (ReplyEncoding.py)
+payloadCompression = ()  # Unified mode: codecs offered to the server, e.g. ("lz4", "zstd", "zlib") (PayloadCompression.py)
+session = None  # Unified mode: session id sent in the header, to run several clients against SessionBroker.py
+host = "localhost"
+gridSize = 257  # Heightmap resolution of the terrain
+numSteps = 500
+warmupSteps = 10  # Not counted in the statistics
+
+
+def synthetic_frame(step, size=257, rng=None):
+    """Maps with the dtypes sent by Unity: a trail is dug along the middle row as the character walks."""
+    if rng is None:
+        rng = np.random.default_rng(step)
+
+    # Character walks back and forth 7m over a 10m terrain
+    distance = np.array([0.05 * step], dtype=np.float32)
+    trail = np.zeros((size, size), dtype=np.float32)
+    trail[size // 2 - size // 40:size // 2 + size // 40 + 1, :] = 1.0
+
+    depth = min(0.0005 * step, 0.05)
+    height = np.float32(1.0) - np.float32(depth) * trail
+    pressure = (trail * 1000000 * rng.random((size, size))).astype(np.float32)
+    vegetation = np.clip(1.0 - 0.01 * step * trail, 0, 1).astype(np.float32)
+    young = np.full((size, size), 750000.0, dtype=np.float64)
+
+    return {
+        "vegetation": vegetation,
+        "distance": distance,
+        "pressure": pressure,
+        "height": height,
+        "young": young,
+    }
+
+
+def connect_legacy_sockets(context):
+    sockets = {}
+    for name, port, _ in LEGACY_CHANNELS:
+        socket = context.socket(zmq.REQ)
+        socket.connect(f"tcp://{host}:{port}")
+        sockets[name] = socket
+    return sockets
+
+
+def step_legacy(sockets, frame):
+    # Each exporter thread in Unity sends its own request, the server replies in its own order
+    for name, socket in sockets.items():
+        socket.send(frame[name], copy=False)
+    return {name: socket.recv() for name, socket in sockets.items()}
+
+
+def step_unified(socket, step, frame, decoder=None, compressor=None, session=None):
+    extra = {"session": session} if session is not None else {}
+    if decoder is None:
+        send_frame(socket, step, frame["height"].shape, frame, extra, compressor)
+        return recv_frame(socket, compressor)
+    extra["reply"] = decoder.request()
+    send_frame(socket, step, frame["height"].shape, frame, extra, compressor)
+    return decoder.decode(socket.recv_multipart(copy=False), compressor)
+
+
+def report(label, times):
+    times = np.asarray(times) * 1000
+    print(f"{label}: {len(times)} steps, "
+          f"mean {times.mean():.2f}ms, p50 {np.percentile(times, 50):.2f}ms, "
+          f"p95 {np.percentile(times, 95):.2f}ms, p99 {np.percentile(times, 99):.2f}ms, "
+          f"{1000 / times.mean():.1f} steps/s")
+
+
+if __name__ == "__main__":
+    context = zmq.Context()
+
+    if useUnifiedEndpoint:
+        socketFrame = context.socket(zmq.REQ)
+        socketFrame.connect(f"tcp://{host}:{UNIFIED_PORT}")
+    else:
+        sockets = connect_legacy_sockets(context)
+
+    # Frames are generated up front so only the communication is timed
+    frames = [synthetic_frame(step, gridSize) for step in range(1, 21)]
+    decoder = DeltaDecoder() if deltaReplies else None
+    compressor = PayloadCompressor(payloadCompression) if payloadCompression else None
+
+    roundTrips = []
+    for step in range(1, numSteps + 1):
+        frame = frames[step % len(frames)]
+
+        start = time.perf_counter()
+        if useUnifiedEndpoint:
+            step_unified(socketFrame, step, frame, decoder, compressor, session)
+        else:
+            step_legacy(sockets, frame)
+        elapsed = time.perf_counter() - start
+
+        if step > warmupSteps:
+            roundTrips.append(elapsed)
+
+    report("unified" if useUnifiedEndpoint else "legacy", roundTrips)
+    if decoder is not None:
+        print(f"Delta replies: {decoder.bytesReceived / decoder.replies / 1024:.1f} KiB per step")
+    if compressor is not None:
+        print(compressor.summary())
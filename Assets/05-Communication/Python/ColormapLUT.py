@@ -0,0 +1,86 @@
+#
+#   Colormap lookup tables: a map is colored by indexing a precomputed uint8 RGB table with its values,
+#   instead of going through matplotlib for every frame. The tables are sampled from the matplotlib
+#   colormaps, with the same quantization as imshow, so the colors match the figures.
+#   256 entries for 8-bit maps, 65536 for 16-bit maps (uint16 images): integer maps spanning the whole
+#   table index it directly, without any float conversion.
+#   MapTiler colors the six maps of the "Simulation Maps" figure and tiles them into one RGB image, for
+#   previews and video frames. The full matplotlib figure (SimulationRenderer.py) is still used for the
+#   figures with titles, curves and annotations.
+#
+
+import numpy as np
+from matplotlib import colormaps
+
+# Six map panels, row by row: (name, colormap) - Same colormaps and order as MAP_PANELS in SimulationRenderer.py
+TILE_PANELS = (
+    ("pressure", "Reds"), ("compression", "Reds"),
+    ("initial_vegetation", "Greens"), ("vegetation", "Greens"),
+    ("initial_young", "Blues"), ("accumulation", "Blues"),
+)
+
+_tables = {}
+
+
+def colormap_lut(name, entries=256):
+    """(entries, 3) uint8 RGB table of a matplotlib colormap. Tables are built once and shared, do not modify."""
+    key = (name, entries)
+    if key not in _tables:
+        _tables[key] = (colormaps[name](np.linspace(0, 1, entries))[:, :3] * 255).astype(np.uint8)
+        _tables[key].flags.writeable = False
+    return _tables[key]
+
+
+def apply_lut(array, lut, low, high, out=None):
+    """Colors a map, values from low to high spread over the table (clipped outside). Returns (H, W, 3) uint8."""
+    array = np.asarray(array)
+    if array.dtype.kind in "ui" and low == 0 and high == len(lut) - 1:
+        # uint8 map on a 256 table, uint16 on a 65536 table: the value is the index (same as imshow)
+        return np.take(lut, array, axis=0, out=out, mode="clip")
+    # Same operations as imshow (normalize, then scale to the table) so the float32 rounding is the same
+    index = (array.astype(np.float32) - low) / np.float32(high - low) * np.float32(len(lut))
+    np.clip(index, 0, len(lut) - 1, out=index)
+    return np.take(lut, index.astype(np.intp), axis=0, out=out)
+
+
+class MapTiler:
+    """
+    Tiles the maps of TILE_PANELS (columns per row) into one preallocated RGB image, separated by gap pixels.
+    Maps are normalized from low to high, 0..255 as the figure; use entries=65536 and high=65535 for uint16 maps.
+    render() returns the same image every call, missing maps keep their previous tile.
+    """
+
+    def __init__(self, shape, panels=TILE_PANELS, columns=2, entries=256, low=0, high=255, gap=2, background=255):
+        self.shape = tuple(shape)
+        self.low = low
+        self.high = high
+        self.luts = {name: colormap_lut(cmap, entries) for name, cmap in panels}
+
+        rows = -(-len(panels) // columns)
+        height, width = self.shape
+        self.image = np.full((rows * height + (rows - 1) * gap, columns * width + (columns - 1) * gap, 3),
+                             background, dtype=np.uint8)
+        self.tiles = {}
+        for i, (name, _) in enumerate(panels):
+            top, left = (i // columns) * (height + gap), (i % columns) * (width + gap)
+            self.tiles[name] = self.image[top:top + height, left:left + width]
+
+        # Float maps are scaled into this buffer, so rendering does not allocate
+        self._index = np.empty(self.shape, dtype=np.float32)
+        self._indexInt = np.empty(self.shape, dtype=np.intp)
+
+    def render(self, maps):
+        """maps: {panel name: 2D array}. Returns the tiled (H, W, 3) uint8 image."""
+        for name, array in maps.items():
+            lut, tile = self.luts[name], self.tiles[name]
+            array = np.asarray(array)
+            if array.dtype.kind in "ui" and self.low == 0 and self.high == len(lut) - 1:
+                np.take(lut, array, axis=0, out=tile, mode="clip")
+                continue
+            np.subtract(array, self.low, out=self._index, casting="unsafe")
+            np.divide(self._index, np.float32(self.high - self.low), out=self._index)
+            np.multiply(self._index, np.float32(len(lut)), out=self._index)
+            np.clip(self._index, 0, len(lut) - 1, out=self._index)
+            np.copyto(self._indexInt, self._index, casting="unsafe")
+            np.take(lut, self._indexInt, axis=0, out=tile)
+        return self.image
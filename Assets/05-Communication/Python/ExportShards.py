@@ -0,0 +1,184 @@
+#
+#   Exports the pix2pix pairs as large sequential shards instead of thousands of small PNG files
+#   Each shard is an uncompressed tar (WebDataset layout): <key>.input.npy and <key>.output.npy per pair,
+#       input  -> (H, W, 3) pressure, initial vegetation, initial Young
+#       output -> (H, W, 3) compression, vegetation, accumulation
+#   index.json lists the shards of each split, the dtype and shape of the samples and the normalization
+#   ranges. Two sources:
+#       "dataset" -> the pairs of a BuildDataset.py manifest (8-bit PNGs, exported as uint8)
+#       "runs"    -> runs recorded with RunRecorder.py, every step, normalized to 0..255 and kept as float32
+#                    (or quantized to uint8 as np.uint8(input_array) does in the servers)
+#   iterate_shards() reads the shards of a split back sequentially.
+#
+
+import io
+import json
+import os
+import tarfile
+import numpy as np
+from PIL import Image
+from BuildDataset import SPLITS, assign_splits
+from FrameStore import normalize
+from RunRecorder import RunReader
+
+# Settings
+source = "runs"  # "dataset" or "runs"
+manifest_path = 'frames/TrainData-13/manifest.json'
+run_folders = ['frames/runs/SimulatorData-3/']
+out_folder = 'frames/TrainData-13/shards'
+dtype = "float32"  # Runs only: "float32" keeps the full precision, "uint8" matches the PNG files
+samplesPerShard = 1000
+stride = 1  # Runs only: export one step every stride (the servers save an image every 20 steps)
+referenceStep = 3  # Runs only: recorded step used as initial maps (idx == 4 in ServerSimulator.py)
+split = {"train": 0.8, "val": 0.1}  # Runs only, the dataset keeps the split of its manifest
+seed = 0
+
+# Normalization ranges, as in ServerSimulator.py
+RANGES = {
+    "pressure": (0, 5000000),
+    "initial_vegetation": (0, 1),
+    "initial_young": (250000, 1250000),
+    "compression": (0, -0.05),
+    "vegetation": (0, 1),
+    "accumulation": (0, 0.05),
+}
+
+INDEX_FILE = "index.json"
+
+
+class ShardWriter:
+    """Appends pairs to tar shards <split>-00000.tar, <split>-00001.tar, ... of samplesPerShard pairs each."""
+
+    def __init__(self, directory, split, samplesPerShard=1000):
+        self.directory = directory
+        self.split = split
+        self.samplesPerShard = samplesPerShard
+        self.shards = []
+        self._tar = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _add(self, name, array):
+        buffer = io.BytesIO()
+        np.save(buffer, array, allow_pickle=False)
+        info = tarfile.TarInfo(name)
+        info.size = buffer.tell()
+        buffer.seek(0)
+        self._tar.addfile(info, buffer)
+
+    def write(self, key, inputArray, outputArray):
+        if self._tar is None or self.shards[-1]["count"] == self.samplesPerShard:
+            self._close_shard()
+            name = f"{self.split}-{len(self.shards):05d}.tar"
+            self._tar = tarfile.open(os.path.join(self.directory, name), "w")
+            self.shards.append({"file": name, "count": 0})
+        self._add(f"{key}.input.npy", inputArray)
+        self._add(f"{key}.output.npy", outputArray)
+        self.shards[-1]["count"] += 1
+
+    def _close_shard(self):
+        if self._tar is not None:
+            self._tar.close()
+            self._tar = None
+
+    def close(self):
+        self._close_shard()
+        return self.shards
+
+
+def write_index(directory, shards, sample, ranges=None):
+    index = {
+        "dtype": np.dtype(sample.dtype).str,
+        "shape": list(sample.shape),
+        "ranges": ranges,
+        "splits": shards,
+    }
+    with open(os.path.join(directory, INDEX_FILE), "w") as file:
+        json.dump(index, file, indent=2)
+
+
+def iterate_shards(directory, split="train"):
+    """Yields (key, input, output) for every pair of a split, reading each shard once from start to end."""
+    with open(os.path.join(directory, INDEX_FILE)) as file:
+        index = json.load(file)
+
+    for shard in index["splits"].get(split, []):
+        pending = {}
+        with tarfile.open(os.path.join(directory, shard["file"]), "r|") as tar:
+            for member in tar:
+                key, kind, _ = member.name.rsplit(".", 2)
+                pending[kind] = np.load(io.BytesIO(tar.extractfile(member).read()), allow_pickle=False)
+                if len(pending) == 2:
+                    yield key, pending["input"], pending["output"]
+                    pending = {}
+
+
+# =============================================================
+
+# Sources
+
+def dataset_pairs(manifest_path):
+    """(split, key, input, output) of a BuildDataset.py manifest, 8-bit as saved by the servers."""
+    with open(manifest_path) as file:
+        manifest = json.load(file)
+    for entry in manifest["entries"]:
+        inputArray = np.asarray(Image.open(entry["input"]).convert("RGB"))
+        outputArray = np.asarray(Image.open(entry["output"]).convert("RGB"))
+        yield entry["split"], f"{entry['index']:08d}", inputArray, outputArray
+
+
+def run_pairs(folders, dtype="float32", stride=1, referenceStep=3, split=None, seed=0):
+    """(split, key, input, output) of every stride-th step of the recorded runs, normalized to 0..255."""
+    readers = [RunReader(folder) for folder in folders]
+    steps = [(r, i) for r, reader in enumerate(readers) for i in range(referenceStep, len(reader), stride)]
+    splits = assign_splits(len(steps), split, seed)
+
+    for (r, i), sampleSplit in zip(steps, splits):
+        reader = readers[r]
+        initial = reader.frame(referenceStep)
+        frame = reader.frame(i)
+        difference = frame["height"] - initial["height"]
+        maps = {
+            "pressure": frame["pressure"],
+            "initial_vegetation": initial["vegetation"],
+            "initial_young": initial["young"],
+            "compression": np.minimum(difference, 0),
+            "vegetation": frame["vegetation"],
+            "accumulation": np.maximum(difference, 0),
+        }
+
+        inputArray = np.empty(reader.shape + (3,), dtype=np.float32)
+        outputArray = np.empty(reader.shape + (3,), dtype=np.float32)
+        for channel, name in enumerate(("pressure", "initial_vegetation", "initial_young")):
+            normalize(maps[name], *RANGES[name], out=inputArray[..., channel])
+        for channel, name in enumerate(("compression", "vegetation", "accumulation")):
+            normalize(maps[name], *RANGES[name], out=outputArray[..., channel])
+
+        if dtype == "uint8":
+            # Same wrap-around as np.uint8(input_array) in the servers
+            inputArray = inputArray.astype(np.uint8)
+            outputArray = outputArray.astype(np.uint8)
+        yield sampleSplit, f"{r:03d}-{int(reader.read('step', i, i + 1)[0]):08d}", inputArray, outputArray
+
+
+if __name__ == "__main__":
+    if source == "dataset":
+        pairs = dataset_pairs(manifest_path)
+        ranges = None
+    else:
+        pairs = run_pairs(run_folders, dtype, stride, referenceStep, split, seed)
+        ranges = RANGES
+
+    writers = {name: ShardWriter(out_folder, name, samplesPerShard) for name in SPLITS}
+    sample = None
+    for count, (sampleSplit, key, inputArray, outputArray) in enumerate(pairs, 1):
+        writers[sampleSplit].write(key, inputArray, outputArray)
+        sample = inputArray
+        if count % 1000 == 0:
+            print(f"{count} pairs exported")
+
+    if sample is None:
+        raise SystemExit("No pair to export")
+    shards = {name: writer.close() for name, writer in writers.items()}
+    write_index(out_folder, shards, sample, ranges)
+    for name in SPLITS:
+        print(f"{name}: {sum(shard['count'] for shard in shards[name])} pairs in {len(shards[name])} shards")
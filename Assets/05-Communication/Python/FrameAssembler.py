@@ -0,0 +1,192 @@
+#
+#   Poller core for the legacy sockets: the maps are received as they arrive instead of in a fixed order
+#   Legacy messages carry no step id, so the n-th message of a socket belongs to frame n. Each channel is
+#   received straight into the ring slot of its frame in the FrameStore and its socket is answered right
+#   away, so a slow exporter (e.g. ExportYoungMap.cs, which sends doubles) only delays its own channel and
+#   the servers no longer depend on the order of their recv calls.
+#   A frame is handed to the server loop once every channel has arrived. A channel can run up to depth - 1
+#   frames ahead of the frame being processed, its socket is not polled further until that frame is done.
+#   A frame still partial staleTimeout seconds after its first channel arrived is dropped: the channels
+#   received are discarded and the missing ones are assigned to the next frame when they arrive.
+#
+
+import collections
+import queue
+import threading
+import time
+import zmq
+from FrameProtocol import grid_shape_from_bytes
+from FrameStore import CHANNEL_DTYPES, FrameStore
+
+
+class FrameAssembler:
+    """
+    sockets: {channel name: REP socket}. reply(store, name, frame, slot) returns the reply of a channel
+    (bytes or array, sent without copy), called as soon as that channel of a frame is received.
+    background=True polls in a thread, so the channels of the next frame are received and answered while
+    the server processes the current one. Otherwise they are only received inside next_frame().
+    """
+
+    def __init__(self, sockets, reply, depth=2, staleTimeout=5.0, background=True):
+        self.sockets = sockets
+        self.reply = reply
+        self.depth = depth
+        self.staleTimeout = staleTimeout
+        self.store = None
+
+        self._names = {socket: name for name, socket in sockets.items()}
+        self._next = {name: 0 for name in sockets}  # Next frame of each channel
+        self._partial = {}  # frame -> [time of the first channel, channels received]
+        self._pending = {}  # Payloads of the first frame, until the height map gives the resolution
+        self._ready = queue.Queue()
+        self._unconsumed = collections.deque()  # Complete frames not taken by the server loop yet
+        self._current = -1  # Last frame handed to the server loop
+        self._holding = False  # True while the server loop processes it, its slot is not written
+        self._changed = threading.Condition()
+        self._storeReady = threading.Event()
+
+        # Counters
+        self.frames = 0
+        self.dropped = 0
+
+        self._closed = False
+        self._thread = None
+        if background:
+            self._thread = threading.Thread(target=self._run, name="FrameAssembler", daemon=True)
+            self._thread.start()
+
+    def wait_store(self):
+        """Blocks until the first height map is received, returns the FrameStore created at its resolution."""
+        if self._thread is not None:
+            self._storeReady.wait()
+            if self.store is None:
+                raise self._ready.get()
+        while self.store is None:
+            self._poll(100)
+        return self.store
+
+    def next_frame(self):
+        """
+        Next complete frame: moves the store to its slot and returns the frame number (with gaps after
+        dropped frames). The frame returned before is released, its slot can be received into again.
+        """
+        with self._changed:
+            self._holding = False
+            self._changed.notify()
+
+        if self._thread is not None:
+            item = self._ready.get()
+        else:
+            while self._ready.empty():
+                self._poll(self._poll_timeout())
+            item = self._ready.get_nowait()
+        if isinstance(item, BaseException):
+            raise item
+
+        with self._changed:
+            self._unconsumed.popleft()
+            self._current = item
+            self._holding = True
+        self.store.slot = item % self.depth
+        return item
+
+    def close(self):
+        self._closed = True
+        if self._thread is not None:
+            with self._changed:
+                self._changed.notify()
+            self._thread.join()
+
+    # =============================================================
+
+    def _run(self):
+        try:
+            while not self._closed:
+                self._poll(self._poll_timeout())
+        except zmq.ContextTerminated:
+            pass
+        except Exception as error:
+            # Raised in the server loop by next_frame() or wait_store()
+            self._ready.put(error)
+            self._storeReady.set()
+
+    def _poll_timeout(self):
+        """Milliseconds until the oldest partial frame is stale, at most 100."""
+        if not self._partial:
+            return 100
+        age = time.perf_counter() - min(start for start, _ in self._partial.values())
+        return max(1, min(100, int((self.staleTimeout - age) * 1000) + 1))
+
+    def _limit(self):
+        """Frames below this one can be received: the slots of older frames are still in use."""
+        with self._changed:
+            if self._holding:
+                oldest = self._current
+            elif self._unconsumed:
+                oldest = self._unconsumed[0]
+            else:
+                oldest = min(self._next.values())
+        return oldest + self.depth
+
+    def _poll(self, timeout):
+        # Channels ahead of the frames the store can hold wait until the server loop moves on
+        limit = self._limit()
+        poller = zmq.Poller()
+        for name, socket in self.sockets.items():
+            if self._next[name] < limit and name not in self._pending:
+                poller.register(socket, zmq.POLLIN)
+
+        if poller.sockets:
+            for socket, _ in poller.poll(timeout):
+                self._receive(self._names[socket])
+        else:
+            with self._changed:
+                if not self._closed:
+                    self._changed.wait(timeout / 1000)
+        self._drop_stale()
+
+    def _receive(self, name):
+        socket = self.sockets[name]
+        frame = self._next[name]
+        if self.store is not None:
+            self.store.recv_into(socket, name, slot=frame % self.depth)
+            self._accept(name, frame)
+            return
+
+        # First frame - The height map gives the resolution of the store
+        self._pending[name] = socket.recv()
+        if name == "height":
+            self.store = FrameStore(grid_shape_from_bytes(len(self._pending["height"]), CHANNEL_DTYPES["height"]),
+                                    self.depth)
+            pending, self._pending = self._pending, {}
+            for pendingName, payload in pending.items():
+                self.store.load(pendingName, payload, slot=0)
+                self._accept(pendingName, 0)
+            self._storeReady.set()
+
+    def _accept(self, name, frame):
+        self.sockets[name].send(self.reply(self.store, name, frame, frame % self.depth), copy=False)
+        self._next[name] = frame + 1
+
+        partial = self._partial.setdefault(frame, [time.perf_counter(), set()])
+        partial[1].add(name)
+        if len(partial[1]) == len(self.sockets):
+            # Channels arrive in order on each socket, so frames complete in order
+            del self._partial[frame]
+            self.frames += 1
+            with self._changed:
+                self._unconsumed.append(frame)
+            self._ready.put(frame)
+
+    def _drop_stale(self):
+        now = time.perf_counter()
+        while self._partial:
+            frame = min(self._partial)
+            start, received = self._partial[frame]
+            if now - start < self.staleTimeout:
+                break
+            del self._partial[frame]
+            self.dropped += 1
+            for name in self.sockets:
+                self._next[name] = max(self._next[name], frame + 1)
+            print(f"Frame {frame} dropped after {self.staleTimeout}s, missing {sorted(set(self.sockets) - received)}")
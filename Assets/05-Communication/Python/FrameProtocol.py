@@ -0,0 +1,127 @@
+#
+#   Frame protocol shared by the Python servers and the stand-in client
+#
+#   Legacy mode: one REP socket per map (5555 vegetation, 6000 distance, 5557 pressure,
+#   5558 height, 5559 Young), one raw frame per socket and per step.
+#
+#   Unified mode: a single REP socket (5560) and one multipart message per step:
+#       frame 0    -> JSON header {"step": 12, "shape": [257, 257],
+#                                  "channels": [{"name": "vegetation", "dtype": "float32"}, ...]}
+#       frame 1..n -> raw little-endian payload of each channel, in header order
+#   The reply uses exactly the same layout. Optional header fields (e.g. "reply", see ReplyEncoding.py, or
+#   "accept" and "codecs", see PayloadCompression.py) are ignored by readers that do not know them.
+#
+#   The grid resolution is not fixed: the unified header carries it, and in legacy mode it is
+#   inferred from the size of the first square map received (257, 513, 1025, 2049, ...).
+#
+
+import json
+import math
+import numpy as np
+import zmq
+from PayloadCompression import decompress
+
+# Channels sent by Unity (ExportXXXMap.cs), in the order ServerSimulator.py receives them
+LEGACY_CHANNELS = [
+    ("vegetation", 5555, np.float32),
+    ("distance", 6000, np.float32),
+    ("pressure", 5557, np.float32),
+    ("height", 5558, np.float32),
+    ("young", 5559, np.float64),
+]
+
+UNIFIED_PORT = 5560
+
+
+def bind_legacy_sockets(context, host="*"):
+    """Bind one REP socket per channel. Returns an ordered dict name -> socket."""
+    sockets = {}
+    for name, port, _ in LEGACY_CHANNELS:
+        socket = context.socket(zmq.REP)
+        socket.bind(f"tcp://{host}:{port}")
+        sockets[name] = socket
+    return sockets
+
+
+def bind_unified_socket(context, host="*", port=UNIFIED_PORT):
+    socket = context.socket(zmq.REP)
+    socket.bind(f"tcp://{host}:{port}")
+    return socket
+
+
+def encode_header(step, shape, arrays, extra=None):
+    header = {
+        "step": int(step),
+        "shape": [int(n) for n in shape],
+        "channels": [{"name": name, "dtype": np.dtype(array.dtype).str} for name, array in arrays.items()],
+    }
+    if extra:
+        header.update(extra)
+    return json.dumps(header).encode("utf-8")
+
+
+def decode_header(frame):
+    header = json.loads(bytes(frame).decode("utf-8"))
+    header["shape"] = tuple(header["shape"])
+    return header
+
+
+def grid_shape_from_bytes(nbytes, dtype=np.float32):
+    """Shape of the square map held in a payload of nbytes."""
+    itemsize = np.dtype(dtype).itemsize
+    count = nbytes // itemsize
+    size = math.isqrt(count)
+    if nbytes % itemsize != 0 or size * size != count:
+        raise ValueError(f"A payload of {nbytes} bytes is not a square map of {np.dtype(dtype)}")
+    return size, size
+
+
+def recv_header(socket):
+    """First frame of a unified message."""
+    return decode_header(socket.recv())
+
+
+def decode_channel(payload, dtype, shape):
+    """View a raw payload as an array; map-sized payloads are reshaped to the grid."""
+    array = np.frombuffer(payload, dtype=dtype)
+    if array.size == shape[0] * shape[1]:
+        array = array.reshape(shape)
+    return array
+
+
+def encode_frame(step, shape, arrays, extra=None, compressor=None):
+    """
+    Frames of one multipart message: header + one payload per channel. extra: more header fields.
+    compressor: PayloadCompressor of the socket, the payloads are compressed once the peer accepts a codec.
+    """
+    payloads = [np.ascontiguousarray(array) for array in arrays.values()]
+    extra = dict(extra or {})
+    if compressor is not None:
+        payloads = compressor.pack(extra, payloads)
+    return [encode_header(step, shape, arrays, extra)] + payloads
+
+
+def send_frame(socket, step, shape, arrays, extra=None, compressor=None):
+    """Send {name: array} as one multipart message, see encode_frame()."""
+    socket.send_multipart(encode_frame(step, shape, arrays, extra, compressor), copy=False)
+
+
+def recv_frame(socket, compressor=None):
+    """Receive one multipart message. Returns (step, shape, {name: array})."""
+    frames = socket.recv_multipart(copy=False)
+    header = decode_header(frames[0].buffer)
+    shape = header["shape"]
+    if len(frames) - 1 != len(header["channels"]):
+        raise ValueError(f"Header announces {len(header['channels'])} channels, got {len(frames) - 1} payloads")
+
+    payloads = [frame.buffer for frame in frames[1:]]
+    if compressor is not None:
+        payloads = compressor.unpack(header, payloads)
+    elif header.get("codecs"):
+        payloads = [payload if codec is None else decompress(codec, payload)
+                    for codec, payload in zip(header["codecs"], payloads)]
+
+    arrays = {}
+    for channel, payload in zip(header["channels"], payloads):
+        arrays[channel["name"]] = decode_channel(payload, np.dtype(channel["dtype"]), shape)
+    return header["step"], shape, arrays
@@ -0,0 +1,334 @@
+#
+#   Preallocated buffers for the maps received from Unity and the maps derived from them
+#   Incoming frames are received straight into ring buffers (recv_into, or one copy from a zero-copy
+#   frame with older pyzmq) and every derived map is computed in place, so once the buffers exist the
+#   server loop does not allocate any array.
+#
+
+import tracemalloc
+import numpy as np
+import zmq
+from FrameProtocol import LEGACY_CHANNELS, recv_header
+from PayloadCompression import decompress
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CHANNEL_DTYPES = {name: np.dtype(dtype) for name, _, dtype in LEGACY_CHANNELS}
+SCALAR_CHANNELS = ("distance",)
+DERIVED_MAPS = ("difference", "compression", "accumulation", "vegetation_normalized")
+REFERENCE_CHANNELS = ("height", "vegetation", "young")
+
+
+def normalize(array, low, high, out):
+    """(array - low) / (high - low) * 255, written into out."""
+    np.subtract(array, low, out=out, casting='unsafe')
+    np.multiply(out, 255 / (high - low), out=out)
+    return out
+
+
+class FrameStore:
+    """
+    Ring buffers (depth slots) per channel and per derived map. A slot is only overwritten depth steps later,
+    so the maps of the previous step can still be referenced, e.g. by a reply still in flight, and the
+    FrameAssembler can receive the next steps while the current one is processed.
+    """
+
+    def __init__(self, shape, depth=2):
+        self.shape = tuple(shape)
+        self.depth = depth
+        self.slot = 0
+        self.header = None  # Header of the last unified frame, with the optional fields of the client
+        self.compressor = None  # PayloadCompressor of the unified socket
+
+        self.rings = {}
+        for name, dtype in CHANNEL_DTYPES.items():
+            channelShape = (1,) if name in SCALAR_CHANNELS else self.shape
+            self.rings[name] = np.zeros((depth,) + channelShape, dtype=dtype)
+
+        # Reference maps, captured once the terrain is settled - TODO: Set initial heightmap, instead of ones
+        self.initial_height = np.ones(self.shape, dtype=np.float32)
+        self.initial_vegetation = np.ones(self.shape, dtype=np.float32)
+        self.initial_young = np.zeros(self.shape, dtype=np.float64)
+
+        # Derived maps
+        self.derived = {name: np.zeros((depth,) + self.shape, dtype=np.float32) for name in DERIVED_MAPS}
+
+    # =============================================================
+
+    # Negotiation - The first frame decides the grid resolution of the store
+
+    @classmethod
+    def from_unified_socket(cls, socket, depth=2, compressor=None):
+        """Returns the store, filled with the first frame, and the step id of that frame."""
+        header = recv_header(socket)
+        store = cls(header["shape"], depth)
+        store.header = header
+        store.compressor = compressor
+        store.recv_channels_into(socket, header)
+        return store, header["step"]
+
+    # =============================================================
+
+    # Current slot of each channel
+    @property
+    def vegetation(self):
+        return self.rings["vegetation"][self.slot]
+
+    @property
+    def distance(self):
+        return self.rings["distance"][self.slot]
+
+    @property
+    def pressure(self):
+        return self.rings["pressure"][self.slot]
+
+    @property
+    def height(self):
+        return self.rings["height"][self.slot]
+
+    @property
+    def young(self):
+        return self.rings["young"][self.slot]
+
+    @property
+    def difference(self):
+        return self.derived["difference"][self.slot]
+
+    @property
+    def compression(self):
+        return self.derived["compression"][self.slot]
+
+    @property
+    def accumulation(self):
+        return self.derived["accumulation"][self.slot]
+
+    @property
+    def vegetation_normalized(self):
+        return self.derived["vegetation_normalized"][self.slot]
+
+    def map(self, name, slot=None):
+        """Channel, derived or initial map by name, in the current slot or in the given one."""
+        slot = self.slot if slot is None else slot
+        if name in self.rings:
+            return self.rings[name][slot]
+        if name in self.derived:
+            return self.derived[name][slot]
+        return getattr(self, name)
+
+    def current(self):
+        """Current slot of every channel, {name: array}."""
+        return {name: ring[self.slot] for name, ring in self.rings.items()}
+
+    def advance(self):
+        """Move to the next slot before receiving a new step."""
+        self.slot = (self.slot + 1) % self.depth
+
+    def recv_into(self, socket, name, flags=0, slot=None):
+        buffer = self.rings[name][self.slot if slot is None else slot]
+        if hasattr(socket, "recv_into"):
+            nbytes = socket.recv_into(buffer, flags=flags)
+            if nbytes != buffer.nbytes:
+                raise ValueError(f"Channel '{name}': expected {buffer.nbytes} bytes, received {nbytes}")
+        else:
+            # pyzmq < 26.4: zero-copy frame, then a single copy into the ring
+            self.load(name, socket.recv(flags=flags, copy=False).buffer, slot)
+        return buffer
+
+    def recv_frame_into(self, socket):
+        """Unified endpoint: header, then each channel received into its ring buffer. Returns the step id."""
+        header = recv_header(socket)
+        self.header = header
+        self.recv_channels_into(socket, header)
+        return header["step"]
+
+    def recv_channels_into(self, socket, header):
+        if header["shape"] != self.shape:
+            raise ValueError(f"Frame shape {header['shape']} does not match the store {self.shape}")
+        if self.compressor is not None:
+            self.compressor.negotiate(header)
+        codecs = header.get("codecs") or [None] * len(header["channels"])
+        for channel, codec in zip(header["channels"], codecs):
+            name = channel["name"]
+            if np.dtype(channel["dtype"]) != CHANNEL_DTYPES[name]:
+                raise ValueError(f"Channel '{name}': expected {CHANNEL_DTYPES[name]}, got {channel['dtype']}")
+            if not socket.getsockopt(zmq.RCVMORE):
+                raise ValueError(f"Channel '{name}' announced in the header but not sent")
+            if codec is None:
+                self.recv_into(socket, name)
+            else:
+                # Compressed payload - decompressed, then copied into the ring
+                payload = socket.recv(copy=False).buffer
+                self.load(name, self.compressor.decompress(codec, payload) if self.compressor else decompress(codec, payload))
+
+    def load_frame(self, header, payloads):
+        """Unified message already received (payloads after the header) copied into the current slot. Returns the step id."""
+        if header["shape"] != self.shape:
+            raise ValueError(f"Frame shape {header['shape']} does not match the store {self.shape}")
+        if len(payloads) != len(header["channels"]):
+            raise ValueError(f"Header announces {len(header['channels'])} channels, got {len(payloads)} payloads")
+        if self.compressor is not None:
+            payloads = self.compressor.unpack(header, payloads)
+        elif header.get("codecs"):
+            payloads = [payload if codec is None else decompress(codec, payload)
+                        for codec, payload in zip(header["codecs"], payloads)]
+        for channel, payload in zip(header["channels"], payloads):
+            name = channel["name"]
+            if np.dtype(channel["dtype"]) != CHANNEL_DTYPES[name]:
+                raise ValueError(f"Channel '{name}': expected {CHANNEL_DTYPES[name]}, got {channel['dtype']}")
+            self.load(name, payload)
+        self.header = header
+        return header["step"]
+
+    def load(self, name, payload, slot=None):
+        """Copy a payload (bytes, buffer or array) into the current slot of a channel, or into the given one."""
+        buffer = self.rings[name][self.slot if slot is None else slot]
+        source = np.frombuffer(payload, dtype=buffer.dtype)
+        if source.size != buffer.size:
+            raise ValueError(f"Channel '{name}': expected {buffer.size} values, received {source.size}")
+        np.copyto(buffer.reshape(-1), source)
+        return buffer
+
+    def set_reference(self, slot=None, names=REFERENCE_CHANNELS):
+        """Height, vegetation and Young maps of the slot (current by default) become the initial maps."""
+        slot = self.slot if slot is None else slot
+        for name in names:
+            if name in REFERENCE_CHANNELS:
+                np.copyto(getattr(self, "initial_" + name), self.rings[name][slot])
+
+    def update_derived(self, slot=None, names=("height", "vegetation"), initialHeight=None):
+        """
+        Derived maps of the slot (current by default), only those depending on the given channels.
+        initialHeight: reference height to use instead of initial_height (ReferenceCapture.initial()).
+        """
+        slot = self.slot if slot is None else slot
+        if "height" in names:
+            # Estimate compression and accumulation maps
+            difference = self.derived["difference"][slot]
+            np.subtract(self.rings["height"][slot], self.initial_height if initialHeight is None else initialHeight,
+                        out=difference)
+            np.minimum(difference, 0, out=self.derived["compression"][slot])
+            np.maximum(difference, 0, out=self.derived["accumulation"][slot])
+
+        if "vegetation" in names:
+            # Vegetation sent back to Unity
+            np.multiply(self.rings["vegetation"][slot], 255, out=self.derived["vegetation_normalized"][slot])
+
+
+class ReferenceCapture:
+    """
+    Reference maps captured map by map in the FrameAssembler thread (legacy mode): the first map of each channel
+    from frame `frame` on is copied into a buffer of its own, written once, so a dropped or partial frame does not
+    leave a channel without reference. The thread computes its replies with initial(); the server loop copies
+    the captured maps into the initial maps of the store with apply(), once next_frame() returned a frame >= frame.
+    Every channel has been captured by then (each has a map in that frame), and the thread never writes or reads
+    the initial maps of the store after capturing its channel, so the two threads do not share any buffer.
+    """
+
+    def __init__(self, frame=3, names=REFERENCE_CHANNELS):
+        self.frame = frame
+        self.names = names
+        self.maps = {}
+
+    def capture(self, store, name, frame, slot):
+        """Assembler thread, when a map arrives."""
+        if name in self.names and name not in self.maps and frame >= self.frame:
+            self.maps[name] = store.rings[name][slot].copy()
+
+    def initial(self, store, name):
+        """Assembler thread: reference of a channel, the initial map of the store until it is captured."""
+        return self.maps.get(name, getattr(store, "initial_" + name))
+
+    def apply(self, store):
+        """Server loop, after next_frame() returned a frame >= frame: the captured maps become the initial maps."""
+        for name in self.names:
+            np.copyto(getattr(store, "initial_" + name), self.maps[name])
+
+
+class SnapshotPool:
+    """
+    Fixed set of snapshot buffers handed to the SnapshotPipeline.
+    Use size >= maxQueue + workers + 1 so a free snapshot is always available with "drop-oldest".
+    """
+
+    MAPS = {
+        "pressure": np.float32,
+        "compression": np.float32,
+        "accumulation": np.float32,
+        "vegetation": np.float32,
+        "initial_vegetation": np.float32,
+        "initial_young": np.float64,
+    }
+
+    def __init__(self, shape, size=10, imageDtype=np.uint8):
+        self._free = []
+        for _ in range(size):
+            snapshot = {name: np.zeros(shape, dtype=dtype) for name, dtype in self.MAPS.items()}
+            # Buffers for the worker (normalized maps and RGB stacks, in the dtype of the image encoding)
+            snapshot["normalized"] = {name: np.zeros(shape, dtype=np.float32) for name in self.MAPS}
+            snapshot["input_rgb"] = np.zeros(tuple(shape) + (3,), dtype=imageDtype)
+            snapshot["output_rgb"] = np.zeros(tuple(shape) + (3,), dtype=imageDtype)
+            self._free.append(snapshot)
+
+    def acquire(self, store):
+        """Copy the current maps of the store into a free snapshot. Returns None if none is free."""
+        if not self._free:
+            return None
+        snapshot = self._free.pop()
+        for name in self.MAPS:
+            np.copyto(snapshot[name], getattr(store, name))
+        return snapshot
+
+    def release(self, snapshot):
+        self._free.append(snapshot)
+
+
+def peak_rss_mb():
+    if resource is not None:
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except (ImportError, AttributeError):
+        return float("nan")
+
+
+class AllocationProbe:
+    """
+    Measures the memory allocated by each step of the server loop (tracemalloc) and the peak RSS.
+    tracemalloc sees every thread, so allocations of the snapshot workers are counted as well.
+    Tracing slows the loop down, only enable it to check the steady state.
+    """
+
+    def __init__(self, reportEvery=100):
+        self.reportEvery = reportEvery
+        self._steps = 0
+        self._peaks = []
+        tracemalloc.start()
+        self._snapshot = tracemalloc.take_snapshot()
+
+    def start(self):
+        tracemalloc.reset_peak()
+        self._current, _ = tracemalloc.get_traced_memory()
+
+    def stop(self):
+        current, peak = tracemalloc.get_traced_memory()
+        self._peaks.append(peak - self._current)
+        self._steps += 1
+        if self._steps % self.reportEvery == 0:
+            self.report()
+
+    def report(self):
+        snapshot = tracemalloc.take_snapshot()
+        stats = snapshot.compare_to(self._snapshot, "lineno")
+        blocks = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+        grown = sum(stat.size_diff for stat in stats)
+        self._snapshot = snapshot
+
+        print(f"Allocations over {len(self._peaks)} steps: "
+              f"{np.mean(self._peaks) / 1024:.1f}KB/step (max {np.max(self._peaks) / 1024:.1f}KB), "
+              f"{blocks} new blocks, {grown / 1024:+.1f}KB retained, peak RSS {peak_rss_mb():.1f}MB")
+        self._peaks.clear()
@@ -0,0 +1,358 @@
+#
+#   Output encodings of the training images (maps normalized to 0..255 by the servers)
+#       "uint8"   -> 8-bit PNG, np.uint8 conversion as before (compression quantized to ~0.2mm steps)
+#       "uint16"  -> 16-bit PNG, value * 257 rounded, so 0..255 maps to the full 0..65535 range
+#       "float16" -> raw .npy, half precision
+#       "float32" -> raw .npy, exact normalized values
+#   8-bit PNGs are written by Pillow. Pillow cannot write 16-bit RGB, so those PNGs are written here
+#   (one IDAT, "Up" filter computed with NumPy). An encoding.json next to the images records the encoding
+#   and the normalization range of each channel, so the physical values can be recovered:
+#       value = low + decoded / 255 * (high - low), with decoded = stored * scale
+#
+
+import functools
+import json
+import multiprocessing
+import os
+import signal
+import struct
+import threading
+import time
+import traceback
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+import numpy as np
+from PIL import Image
+
+ENCODINGS = {
+    # encoding: (dtype, file extension, scale back to 0..255)
+    "uint8": (np.uint8, ".png", 1),
+    "uint16": (np.uint16, ".png", 1 / 257),
+    "float16": (np.float16, ".npy", 1),
+    "float32": (np.float32, ".npy", 1),
+}
+
+ENCODING_FILE = "encoding.json"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def convert(array, encoding, out):
+    """Normalized map (0..255) written into out, an array of the encoding dtype."""
+    if encoding == "uint16":
+        # Clipped first: out of range values would wrap around over the whole 16-bit range
+        scaled = np.multiply(array, 257, dtype=np.float32)
+        np.clip(scaled, 0, 65535, out=scaled)
+        np.rint(scaled, out=scaled)
+        np.copyto(out, scaled, casting='unsafe')
+    else:
+        np.copyto(out, array, casting='unsafe')
+    return out
+
+
+def decode(array, encoding):
+    """Stored image back to float32 normalized values (0..255)."""
+    return np.multiply(array, ENCODINGS[encoding][2], dtype=np.float32)
+
+
+# =============================================================
+
+# 16-bit PNG
+
+def _chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def write_png16(path, array, level=6):
+    """(H, W) or (H, W, 3) uint16 array as a 16-bit grayscale or RGB PNG."""
+    height, width = array.shape[:2]
+    colorType = 2 if array.ndim == 3 else 0
+
+    rows = np.ascontiguousarray(array, dtype=">u2").view(np.uint8).reshape(height, -1)
+    filtered = np.empty((height, rows.shape[1] + 1), dtype=np.uint8)
+    filtered[:, 0] = 2  # "Up": difference with the row above, small for smooth maps
+    filtered[0, 1:] = rows[0]
+    np.subtract(rows[1:], rows[:-1], out=filtered[1:, 1:])
+
+    header = struct.pack(">IIBBBBB", width, height, 16, colorType, 0, 0, 0)
+    with open(path, "wb") as file:
+        file.write(PNG_SIGNATURE + _chunk(b"IHDR", header) + _chunk(b"IDAT", zlib.compress(filtered, level))
+                   + _chunk(b"IEND", b""))
+
+
+def read_png16(path):
+    """16-bit PNG written by write_png16 (filters "None" and "Up" only)."""
+    with open(path, "rb") as file:
+        data = file.read()
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError(f"{path} is not a PNG file")
+
+    position = len(PNG_SIGNATURE)
+    idat = []
+    while position < len(data):
+        length, kind = struct.unpack(">I4s", data[position:position + 8])
+        body = data[position + 8:position + 8 + length]
+        if kind == b"IHDR":
+            width, height, depth, colorType = struct.unpack(">IIBB", body[:10])
+        elif kind == b"IDAT":
+            idat.append(body)
+        position += 12 + length
+
+    channels = 3 if colorType == 2 else 1
+    if depth != 16 or colorType not in (0, 2):
+        raise ValueError(f"{path}: only 16-bit grayscale or RGB PNGs are supported")
+
+    filtered = np.frombuffer(zlib.decompress(b"".join(idat)), dtype=np.uint8).reshape(height, -1)
+    filters = filtered[:, 0]
+    if np.any((filters != 0) & (filters != 2)):
+        raise ValueError(f"{path}: unsupported PNG filter, expected None or Up")
+
+    if np.all(filters == 2):
+        # Every row is "Up": the rows are the running sum (mod 256) of the differences
+        rows = np.cumsum(filtered[:, 1:], axis=0, dtype=np.uint8)
+    else:
+        rows = filtered[:, 1:].copy()
+        for row in range(1, height):
+            if filters[row] == 2:
+                np.add(rows[row], rows[row - 1], out=rows[row])
+    array = rows.view(">u2").astype(np.uint16)
+    return array.reshape((height, width, channels) if channels == 3 else (height, width))
+
+
+def read_image(path):
+    """Image written by ImageEncoder, whatever its encoding."""
+    if path.endswith(".npy"):
+        return np.load(path)
+    # Bit depth in the IHDR chunk - Pillow would read 16-bit RGB PNGs as 8-bit
+    with open(path, "rb") as file:
+        header = file.read(25)
+    if header.startswith(PNG_SIGNATURE) and header[24] == 16:
+        return read_png16(path)
+    with Image.open(path) as image:
+        return np.asarray(image)
+
+
+# =============================================================
+
+def write_image(basePath, array, encoding, level=6):
+    """Writes one image, returns (encode seconds, file size). Also run in the processes of ImageSink."""
+    start = time.perf_counter()
+    path = basePath + ENCODINGS[encoding][1]
+    if encoding == "uint8":
+        Image.fromarray(array).save(path, compress_level=level)
+    elif encoding == "uint16":
+        write_png16(path, array, level)
+    else:
+        np.save(path, array)
+    return time.perf_counter() - start, os.path.getsize(path)
+
+
+def image_kind(basePath):
+    """"frames/.../RGB/20-input-pressure" -> "input-pressure", the format counters are kept per kind."""
+    name = os.path.basename(basePath)
+    return name.split("-", 1)[1] if "-" in name else name
+
+
+class ImageEncoder:
+    """
+    Converts and writes the images of a step in the selected encoding.
+    workers > 0 writes the images of a call in parallel threads (zlib and Pillow release the GIL).
+    Encode time and size are accumulated per kind of image, see summary().
+    """
+
+    def __init__(self, encoding="uint8", workers=0, level=6):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown image encoding '{encoding}', expected one of {tuple(ENCODINGS)}")
+        self.encoding = encoding
+        self.dtype, self.extension, self.scale = ENCODINGS[encoding]
+        self.level = level
+        self.ranges = None
+        self._threads = ThreadPoolExecutor(max_workers=workers) if workers > 0 else None
+
+        # Counters - kind -> [images, encode seconds, bytes]
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.images = 0
+        self.failed = 0
+
+    def empty(self, shape):
+        return np.zeros(shape, dtype=self.dtype)
+
+    def convert(self, channels, out):
+        """Stack normalized maps (0..255) into out (H, W, len(channels))."""
+        for channel, array in enumerate(channels):
+            convert(array, self.encoding, out[..., channel])
+        return out
+
+    def record(self, kind, seconds, size):
+        """Adds an image to the counters, e.g. the figure saved by SimulationRenderer."""
+        with self._lock:
+            counter = self.counters.setdefault(kind, [0, 0.0, 0])
+            counter[0] += 1
+            counter[1] += seconds
+            counter[2] += size
+            self.images += 1
+
+    def write(self, images, encoding=None, kind=None, done=None):
+        """
+        images: [(path without extension, array)]. Returns once every image is written.
+        encoding and kind override the encoder encoding and the kind counted, e.g. "uint8" and "figure".
+        done(paths, seconds) is called once every image is written, with the paths of the files (extension
+        included) and the summed encode time - Not called if one of them failed.
+        """
+        encoding = encoding or self.encoding
+        write = lambda image: write_image(image[0], image[1], encoding, self.level)
+        if self._threads is None:
+            results = [write(image) for image in images]
+        else:
+            results = list(self._threads.map(write, images))
+        for (basePath, _), (seconds, size) in zip(images, results):
+            self.record(kind or image_kind(basePath), seconds, size)
+        if done is not None:
+            done([basePath + ENCODINGS[encoding][1] for basePath, _ in images], sum(seconds for seconds, _ in results))
+
+    def flush(self):
+        """Waits for the images still being written (nothing to wait for here)."""
+
+    def close(self):
+        self.flush()
+        if self._threads is not None:
+            self._threads.shutdown()
+
+    def write_ranges(self, directory, ranges):
+        """ranges: {image suffix: [(channel name, low, high)]}, e.g. {"input": [("pressure", 0, 5000000), ...]}"""
+        os.makedirs(directory, exist_ok=True)
+        self.ranges = {
+            "encoding": self.encoding,
+            "dtype": np.dtype(self.dtype).str,
+            "scale": self.scale,
+            "ranges": {suffix: [{"name": name, "low": low, "high": high} for name, low, high in channels]
+                       for suffix, channels in ranges.items()},
+        }
+        with open(os.path.join(directory, ENCODING_FILE), "w") as file:
+            json.dump(self.ranges, file, indent=2)
+
+    def summary(self):
+        with self._lock:
+            if self.images == 0:
+                return f"{self.encoding}: no image written"
+            lines = [f"{self.encoding}: {self.images} images, {self.failed} failed (encode time per image, summed over workers)"]
+            for kind, (images, seconds, size) in sorted(self.counters.items()):
+                lines.append(f"    {kind}: {images} images, {seconds / images * 1000:.1f}ms, {size / images / 1024:.0f}KB")
+        return "\n".join(lines)
+
+
+class _Batch:
+    """Images of one ImageSink.write call - done(paths, seconds) once all of them are written."""
+
+    def __init__(self, paths, done):
+        self.paths = paths
+        self.done = done
+        self.remaining = len(paths)
+        self.seconds = 0.0
+        self.failed = False
+        self._lock = threading.Lock()
+
+    def finish(self, seconds=None):
+        """One image written in seconds, None if it failed."""
+        with self._lock:
+            if seconds is None:
+                self.failed = True
+            else:
+                self.seconds += seconds
+            self.remaining -= 1
+            last = self.remaining == 0 and not self.failed
+        if last:
+            self.done(self.paths, self.seconds)
+
+
+def ignore_interrupt():
+    # Ctrl+C stops the server, which then flushes the sink - the pool processes must keep writing
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class ImageSink(ImageEncoder):
+    """
+    ImageEncoder that encodes in a pool of processes. write() only copies the arrays and returns, so the
+    buffers can be reused right away; it waits only when maxInFlight images are already queued.
+    The processes are forked: the server scripts have no __main__ guard, and spawned processes would run
+    them again. Where fork is not available (Windows), the images are written by threads instead.
+    Create it before the zmq context and before any thread: a process forked while another thread holds a lock
+    (zmq I/O threads, the FrameAssembler poller) can deadlock on it. The processes never use zmq.
+    """
+
+    def __init__(self, encoding="uint8", processes=4, level=6, maxInFlight=32):
+        self.forked = "fork" in multiprocessing.get_all_start_methods()
+        super().__init__(encoding, workers=0 if self.forked else processes, level=level)
+        self._slots = threading.BoundedSemaphore(maxInFlight)
+        self._pending = set()
+        self.maxInFlight = maxInFlight
+        self.peakInFlight = 0
+
+        self._processes = None
+        if self.forked:
+            self._processes = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("fork"),
+                                                  initializer=ignore_interrupt)
+            # Fork every process now, while the caller has no other thread (see above)
+            for future in [self._processes.submit(os.getpid) for _ in range(processes)]:
+                future.result()
+        else:
+            print("ImageSink: fork is not available, images are encoded by threads")
+
+    def write(self, images, encoding=None, kind=None, done=None):
+        if self._processes is None:
+            return super().write(images, encoding, kind, done)
+
+        batch = None
+        if done is not None:
+            batch = _Batch([basePath + ENCODINGS[encoding or self.encoding][1] for basePath, _ in images], done)
+        for basePath, array in images:
+            self._slots.acquire()
+            try:
+                # Copied now: the pool pickles the arguments later, from its own thread
+                future = self._processes.submit(write_image, basePath, np.array(array), encoding or self.encoding,
+                                                self.level)
+            except RuntimeError:
+                # The pool is shut down before the atexit handlers flush the snapshot pipeline
+                self._slots.release()
+                super().write([(basePath, array)], encoding, kind,
+                              None if batch is None else lambda paths, seconds: batch.finish(seconds))
+                continue
+            with self._lock:
+                self._pending.add(future)
+                self.peakInFlight = max(self.peakInFlight, len(self._pending))
+            future.add_done_callback(functools.partial(self._done, kind or image_kind(basePath), batch))
+
+    def _done(self, kind, batch, future):
+        with self._lock:
+            self._pending.discard(future)
+        self._slots.release()
+        try:
+            seconds, size = future.result()
+        except Exception:
+            # A failing write must not stop the sink
+            traceback.print_exc()
+            with self._lock:
+                self.failed += 1
+            if batch is not None:
+                batch.finish(None)
+            return
+        self.record(kind, seconds, size)
+        if batch is not None:
+            batch.finish(seconds)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        with self._lock:
+            pending = list(self._pending)
+        wait(pending)
+
+    def close(self):
+        super().close()
+        if self._processes is not None:
+            self._processes.shutdown()
+
+    def summary(self):
+        return super().summary() + f"\n    peak {self.peakInFlight} of {self.maxInFlight} images in flight"
@@ -1,41 +1,28 @@
-import csv
 import numpy as np
-from PIL import Image
 import os
-
-def load_csv_to_2d_array(file_path):
-    with open(file_path, 'r') as file:
-        reader = csv.reader(file)
-        data = [row for row in reader]
-    return data
-
+from CSVMaps import load_csv_stack
+from ImageEncoding import ENCODINGS, convert, write_image
 
 dir1 = 'frames/SimulatorData-3/TestOnly-1/Pressure/pressure.csv'
 dir2 = 'frames/SimulatorData-3/TestOnly-1/InitialConditions/initialVegetation.csv'
 dir3 = 'frames/SimulatorData-3/TestOnly-1/InitialConditions/initialYoungNormalized.csv'
 
-np_array_pressure_normalized = load_csv_to_2d_array(dir1)
-np_array_initial_vegetation = load_csv_to_2d_array(dir2)
-np_array_initial_young_normalized = load_csv_to_2d_array(dir3)
-
-np_array_pressure_normalized_1 = [[float(cell) for cell in row] for row in np_array_pressure_normalized]
-np_array_initial_vegetation_1 = [[float(cell) for cell in row] for row in np_array_initial_vegetation]
-np_array_initial_young_normalized_1 = [[float(cell) for cell in row] for row in np_array_initial_young_normalized]
-
+# Encoding of the input image - "uint8" (8-bit PNG, as before), "uint16", "float16" or "float32" (see ImageEncoding.py)
+imageEncoding = "uint8"
 
-# Stack the arrays into a single array
-input_array = np.dstack((np_array_pressure_normalized_1,
-                         np_array_initial_vegetation_1,
-                         np_array_initial_young_normalized_1))
+# Parsed once, then loaded from the .npy sidecars while the CSVs are unchanged (CSVMaps.py)
+# Stack the arrays into a single array - Maps normalized to 0..1
+input_array = load_csv_stack((dir1, dir2, dir3))
 
 print(input_array.dtype)
 
-# Convert the numpy array to a PIL Image object
-input_image = Image.fromarray(np.uint8(input_array * 255))
+# Normalized to 0..255, then converted to the dtype of the encoding (np.uint8 truncation for 8-bit)
+input_array *= 255
+input_image = convert(input_array, imageEncoding, out=np.empty(input_array.shape, dtype=ENCODINGS[imageEncoding][0]))
 
 # Save the images
 newpath = r'frames/SimulatorData-3/TestOnly-1/RGB/'  # TODO --- CHANGE! ---
 if not os.path.exists(newpath):
     os.makedirs(newpath)
 
-input_image.save(newpath + '/1-input.png')
\ No newline at end of file
+write_image(newpath + '/1-input', input_image, imageEncoding)
@@ -0,0 +1,136 @@
+#
+#   Optional compression of the payloads of the unified messages (see FrameProtocol.py)
+#   Away from the trail the maps are constant or zero, so they compress well, which matters when Unity and
+#   the server run on different hosts. Nothing is compressed unless both sides agree on a codec:
+#       "accept": ["lz4", "zstd", "zlib"]   -> codecs the sender decodes, in order of preference
+#       "codecs": ["lz4", null, ...]        -> codec of each payload frame after the header, null when raw
+#   Each side announces "accept" in every message and compresses with the first codec of the last "accept"
+#   received that it also supports, so the first request is always raw. A reader without compression
+#   ignores "accept" and never gets compressed payloads.
+#   lz4 (lz4.frame) and zstd (zstandard) are optional packages, zlib is always available.
+#   Fast path: small payloads are sent raw, and so are payloads whose sample compresses below minRatio.
+#
+
+import time
+import zlib
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# name -> (compress(data), decompress(data)), in order of preference
+CODECS = {}
+if lz4 is not None:
+    CODECS["lz4"] = (lz4.frame.compress, lz4.frame.decompress)
+if zstandard is not None:
+    CODECS["zstd"] = (zstandard.ZstdCompressor(level=1).compress, lambda data: zstandard.ZstdDecompressor().decompress(data))
+CODECS["zlib"] = (lambda data: zlib.compress(data, 1), zlib.decompress)
+
+
+def decompress(codec, data):
+    if codec not in CODECS:
+        raise ValueError(f"Payload compressed with {codec}, which is not installed")
+    return CODECS[codec][1](data)
+
+
+class PayloadCompressor:
+    """
+    One per socket. pack() compresses the payloads of a message about to be sent, unpack() decompresses the
+    payloads received, both update the header fields above and the counters.
+    codecs: codecs offered to the peer, () disables compression.
+    """
+
+    def __init__(self, codecs=("lz4", "zstd", "zlib"), minRatio=1.5, minBytes=4096, sampleBytes=16384):
+        self.accept = [codec for codec in codecs if codec in CODECS]
+        self.minRatio = minRatio
+        self.minBytes = minBytes
+        self.sampleBytes = sampleBytes
+        self.codec = None  # Codec agreed with the peer, None until it announced one we support
+
+        # Counters
+        self.payloads = 0
+        self.compressed = 0
+        self.skipped = 0
+        self.bytesIn = 0
+        self.bytesOut = 0
+        self.compressNs = 0
+        self.decompressNs = 0
+
+    def pack(self, header, payloads):
+        """Adds "accept" (and "codecs") to the header dict, returns the payloads to send."""
+        if self.accept:
+            header["accept"] = self.accept
+        if self.codec is None:
+            return payloads
+
+        start = time.perf_counter_ns()
+        codecs, packed = [], []
+        for payload in payloads:
+            data = memoryview(payload).cast("B")
+            compressed = self._compress(data)
+            self.payloads += 1
+            self.bytesIn += data.nbytes
+            if compressed is None:
+                self.skipped += 1
+                codecs.append(None)
+                packed.append(payload)
+            else:
+                self.compressed += 1
+                codecs.append(self.codec)
+                packed.append(compressed)
+            self.bytesOut += len(packed[-1]) if compressed is not None else data.nbytes
+        self.compressNs += time.perf_counter_ns() - start
+
+        header["codecs"] = codecs
+        return packed
+
+    def unpack(self, header, payloads):
+        """Agrees on a codec from the "accept" of the peer, returns the payloads decompressed."""
+        self.negotiate(header)
+        codecs = header.get("codecs")
+        if not codecs:
+            return payloads
+        return [payload if codec is None else self.decompress(codec, payload) for codec, payload in zip(codecs, payloads)]
+
+    def decompress(self, codec, payload):
+        start = time.perf_counter_ns()
+        payload = decompress(codec, payload)
+        self.decompressNs += time.perf_counter_ns() - start
+        return payload
+
+    def negotiate(self, header):
+        accepted = header.get("accept", ())
+        self.codec = next((codec for codec in accepted if codec in self.accept), None)
+
+    def summary(self):
+        ms = 1e-6
+        saved = self.bytesIn - self.bytesOut
+        return (f"Compression ({self.codec or 'none'}): {self.compressed} payloads compressed, {self.skipped} sent raw, "
+                f"{saved / 1024 / 1024:.1f} MiB saved ({self.bytesIn / max(self.bytesOut, 1):.1f}x), "
+                f"{self.compressNs * ms:.0f}ms compressing, {self.decompressNs * ms:.0f}ms decompressing")
+
+    # =============================================================
+
+    def _compress(self, data):
+        """Compressed payload, or None when it is not worth it."""
+        if data.nbytes < self.minBytes:
+            return None
+        compress = CODECS[self.codec][0]
+
+        # Estimated ratio, from 4 chunks spread over the payload (the trail is rarely at its start)
+        if data.nbytes > 2 * self.sampleBytes:
+            chunk = self.sampleBytes // 4
+            stride = (data.nbytes - chunk) // 3
+            sample = b"".join(data[i * stride:i * stride + chunk] for i in range(4))
+            if len(sample) / max(len(compress(sample)), 1) < self.minRatio:
+                return None
+
+        compressed = compress(data)
+        if data.nbytes / max(len(compressed), 1) < self.minRatio:
+            return None
+        return compressed
@@ -0,0 +1,69 @@
+#
+#   Radial profiles of a map around its center, for every angle of a sweep
+#   The sampling coordinates of all the angles are computed once, so each step is a single map_coordinates
+#   call on the stacked coordinates (2, angles * radius), reshaped into a (angles, radius) profile array.
+#   Coordinates follow the path profile of ServerData3D.py: row = center + t cos(angle),
+#   column = center + t sin(angle), with radius samples of t from 0 to radius.
+#   Linear interpolation by default: a cubic spline (order=3, the map_coordinates default) prefilters
+#   the whole map on every call, which costs more than sampling every angle.
+#
+
+import numpy as np
+from scipy.ndimage import map_coordinates
+
+
+class RadialProfiles:
+    """
+    angles: sweep in degrees, e.g. np.arange(0, 360, 1). radius and center default to the largest circle
+    in the map and its center (n // 2, as ServerData3D.py).
+    """
+
+    def __init__(self, shape, angles=np.arange(0, 360, 1), radius=None, center=None, order=1):
+        self.shape = tuple(shape)
+        self.angles = np.asarray(angles, dtype=float)
+        self.radius = radius if radius is not None else min(self.shape) // 2
+        self.center = center if center is not None else (self.shape[0] // 2, self.shape[1] // 2)
+        self.order = order
+
+        # Distance from the center of each sample, and the spacing between two samples (in cells)
+        self.t = np.linspace(0, self.radius, self.radius)
+        self.spacing = self.t[1] - self.t[0] if self.radius > 1 else 1.0
+
+        radians = np.deg2rad(self.angles)[:, None]
+        rows = self.center[0] + self.t * np.cos(radians)
+        columns = self.center[1] + self.t * np.sin(radians)
+        self.coordinates = np.stack([rows.reshape(-1), columns.reshape(-1)])
+        self._profiles = np.empty((len(self.angles), self.radius))
+
+    def sample(self, array, out=None):
+        """(angles, radius) profiles of the map. Without out, the array returned is rewritten by the next call."""
+        out = self._profiles if out is None else out
+        map_coordinates(array, self.coordinates, output=out.reshape(-1), order=self.order, mode="nearest")
+        return out
+
+    def index(self, angle):
+        """Row of the profiles closest to an angle in degrees."""
+        difference = (self.angles - angle + 180) % 360 - 180
+        return int(np.argmin(np.abs(difference)))
+
+    def line_widths(self, profiles, threshold=1e-4):
+        """
+        Width (cells) of the trail along each line through the center: the rays at angle and angle + 180 joined
+        into one line, and the run of samples where |value| > threshold closest to the center, wherever it is on
+        the line. Other compressed runs of the line (another trail, footprints) are not counted. NaN for the lines
+        that do not cross the trail: nothing compressed, or a run reaching the edge of the circle (cut off).
+        Needs a sweep of evenly spaced angles over 360 degrees. Returns (angles of the lines, widths).
+        """
+        half = len(self.angles) // 2
+        # From the edge at angle + 180 to the edge at angle, the center sample once
+        lines = np.concatenate([profiles[half:2 * half, ::-1], profiles[:half, 1:]], axis=1)
+        compressed = np.abs(lines) > threshold
+        samples = np.arange(lines.shape[1])
+        crossing = np.argmin(np.where(compressed, np.abs(samples - (self.radius - 1)), lines.shape[1]), axis=1)[:, None]
+
+        # Last uncompressed sample before the crossing and first one after it
+        start = np.where(~compressed & (samples < crossing), samples, -1).max(axis=1)
+        end = np.where(~compressed & (samples > crossing), samples, lines.shape[1]).min(axis=1)
+
+        crossed = compressed[np.arange(half), crossing[:, 0]] & (start >= 0) & (end < lines.shape[1])
+        return self.angles[:half], np.where(crossed, (end - start - 1) * self.spacing, np.nan)
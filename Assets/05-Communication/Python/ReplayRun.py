@@ -0,0 +1,133 @@
+#
+#   Replay a logged session into the servers, in place of Unity
+#   The source is either a run recorded with RunRecorder.py (raw maps, exact replay) or an existing
+#   RGB folder of *-input / *-output image pairs, converted back to maps with the normalization ranges
+#   below (precision of the image encoding; the distance travelled is not stored in the images and is
+#   replayed as 0).
+#   The frames go through the same sockets as Unity's, so ServerSimulator.py, ServerDataCollection.py or
+#   ServerData3D.py run their unchanged processing code - Start them with sleepTime = 0.
+#
+
+import glob
+import json
+import os
+import re
+import time
+import zmq
+import numpy as np
+from ClientSimulator import connect_legacy_sockets, step_legacy, step_unified
+from FrameProtocol import UNIFIED_PORT
+from ImageEncoding import ENCODING_FILE, ENCODINGS, decode, read_image
+from RunRecorder import INDEX_FILE, RunReader
+
+# Settings
+source = 'frames/runs/SimulatorData-3/'  # Run directory or RGB folder - TODO --- CHANGE! ---
+useUnifiedEndpoint = False  # Must match the server
+host = "localhost"
+rate = 0  # Steps per second, 0 replays as fast as the server answers
+startStep = 0  # Range of recorded steps to replay (index in the run, not step id)
+stopStep = None
+reportEvery = 100
+
+# Normalization ranges of the images (as in ServerSimulator.py), only used for RGB folders
+maxPressure = 5000000
+minPressure = 0
+maxYoung = 1250000
+minYoung = 250000
+maxCompression = 0
+minCompression = -0.05
+maxAccumulation = 0.05
+minAccumulation = 0.0
+
+
+def run_frames(directory, start=0, stop=None):
+    """(step id, frame) of a recorded run. Maps are memory-mapped, only the replayed steps are read."""
+    reader = RunReader(directory)
+    print(f"Run {directory}: {len(reader)} steps of {reader.shape[0]}x{reader.shape[1]}")
+    return reader.frames(start, stop)
+
+
+def image_frames(directory, start=0, stop=None):
+    """(step id, frame) rebuilt from the *-input / *-output image pairs of an RGB folder, in any ImageEncoding."""
+    encoding, extension = "uint8", ".png"
+    if os.path.exists(os.path.join(directory, ENCODING_FILE)):
+        with open(os.path.join(directory, ENCODING_FILE)) as file:
+            encoding = json.load(file)["encoding"]
+        extension = ENCODINGS[encoding][1]
+
+    steps = sorted(int(re.match(r"(\d+)-input\.", os.path.basename(path)).group(1))
+                   for path in glob.glob(os.path.join(directory, "*-input" + extension)))
+    print(f"Images {directory}: {len(steps)} steps ({encoding})")
+
+    for step in steps[start:stop]:
+        outputPath = os.path.join(directory, f"{step}-output{extension}")
+        if not os.path.exists(outputPath):
+            print(f"Step {step}: no output image, skipped")
+            continue
+        inputImage = decode(read_image(os.path.join(directory, f"{step}-input{extension}")), encoding)[..., :3] / 255
+        outputImage = decode(read_image(outputPath), encoding)[..., :3] / 255
+
+        # Input: pressure, initial vegetation, initial Young - Output: compression, vegetation, accumulation
+        compression = maxCompression + outputImage[..., 0] * (minCompression - maxCompression)
+        accumulation = minAccumulation + outputImage[..., 2] * (maxAccumulation - minAccumulation)
+        yield step, {
+            "vegetation": np.ascontiguousarray(outputImage[..., 1]),
+            "distance": np.zeros(1, dtype=np.float32),
+            "pressure": minPressure + inputImage[..., 0] * (maxPressure - minPressure),
+            "height": 1 + compression + accumulation,  # Initial height is ones in the servers
+            "young": (minYoung + inputImage[..., 2].astype(np.float64) * (maxYoung - minYoung)),
+        }
+
+
+def source_frames(path, start=0, stop=None):
+    if os.path.exists(os.path.join(path, INDEX_FILE)):
+        return run_frames(path, start, stop)
+    return image_frames(path, start, stop)
+
+
+class Throughput:
+    """Steps per second over the last reportEvery steps and over the whole replay."""
+
+    def __init__(self, reportEvery=100):
+        self.reportEvery = reportEvery
+        self.steps = 0
+        self.start = self._last = time.perf_counter()
+
+    def tick(self):
+        self.steps += 1
+        if self.steps % self.reportEvery == 0:
+            now = time.perf_counter()
+            print(f"{self.steps} steps, {self.reportEvery / (now - self._last):.1f} fps")
+            self._last = now
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.start
+        return f"{self.steps} steps in {elapsed:.1f}s, {self.steps / max(elapsed, 1e-9):.1f} fps"
+
+
+if __name__ == "__main__":
+    context = zmq.Context()
+
+    if useUnifiedEndpoint:
+        socketFrame = context.socket(zmq.REQ)
+        socketFrame.connect(f"tcp://{host}:{UNIFIED_PORT}")
+    else:
+        sockets = connect_legacy_sockets(context)
+
+    throughput = Throughput(reportEvery)
+    deadline = time.perf_counter()
+    for step, frame in source_frames(source, startStep, stopStep):
+        # Fixed rate: steps are scheduled on a clock, a slow step is caught up on the next ones
+        if rate > 0:
+            deadline += 1 / rate
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        if useUnifiedEndpoint:
+            step_unified(socketFrame, step, frame)
+        else:
+            step_legacy(sockets, {name: np.ascontiguousarray(array) for name, array in frame.items()})
+        throughput.tick()
+
+    print(f"Replay: {throughput.summary()}")
@@ -0,0 +1,242 @@
+#
+#   Delta encoding of the replies of the unified endpoint (5560)
+#   Between two steps a trail only changes a small footprint of the maps, and the initial Young map does not
+#   change at all after the reference step, so the reply only carries what changed since the previous one.
+#
+#   The client asks for it with an optional field of its request header (see FrameProtocol.py):
+#       "reply": {"encoding": "delta", "float32": true, "base": 41}
+#   base is the step of the last reply it decoded (-1 for none). The server only encodes against that reply,
+#   otherwise (first reply, lost reply, server restarted) it sends a keyframe, so the client never drifts.
+#   float32 downcasts the float64 channels (Young map) before encoding.
+#
+#   Reply layout - the header gets three more fields and each channel a mode:
+#       frame 0 -> {"step": 42, "shape": [257, 257], "encoding": "delta", "base": 41, "tile": 16,
+#                   "channels": [{"name": "height", "dtype": "<f4", "mode": "tiles", "count": 12}, ...]}
+#       then, per channel in header order:
+#           "full"   -> 1 frame: the whole map (keyframe, or when smaller than a delta)
+#           "same"   -> no frame: unchanged since the base reply
+#           "sparse" -> 2 frames: count uint32 flat indices (row * width + column), count values
+#           "tiles"  -> 2 frames: count uint32 tile indices (tileRow * tilesX + tileColumn),
+#                       count * tile * tile values, each tile row-major. tilesX = ceil(width / tile);
+#                       tiles on the right and bottom borders are padded, values past the map are ignored.
+#   base is -1 in a keyframe, where every channel is "full". Channels that are not maps (distance, 1 value)
+#   are "full" or "same".
+#   The payloads can be compressed on top of this, see PayloadCompression.py. All values are little-endian. Decoding: copy "full" maps, scatter "sparse" values at their indices,
+#   copy each tile to its block, keep the previous values of "same" channels. See DeltaDecoder below.
+#
+
+import json
+import numpy as np
+from FrameProtocol import decode_channel, decode_header
+from PayloadCompression import decompress
+
+TILE = 16
+# Unsigned views used to compare maps bitwise (NaN != NaN, so float comparisons would resend them)
+BITWISE = {1: np.uint8, 2: np.uint16, 4: np.uint32, 8: np.uint64}
+
+
+def padded_shape(shape, tile):
+    return -(-shape[0] // tile) * tile, -(-shape[1] // tile) * tile
+
+
+class DeltaEncoder:
+    """
+    Keeps the maps of the last reply, as the client holds them, and encodes each new reply against them.
+    The buffers sent are owned by the encoder and rewritten on the next encode, once the REP socket has
+    received the next request.
+    """
+
+    def __init__(self, tile=TILE):
+        self.tile = tile
+        self.step = -1  # Step of the last reply encoded
+        self._previous = {}  # name -> padded map held by the client
+        self._current = {}  # name -> padded map being encoded, swapped with _previous afterwards
+        self._changed = {}  # name -> padded bool map
+
+        # Counters
+        self.replies = 0
+        self.keyframes = 0
+        self.bytesSent = 0
+        self.bytesRaw = 0
+
+    def encode(self, step, shape, arrays, base=-1, float32=False, compressor=None):
+        """Returns the frames of the reply: header, then the payloads of each channel."""
+        keyframe = base < 0 or base != self.step
+        channels, payloads = [], []
+        for name, array in arrays.items():
+            array = np.asarray(array)
+            self.bytesRaw += array.nbytes
+            if float32 and array.dtype == np.float64:
+                array = array.astype(np.float32)
+            mode, parts = self._encode_channel(name, array, shape, keyframe)
+            count = len(parts[0]) if mode in ("sparse", "tiles") else 0
+            channels.append({"name": name, "dtype": array.dtype.str, "mode": mode, "count": count})
+            payloads += parts
+
+        header = {
+            "step": int(step),
+            "shape": [int(n) for n in shape],
+            "encoding": "delta",
+            "base": -1 if keyframe else int(base),
+            "tile": self.tile,
+            "channels": channels,
+        }
+        if compressor is not None:
+            payloads = compressor.pack(header, payloads)
+        frames = [json.dumps(header).encode("utf-8")] + payloads
+        self.step = int(step)
+        self.replies += 1
+        self.keyframes += keyframe
+        self.bytesSent += sum(len(frame) if isinstance(frame, bytes) else frame.nbytes for frame in frames)
+        return frames
+
+    def send(self, socket, step, shape, arrays, request, compressor=None):
+        """Reply to a request header field "reply" (see above)."""
+        frames = self.encode(step, shape, arrays, request.get("base", -1), request.get("float32", False), compressor)
+        socket.send_multipart(frames, copy=False)
+
+    def summary(self):
+        if not self.replies:
+            return "Delta replies: none"
+        return (f"Delta replies: {self.replies} ({self.keyframes} keyframes), "
+                f"{self.bytesSent / self.replies / 1024:.1f} KiB per reply instead of "
+                f"{self.bytesRaw / self.replies / 1024:.1f} KiB ({self.bytesRaw / max(self.bytesSent, 1):.1f}x)")
+
+    # =============================================================
+
+    def _encode_channel(self, name, array, shape, keyframe):
+        if array.ndim != 2:
+            # Not a map - full or unchanged
+            previous = self._previous.get(name)
+            same = (not keyframe and previous is not None and previous.dtype == array.dtype
+                    and np.array_equal(previous.view(BITWISE[array.itemsize]), array.view(BITWISE[array.itemsize])))
+            self._previous[name] = array.copy()
+            return ("same", []) if same else ("full", [np.ascontiguousarray(array)])
+
+        current, previous, changed = self._buffers(name, array)
+        np.copyto(current[:shape[0], :shape[1]], array)
+        self._current[name], self._previous[name] = previous, current
+        if keyframe or previous is None:
+            return "full", [current[:shape[0], :shape[1]].copy()]
+
+        bits = BITWISE[array.itemsize]
+        np.not_equal(current.view(bits), previous.view(bits), out=changed)
+        count = np.count_nonzero(changed)
+        if count == 0:
+            return "same", []
+
+        # Smallest of the three encodings
+        tile = self.tile
+        tilesY, tilesX = current.shape[0] // tile, current.shape[1] // tile
+        tiles = changed.reshape(tilesY, tile, tilesX, tile).any(axis=(1, 3))
+        tileCount = np.count_nonzero(tiles)
+        sizes = {
+            "full": array.nbytes,
+            "sparse": count * (4 + array.itemsize),
+            "tiles": tileCount * (4 + tile * tile * array.itemsize),
+        }
+        mode = min(sizes, key=sizes.get)
+
+        if mode == "full":
+            return mode, [current[:shape[0], :shape[1]].copy()]
+        if mode == "sparse":
+            indices = np.flatnonzero(changed[:shape[0], :shape[1]])
+            return mode, [indices.astype("<u4"), array.reshape(-1)[indices]]
+        indices = np.flatnonzero(tiles)
+        blocks = current.reshape(tilesY, tile, tilesX, tile).swapaxes(1, 2)
+        return mode, [indices.astype("<u4"), blocks[indices // tilesX, indices % tilesX]]
+
+    def _buffers(self, name, array):
+        size = padded_shape(array.shape, self.tile)
+        current = self._current.get(name)
+        if current is None or current.dtype != array.dtype or current.shape != size:
+            current = np.zeros(size, dtype=array.dtype)
+            self._changed[name] = np.zeros(size, dtype=bool)
+            previous = self._previous.get(name)
+            if previous is None or previous.dtype != array.dtype or previous.shape != size:
+                self._previous[name] = None
+        return current, self._previous[name] if name in self._previous else None, self._changed[name]
+
+
+class DeltaDecoder:
+    """
+    Reference decoder of the delta replies (also accepts plain replies). The arrays returned are views
+    on the state of the decoder, valid until the next decode.
+    """
+
+    def __init__(self, float32=True):
+        self.float32 = float32
+        self.step = -1  # Step of the last reply decoded
+        self._state = {}  # name -> padded map
+
+        # Counters
+        self.replies = 0
+        self.bytesReceived = 0
+
+    def request(self):
+        """Field "reply" of the request header."""
+        return {"encoding": "delta", "float32": self.float32, "base": self.step}
+
+    def decode(self, frames, compressor=None):
+        """frames: multipart reply (bytes or zmq frames). Returns (step, shape, {name: array})."""
+        frames = [frame.buffer if hasattr(frame, "buffer") else frame for frame in frames]
+        self.replies += 1
+        self.bytesReceived += sum(memoryview(frame).nbytes for frame in frames)
+        header = decode_header(frames[0])
+        if compressor is not None:
+            frames = frames[:1] + compressor.unpack(header, frames[1:])
+        elif header.get("codecs"):
+            frames = frames[:1] + [frame if codec is None else decompress(codec, frame)
+                                   for codec, frame in zip(header["codecs"], frames[1:])]
+        shape = header["shape"]
+        if header.get("encoding") != "delta":
+            arrays = {channel["name"]: decode_channel(frame, np.dtype(channel["dtype"]), shape)
+                      for channel, frame in zip(header["channels"], frames[1:])}
+            self.step = -1
+            return header["step"], shape, arrays
+        if header["base"] >= 0 and header["base"] != self.step:
+            raise ValueError(f"Delta reply against step {header['base']}, last step decoded is {self.step}")
+
+        tile = header["tile"]
+        arrays = {}
+        position = 1
+        for channel in header["channels"]:
+            name, dtype, mode = channel["name"], np.dtype(channel["dtype"]), channel["mode"]
+            if mode == "full":
+                values = np.frombuffer(frames[position], dtype=dtype)
+                position += 1
+                if values.size != shape[0] * shape[1]:
+                    self._state[name] = values.copy()
+                    arrays[name] = self._state[name]
+                    continue
+                state = self._map(name, dtype, shape, tile)
+                state[:shape[0], :shape[1]] = values.reshape(shape)
+            elif mode == "same":
+                if name not in self._state:
+                    raise ValueError(f"Channel {name} unchanged, but never received")
+                state = self._state[name]
+                if state.ndim != 2:
+                    arrays[name] = state
+                    continue
+            else:
+                indices = np.frombuffer(frames[position], dtype="<u4")
+                values = np.frombuffer(frames[position + 1], dtype=dtype)
+                position += 2
+                state = self._map(name, dtype, shape, tile)
+                if mode == "sparse":
+                    state[indices // shape[1], indices % shape[1]] = values
+                else:
+                    tilesX = state.shape[1] // tile
+                    blocks = state.reshape(state.shape[0] // tile, tile, tilesX, tile).swapaxes(1, 2)
+                    blocks[indices // tilesX, indices % tilesX] = values.reshape(-1, tile, tile)
+            arrays[name] = state[:shape[0], :shape[1]]
+
+        self.step = header["step"]
+        return header["step"], shape, arrays
+
+    def _map(self, name, dtype, shape, tile):
+        state = self._state.get(name)
+        size = padded_shape(shape, tile)
+        if state is None or state.dtype != dtype or state.shape != size:
+            state = self._state[name] = np.zeros(size, dtype=dtype)
+        return state
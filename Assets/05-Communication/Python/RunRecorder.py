@@ -0,0 +1,165 @@
+#
+#   Run recorder: every received frame, at full rate and full precision, in memory-mapped .npy chunks
+#   One directory per run:
+#       index.json               -> shape, channels and dtypes, chunk size and number of steps recorded
+#       <channel>-00000.npy      -> steps 0 .. chunkSize-1 of the channel, shape (chunkSize, H, W)
+#       step-00000.npy           -> step id of each recorded step
+#   Appending a step is one copy per channel into the current chunk; the operating system writes the
+#   pages back in the background. RunReader maps a range of steps without loading the whole run.
+#
+
+import json
+import os
+import numpy as np
+from FrameStore import CHANNEL_DTYPES, SCALAR_CHANNELS
+
+INDEX_FILE = "index.json"
+
+
+def chunk_path(directory, name, chunk):
+    return os.path.join(directory, f"{name}-{chunk:05d}.npy")
+
+
+class RunRecorder:
+    """
+    Appends frames {channel name: array} to a run directory. An existing run with the same shape is
+    continued. The index is rewritten every flushEvery steps and on close, only the steps it counts
+    are visible to RunReader.
+    """
+
+    def __init__(self, directory, shape, channels=CHANNEL_DTYPES, chunkSize=64, flushEvery=16):
+        self.directory = directory
+        self.shape = tuple(shape)
+        self.channels = {name: np.dtype(dtype) for name, dtype in channels.items()}
+        self.chunkSize = chunkSize
+        self.flushEvery = flushEvery
+        self.count = 0
+
+        os.makedirs(directory, exist_ok=True)
+        indexPath = os.path.join(directory, INDEX_FILE)
+        if os.path.exists(indexPath):
+            with open(indexPath) as file:
+                index = json.load(file)
+            if tuple(index["shape"]) != self.shape or index["channels"] != self._channel_index():
+                raise ValueError(f"Run '{directory}' was recorded with another shape or other channels")
+            self.chunkSize = index["chunkSize"]
+            self.count = index["count"]
+
+        self._chunk = None
+        self._maps = {}
+
+    def _channel_index(self):
+        return {name: dtype.str for name, dtype in self.channels.items()}
+
+    def _channel_shape(self, name):
+        return (1,) if name in SCALAR_CHANNELS else self.shape
+
+    def _open_chunk(self, chunk):
+        self._flush_maps()
+        self._maps = {}
+        for name, dtype in dict(self.channels, step=np.dtype(np.int64)).items():
+            path = chunk_path(self.directory, name, chunk)
+            if os.path.exists(path):
+                self._maps[name] = np.load(path, mmap_mode="r+")
+            else:
+                shape = (self.chunkSize,) if name == "step" else (self.chunkSize,) + self._channel_shape(name)
+                self._maps[name] = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+        self._chunk = chunk
+
+    def append(self, step, arrays):
+        """Record one step. arrays: {channel name: array}, every channel of the run must be given."""
+        chunk, row = divmod(self.count, self.chunkSize)
+        if chunk != self._chunk:
+            self._open_chunk(chunk)
+
+        for name in self.channels:
+            np.copyto(self._maps[name][row], np.reshape(arrays[name], self._channel_shape(name)), casting='same_kind')
+        self._maps["step"][row] = step
+        self.count += 1
+
+        if self.count % self.flushEvery == 0:
+            self.write_index()
+
+    def write_index(self):
+        index = {
+            "shape": list(self.shape),
+            "channels": self._channel_index(),
+            "chunkSize": self.chunkSize,
+            "count": self.count,
+        }
+        # Replaced atomically, a reader never sees a partial index
+        path = os.path.join(self.directory, INDEX_FILE)
+        with open(path + ".tmp", "w") as file:
+            json.dump(index, file, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def _flush_maps(self):
+        for array in self._maps.values():
+            array.flush()
+
+    def close(self):
+        self._flush_maps()
+        self._maps = {}
+        self._chunk = None
+        self.write_index()
+
+
+class RunReader:
+    """Read access to a recorded run. Chunks are memory-mapped when first used."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_FILE)) as file:
+            index = json.load(file)
+        self.shape = tuple(index["shape"])
+        self.channels = {name: np.dtype(dtype) for name, dtype in index["channels"].items()}
+        self.chunkSize = index["chunkSize"]
+        self.count = index["count"]
+        self._maps = {}
+
+    def __len__(self):
+        return self.count
+
+    def _map(self, name, chunk):
+        key = (name, chunk)
+        if key not in self._maps:
+            self._maps[key] = np.load(chunk_path(self.directory, name, chunk), mmap_mode="r")
+        return self._maps[key]
+
+    def read(self, name, start=0, stop=None):
+        """
+        Steps start..stop-1 of a channel ("step" for the step ids). A range within one chunk is a
+        read-only memory-mapped view, a range over several chunks is copied into one array.
+        """
+        stop = self.count if stop is None else min(stop, self.count)
+        if not 0 <= start <= stop:
+            raise IndexError(f"Invalid range {start}..{stop} for a run of {self.count} steps")
+
+        parts = []
+        while start < stop:
+            chunk, row = divmod(start, self.chunkSize)
+            rows = min(stop - start, self.chunkSize - row)
+            parts.append(self._map(name, chunk)[row:row + rows])
+            start += rows
+        if not parts:
+            return np.zeros(0, dtype=np.int64 if name == "step" else self.channels[name])
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts)
+
+    def steps(self):
+        return self.read("step")
+
+    def frame(self, i):
+        """All channels of the i-th recorded step, as views."""
+        if not 0 <= i < self.count:
+            raise IndexError(f"Step {i} out of range for a run of {self.count} steps")
+        chunk, row = divmod(i, self.chunkSize)
+        return {name: self._map(name, chunk)[row] for name in self.channels}
+
+    def frames(self, start=0, stop=None):
+        """Iterate over (step id, {channel: view}) without loading the run."""
+        stop = self.count if stop is None else min(stop, self.count)
+        for i in range(start, stop):
+            chunk, row = divmod(i, self.chunkSize)
+            yield int(self._map("step", chunk)[row]), self.frame(i)
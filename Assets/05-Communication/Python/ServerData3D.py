@@ -4,40 +4,33 @@
 #   Expects b"Hello" from client, replies with b"World"
 #
 
-import random
 import time
 import zmq
 import numpy as np
 import matplotlib.pyplot as plt
 import os
 from PIL import Image
-from scipy.stats import norm
-from scipy.optimize import curve_fit
-from matplotlib.ticker import FormatStrFormatter
-from mpl_toolkits.mplot3d import Axes3D
-from scipy.ndimage import map_coordinates
+from FrameProtocol import bind_legacy_sockets
+from FrameAssembler import FrameAssembler
+from RadialProfiles import RadialProfiles
 
-context = zmq.Context()
-
-# Pressure Socket
-socketPressure = context.socket(zmq.REP)
-socketPressure.bind("tcp://*:5557")
+# The maps are received as they arrive and each socket is acknowledged right away (FrameAssembler.py)
+# A frame still missing maps frameTimeout seconds after its first map arrived is dropped
+frameTimeout = 5
 
-# Heightmap Socket
-socketHeight = context.socket(zmq.REP)
-socketHeight.bind("tcp://*:5558")
+# Path profile - Radial profiles of the compression map for every angle of the sweep (RadialProfiles.py)
+# The trail width of each step is the narrowest crossing of the trail by a line through the center
+profileAngles = np.arange(0, 360, 1)
+profileAngle = 90  # Profile plotted
+terrainSize = 10  # m, side of the terrain (256 cells = 10m)
 
-# Young Socket
-socketYoung = context.socket(zmq.REP)
-socketYoung.bind("tcp://*:5559")
+# Pause at the end of each step - Set to 0 when replaying a run with ReplayRun.py
+sleepTime = 1
 
-# Vegetation Socket
-socketVegetation = context.socket(zmq.REP)
-socketVegetation.bind("tcp://*:5555")
+context = zmq.Context()
 
-# Distance Socket
-socketDistance = context.socket(zmq.REP)
-socketDistance.bind("tcp://*:6000")
+# One REP socket per map - Vegetation 5555, distance 6000, pressure 5557, height 5558 and Young 5559
+legacySockets = bind_legacy_sockets(context)
 
 # Counter
 idx = 0
@@ -76,47 +69,65 @@ fig.suptitle("3D Simulation Maps", fontsize=14, fontweight='bold')
 ax1.set_title('Path Profile')
 ax2.set_title('3D Compression')
 
-# Initial height
-np_array_initial_height = np.ones((257, 257))  # TODO: Set initial heightmap, instead of ones (in this case is 1.0)
-np_array_height = np.random.random((257, 257))
-np_array_height_difference = np.random.random((257, 257))
+# Terrain dimensions - Set from the size of the first height map received (FrameStore of the assembler)
+shape = None
 
-# Reshape 1D array to 2D numpy array - TODO: Set terrain dimensions automatically
-np_array_pressure = np.random.random((257, 257))  # ax1
-np_array_height_compression = np.random.random((257, 257))  # ax2
-np_array_initial_vegetation = np.random.random((257, 257))  # ax3
-np_array_vegetation = np.random.random((257, 257))  # ax4
-np_array_initial_young = np.random.random((257, 257))  # ax5
-np_array_height_accumulation = np.random.random((257, 257))  # ax6
+# Acknowledgements, sent by the assembler as soon as each map arrives
+ACKNOWLEDGEMENTS = {
+    "pressure": b"Pressure Map received!",
+    "height": b"Height Map received!",
+    "young": b"Young Map received!",
+    "vegetation": b"Vegetation Map received!",
+    "distance": b"Distance received!",
+}
+assembler = FrameAssembler(legacySockets, lambda store, name, frame, slot: ACKNOWLEDGEMENTS[name],
+                           staleTimeout=frameTimeout)
 
 while True:
     idx += 1
     print("idx: ", idx)
 
-    # Retrieving data
-    messagePressure = socketPressure.recv()
-    messageHeight = socketHeight.recv()
-    messageYoung = socketYoung.recv()
-    messageVegetation = socketVegetation.recv()
-    messageDistance = socketDistance.recv()
-
-    # Reconvert byte array back to 2D numpy array of floats
-    float_array_pressure = np.frombuffer(messagePressure, dtype=np.float32)
-    float_array_height = np.frombuffer(messageHeight, dtype=np.float32)
-    double_array_young = np.frombuffer(messageYoung, dtype=np.double)
-    float_array_vegetation = np.frombuffer(messageVegetation, dtype=np.float32)
-    float_distance = np.frombuffer(messageDistance, dtype=np.float32)
-
-    # Reshape 1D array to 2D numpy array - TODO: Set terrain dimensions automatically
-    np_array_pressure = np.reshape(float_array_pressure, (257, 257))  # ax1
-    np_array_height = np.reshape(float_array_height, (257, 257))
-    if idx == 4:
-        np_array_initial_young = np.reshape(double_array_young, (257, 257))  # ax5
-        np_array_initial_height = np.reshape(np_array_height, (257, 257))
-    if idx == 2:
-        np_array_initial_vegetation = np.reshape(float_array_vegetation, (257, 257))  # ax3
-
-    np_array_vegetation = np.reshape(float_array_vegetation, (257, 257))  # ax4
+    # Retrieving data - Complete frame, its maps arrived in any order and were acknowledged on arrival
+    # Frame number counted from 0, with gaps after dropped frames
+    frame = assembler.next_frame()
+    store = assembler.store
+
+    # Views on the ring buffers of the store, rewritten two frames later - Maps kept across steps are copied
+    float_array_pressure = store.pressure.reshape(-1)
+    float_array_height = store.height.reshape(-1)
+    double_array_young = store.young.reshape(-1)
+    float_array_vegetation = store.vegetation.reshape(-1)
+    float_distance = store.distance
+
+    # Terrain dimensions, from the size of the first height map
+    if shape is None:
+        shape = store.shape
+        print(f"Terrain dimensions: {shape[0]}x{shape[1]}")
+
+        # Initial maps, until they are captured - Channels captured in referenced
+        referenced = set()
+        np_array_initial_height = np.ones(shape)  # TODO: Set initial heightmap, instead of ones (in this case is 1.0)
+        np_array_initial_vegetation = np.random.random(shape)  # ax3
+        np_array_initial_young = np.random.random(shape)  # ax5
+
+        # Sampling coordinates of every angle, computed once
+        radial = RadialProfiles(shape, profileAngles)
+        cellSize = terrainSize / shape[0]
+
+    # Reshape 1D array to 2D numpy array
+    np_array_pressure = np.reshape(float_array_pressure, shape)  # ax1
+    np_array_height = np.reshape(float_array_height, shape)
+    # Initial maps - Young and height from the 4th frame (idx == 4), vegetation from the 2nd (idx == 2), or from
+    # the first frame after it if it was dropped
+    if "young" not in referenced and frame >= 3:
+        np_array_initial_young = np.reshape(double_array_young, shape).copy()  # ax5
+        np_array_initial_height = np.reshape(np_array_height, shape).copy()
+        referenced.update(("young", "height"))
+    if "vegetation" not in referenced and frame >= 1:
+        np_array_initial_vegetation = np.reshape(float_array_vegetation, shape).copy()  # ax3
+        referenced.add("vegetation")
+
+    np_array_vegetation = np.reshape(float_array_vegetation, shape)  # ax4
 
     # Append distance travelled by the character
     distanceTravelled = float_distance.item()
@@ -155,12 +166,7 @@ while True:
     ax2.set_title('Compression')
 
     # Send reply to the client
-    # In the real world usage, after you finish your work, send your output here
-    socketPressure.send(b"Pressure Map received!")
-    socketHeight.send(b"Height Map received!")
-    socketYoung.send(b"Young Map received!")
-    socketVegetation.send(b"Vegetation Map received!")
-    socketDistance.send(b"Distance received!")
+    # Each map has already been acknowledged by the assembler (ACKNOWLEDGEMENTS)
 
     # Create dir
     dirData = 'frames/Review/SimulatorData-1/TestData-1/'  # TODO --- CHANGE! ---
@@ -193,39 +199,22 @@ while True:
 
     # Path Profile
 
-    # Calculate the indices for the cross-section
-    n = len(np_array_height_compression)
-
-    # Define the center of the array
-    center = n // 2, n // 2
-
-    # Define function to extract values along a line
-    def extract_line(angle, radius):
-        # Calculate displacement from center for each point along line
-        t = np.linspace(0, radius, radius)
-        x_disp = t * np.cos(angle)
-        y_disp = t * np.sin(angle)
-
-        # Calculate indices of points along line
-        x_indices = center[0] + x_disp
-        y_indices = center[1] + y_disp
-
-        # Create a set of coordinates for each point along the line
-        coordinates = np.array([x_indices.ravel(), y_indices.ravel()])
-
-        # Use map_coordinates to interpolate values at these indices
-        line_values = map_coordinates(np_array_height_compression, coordinates)
-
-        return line_values
-
-    # Calculate angle in radians
-    angle = 90 * np.pi / 180
+    # Profiles from the center to the edge of the array, (angles, radius), in a single interpolation
+    profiles = radial.sample(np_array_height_compression)
 
-    # Define radius (distance from center to edge of array)
-    radius = min(n, n) // 2
+    # Width estimate - Compressed run of each line around its crossing, the narrowest one is across the trail
+    lineAngles, lineWidths = radial.line_widths(profiles)
+    if np.isfinite(lineWidths).any():
+        line = np.nanargmin(lineWidths)
+        widths.append(lineWidths[line] * cellSize)
+        print(f"Trail width: {widths[-1]:.2f}m at {lineAngles[line]:.0f}°")
+    else:
+        widths.append(np.nan)  # No line crosses the trail yet
+        print("Trail width: -")
 
-    # Extract data for this angle
-    data = extract_line(angle, radius)
+    # Extract data for the plotted angle
+    data = profiles[radial.index(profileAngle)]
+    data_norm = data  # Until the terrain is compressed
 
     line_values_sum = np.sum(data)
     if line_values_sum != 0:
@@ -240,7 +229,7 @@ while True:
 
     ax1.bar(range(len(data_norm)), data_norm)
 
-    ax1.set_title(f'Angle {90}°')
+    ax1.set_title(f'Angle {profileAngle}°')
 
     # ============================================== #
 
@@ -294,4 +283,4 @@ while True:
     # Try reducing sleep time to 0.01 to see how blazingly fast it communicates
     # In the real world usage, you just need to replace time.sleep() with
     # whatever work you want python to do, maybe a machine learning task?
-    time.sleep(1)
\ No newline at end of file
+    time.sleep(sleepTime)
\ No newline at end of file
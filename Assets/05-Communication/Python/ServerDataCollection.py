@@ -4,40 +4,67 @@
 #   Expects b"Hello" from client, replies with b"World"
 #
 
-import random
+import atexit
 import time
 import zmq
 import numpy as np
-import matplotlib.pyplot as plt
 import os
-from PIL import Image
-from scipy.stats import norm
-from scipy.optimize import curve_fit
-from matplotlib.ticker import FormatStrFormatter
-from mpl_toolkits.mplot3d import Axes3D
-from matplotlib.ticker import MaxNLocator
+from SimulationRenderer import SimulationRenderer
+from FrameProtocol import bind_legacy_sockets
+from FrameAssembler import FrameAssembler
+from TramplingStats import TramplingStats
+from TrailGeometry import TrailEstimator
+from RunRecorder import RunRecorder
+from ImageEncoding import ImageEncoder, ImageSink
+from SnapshotCache import SnapshotCache
+
+# True opens the figure in a window (needs a GUI backend), False renders off-screen only
+showFigure = False
+
+# Encoding of the training images - "uint8" (8-bit PNG), "uint16" (16-bit PNG), "float16" or "float32" (raw .npy)
+# The normalization ranges are saved next to the images (encoding.json), see ImageEncoding.py
+imageEncoding = "uint8"
+imageEncoderThreads = 0  # > 0 writes the images of a step in parallel threads
+imageProcesses = 0  # > 0 encodes the images in a pool of processes (ImageSink), the loop does not wait for them
+imageMaxInFlight = 32  # Images queued in the process pool before the loop waits
+imageCompressLevel = 6  # zlib level of the PNG files, from 1 (fast) to 9 (small)
+
+# Steps whose figure is saved to disk - The training images are saved every step
+snapshotEvery = 20
+
+# True records every received frame (raw float32 and double maps) at full rate - see RunRecorder.py
+recordRun = False
+runDir = 'frames/runs/TestData-1/'  # TODO --- CHANGE! ---
+
+# True keeps the saved images in a cache keyed by the maps of the step and the settings (SnapshotCache.py)
+# Replays (ReplayRun.py) and reruns with the same frames copy them instead of converting and encoding again
+# Delete cacheDir after changing how the images or the figure are made - The keys only cover maps and settings
+useCache = False
+cacheDir = 'frames/cache/'
+cacheMaxBytes = 2 * 1024 ** 3
+
+# The maps are received as they arrive and each socket is acknowledged right away (FrameAssembler.py)
+# A frame still missing maps frameTimeout seconds after its first map arrived is dropped
+frameTimeout = 5
+
+# Trail width and depth every step - "moments" (closed form) or "fit" (Gaussian fit seeded from the previous step)
+trailMethod = "moments"
+terrainSize = 10  # m, side of the terrain (256 cells = 10m)
+
+# Pause at the end of each step - Set to 0 when replaying a run with ReplayRun.py
+sleepTime = 1
+
+# Training images and figures, in the selected encoding - Encode time and size per kind are printed on exit
+# Created first: the process pool of ImageSink is forked before the zmq context and the threads exist
+if imageProcesses > 0:
+    encoder = ImageSink(imageEncoding, processes=imageProcesses, level=imageCompressLevel, maxInFlight=imageMaxInFlight)
+else:
+    encoder = ImageEncoder(imageEncoding, workers=imageEncoderThreads, level=imageCompressLevel)
 
 context = zmq.Context()
 
-# Pressure Socket
-socketPressure = context.socket(zmq.REP)
-socketPressure.bind("tcp://*:5557")
-
-# Heightmap Socket
-socketHeight = context.socket(zmq.REP)
-socketHeight.bind("tcp://*:5558")
-
-# Young Socket
-socketYoung = context.socket(zmq.REP)
-socketYoung.bind("tcp://*:5559")
-
-# Vegetation Socket
-socketVegetation = context.socket(zmq.REP)
-socketVegetation.bind("tcp://*:5555")
-
-# Distance Socket
-socketDistance = context.socket(zmq.REP)
-socketDistance.bind("tcp://*:6000")
+# One REP socket per map - Vegetation 5555, distance 6000, pressure 5557, height 5558 and Young 5559
+legacySockets = bind_legacy_sockets(context)
 
 # Counter
 idx = 0
@@ -59,78 +86,106 @@ minAccumulation = 0.0  # instead of np_array_height_accumulation.min()
 maxVegetation = 1
 minVegetation = 0
 
-# Distance travelled in array
-distances = []
+# Normalization ranges of the images, saved next to them (encoding.json) and part of the cache keys
+imageRanges = {
+    "input": [("pressure", minPressure, maxPressure), ("vegetation", 0, 1), ("young", minYoung, maxYoung)],
+    "output": [("compression", maxCompression, minCompression), ("vegetation", 0, 1),
+               ("accumulation", minAccumulation, maxAccumulation)],
+}
+
+# Distance travelled in array - Distances, passes and relative cover are kept by TramplingStats
 avgCompression = []
 widths = []
+trail = TrailEstimator(terrainSize, method=trailMethod)
 
-passesArray = []
-avgVegetation = []
-
-# Second, set up the figure, the axis, and the plot element we want to animate
-fig, axes = plt.subplots(nrows=3, ncols=3, figsize=(10, 10))
-ax1, ax2, ax3, ax4, ax5, ax6, ax7, ax8, ax9 = axes.flatten()
-plt.subplots_adjust(hspace=0.5, wspace=0.5)
-
-# Super title
-fig.suptitle("Simulation Maps", fontsize=14, fontweight='bold')
+# Terrain dimensions - Set from the size of the first height map received (FrameStore of the assembler)
+shape = None
 
-# Single titles
-ax1.set_title('Pressure')
-ax2.set_title('Compression')
+# Acknowledgements, sent by the assembler as soon as each map arrives
+ACKNOWLEDGEMENTS = {
+    "pressure": b"Pressure Map received!",
+    "height": b"Height Map received!",
+    "young": b"Young Map received!",
+    "vegetation": b"Vegetation Map received!",
+    "distance": b"Distance received!",
+}
+assembler = FrameAssembler(legacySockets, lambda store, name, frame, slot: ACKNOWLEDGEMENTS[name],
+                           staleTimeout=frameTimeout)
 
-ax4.set_title('Initial Vegetation')
-ax6.set_title('Vegetation')
 
-ax7.set_title('Initial Young Modulus')
-ax8.set_title('Vertical Accumulation')
+def close_encoder():
+    encoder.close()
+    print(encoder.summary())
 
-# Initial height
-np_array_initial_height = np.ones((257, 257))  # TODO: Set initial heightmap, instead of ones (in this case is 1.0)
-np_array_height = np.random.random((257, 257))
-np_array_height_difference = np.random.random((257, 257))
-
-# Reshape 1D array to 2D numpy array - TODO: Set terrain dimensions automatically
-np_array_pressure = np.random.random((257, 257))  # ax1
-np_array_height_compression = np.random.random((257, 257))  # ax2
-np_array_initial_vegetation = np.random.random((257, 257))  # ax3
-np_array_vegetation = np.random.random((257, 257))  # ax4
-np_array_initial_young = np.random.random((257, 257))  # ax5
-np_array_height_accumulation = np.random.random((257, 257))  # ax6
 
 while True:
     idx += 1
 
-    # Retrieving data
-    messagePressure = socketPressure.recv()
-    messageHeight = socketHeight.recv()
-    messageYoung = socketYoung.recv()
-    messageVegetation = socketVegetation.recv()
-    messageDistance = socketDistance.recv()
-
-    # Reconvert byte array back to 2D numpy array of floats
-    float_array_pressure = np.frombuffer(messagePressure, dtype=np.float32)
-    float_array_height = np.frombuffer(messageHeight, dtype=np.float32)
-    double_array_young = np.frombuffer(messageYoung, dtype=np.double)
-    float_array_vegetation = np.frombuffer(messageVegetation, dtype=np.float32)
-    float_distance = np.frombuffer(messageDistance, dtype=np.float32)
-
-    # Reshape 1D array to 2D numpy array - TODO: Set terrain dimensions automatically
-    np_array_pressure = np.reshape(float_array_pressure, (257, 257))  # ax1
-    np_array_height = np.reshape(float_array_height, (257, 257))
-    if idx == 4:
-        np_array_initial_young = np.reshape(double_array_young, (257, 257))  # ax5
-        np_array_initial_height = np.reshape(np_array_height, (257, 257))
-    if idx == 2:
-        np_array_initial_vegetation = np.reshape(float_array_vegetation, (257, 257))  # ax3
-
-    np_array_vegetation = np.reshape(float_array_vegetation, (257, 257))  # ax4
-
-    # Append distance travelled by the character
+    # Retrieving data - Complete frame, its maps arrived in any order and were acknowledged on arrival
+    # Frame number counted from 0, with gaps after dropped frames
+    frame = assembler.next_frame()
+    store = assembler.store
+
+    # Views on the ring buffers of the store, rewritten two frames later - Maps kept across steps are copied
+    float_array_pressure = store.pressure.reshape(-1)
+    float_array_height = store.height.reshape(-1)
+    double_array_young = store.young.reshape(-1)
+    float_array_vegetation = store.vegetation.reshape(-1)
+    float_distance = store.distance
+
+    # Terrain dimensions, from the size of the first height map
+    if shape is None:
+        shape = store.shape
+        print(f"Terrain dimensions: {shape[0]}x{shape[1]}")
+
+        # Second, set up the figure once - each step only updates the panels that changed
+        renderer = SimulationRenderer(shape, headless=not showFigure)
+        ax1, ax2, ax3, ax4, ax5, ax6, ax7, ax8, ax9 = renderer.axes
+
+        # Initial maps, until they are captured - Channels captured in referenced
+        referenced = set()
+        np_array_initial_height = np.ones(shape)  # TODO: Set initial heightmap, instead of ones (in this case is 1.0)
+        np_array_initial_vegetation = np.random.random(shape)  # ax3
+        np_array_initial_young = np.random.random(shape)  # ax5
+
+        # Trampling statistics - Cells with vegetation are indexed again when the initial vegetation is captured
+        stats = TramplingStats(np_array_initial_vegetation)
+
+        # Image cache - Summary printed after the encoder is closed, once the last images are stored
+        cache = None
+        if useCache:
+            cache = SnapshotCache(cacheDir, cacheMaxBytes)
+            atexit.register(lambda: print(cache.summary()))
+
+        # Encoder closed on exit, before the cache summary is printed
+        atexit.register(close_encoder)
+        input_array = encoder.empty(shape + (3,))
+        output_array = encoder.empty(shape + (3,))
+
+        # Run recorder - Closed on exit, so the index counts every recorded step
+        recorder = None
+        if recordRun:
+            recorder = RunRecorder(runDir, shape)
+            atexit.register(recorder.close)
+
+    # Reshape 1D array to 2D numpy array
+    np_array_pressure = np.reshape(float_array_pressure, shape)  # ax1
+    np_array_height = np.reshape(float_array_height, shape)
+    # Initial maps - Young and height from the 4th frame (idx == 4), vegetation from the 2nd (idx == 2), or from
+    # the first frame after it if it was dropped
+    if "young" not in referenced and frame >= 3:
+        np_array_initial_young = np.reshape(double_array_young, shape).copy()  # ax5
+        np_array_initial_height = np.reshape(np_array_height, shape).copy()
+        referenced.update(("young", "height"))
+    if "vegetation" not in referenced and frame >= 1:
+        np_array_initial_vegetation = np.reshape(float_array_vegetation, shape).copy()  # ax3
+        stats.set_reference(np_array_initial_vegetation)
+        referenced.add("vegetation")
+
+    np_array_vegetation = np.reshape(float_array_vegetation, shape)  # ax4
+
+    # Distance travelled by the character
     distanceTravelled = float_distance.item()
-    passes = distanceTravelled / 7
-    distances.append(distanceTravelled)
-    passesArray.append(passes)
 
     # Estimate compression and accumulation maps
     np_array_height_difference = np_array_height - np_array_initial_height
@@ -153,33 +208,18 @@ while True:
                                                          / np_array_height_compression_flatten_comp_sum
     '''
 
-    # Create plots
-    # Second, set up the figure, the axis, and the plot element we want to animate
-    fig, axes = plt.subplots(nrows=3, ncols=3, figsize=(10, 10))
-    ax1, ax2, ax3, ax4, ax5, ax6, ax7, ax8, ax9 = axes.flatten()
-    plt.subplots_adjust(hspace=0.5, wspace=0.5)
-
-    # Super title
-    fig.suptitle("Simulation Maps", fontsize=14, fontweight='bold')
-
-    # Single titles
-    ax1.set_title('Pressure')
-    ax2.set_title('Compression')
-    ax3.set_title('Compression Width')
-    ax4.set_title('Initial Vegetation')
-    ax5.set_title('Vegetation Trampling')
-    ax6.set_title('Vegetation')
-    ax7.set_title('Initial Young Modulus')
-    ax8.set_title('Vertical Accumulation')
-    ax9.set_title('Avg. Compression vs. Distance Travelled')
-
     # Send reply to the client
-    # In the real world usage, after you finish your work, send your output here
-    socketPressure.send(b"Pressure Map received!")
-    socketHeight.send(b"Height Map received!")
-    socketYoung.send(b"Young Map received!")
-    socketVegetation.send(b"Vegetation Map received!")
-    socketDistance.send(b"Distance received!")
+    # Each map has already been acknowledged by the assembler (ACKNOWLEDGEMENTS)
+
+    # Record the raw maps received
+    if recorder is not None:
+        recorder.append(idx, {
+            "vegetation": float_array_vegetation,
+            "distance": float_distance,
+            "pressure": float_array_pressure,
+            "height": float_array_height,
+            "young": double_array_young,
+        })
 
     # Create dir
     dirData = 'frames/Review/SimulatorData-1/TestData-1/'  # TODO --- CHANGE! ---
@@ -206,100 +246,26 @@ while True:
 
     np_array_vegetation_normalized = np_array_vegetation * 255
 
-    # Update plots
-
-    # ============================================== #
-
-    mapPressure = ax1.imshow(np_array_pressure_normalized, cmap='Reds', interpolation='nearest', vmin=0, vmax=255)
-
-    # ============================================== #
-
-    mapHeightCompression = ax2.imshow(np_array_height_compression_normalized, cmap="Reds", interpolation='nearest', vmin=0, vmax=255)
-    # Add text to the upper left corner of the subplot
-    ax2.text(0.05, 0.95, f"Dist: {distanceTravelled:.1f}m", transform=ax2.transAxes, fontsize=14, verticalalignment='top')
-
     # ============================================== #
 
-    '''
-    # TODO: GAUSSIAN WIDTH
-
-    # Straight
-    # define the Gaussian function
-    def gaussian(x, mu, sigma, A):
-        return A * np.exp(-(x - mu) ** 2 / (2 * sigma ** 2))
-
-    x = range(len(np_array_height_compression_flatten_width_norm))
-    y = np_array_height_compression_flatten_width_norm
-
-    # initial guess for the parameters
-    p0 = [128, 10, 1]
-    # fit the Gaussian function to the data
-    popt, pcov = curve_fit(gaussian, x, y, p0)
-    # get the fitted parameters
-    mu, sigma, A = popt
-
-    avgCompression.append(gaussian(mu, mu, sigma, A))
-
-    x_fit = np.linspace(min(x), max(x), 1000)
-    y_fit = gaussian(x_fit, mu, sigma, A)
-
-    # estimate width
-    x_text = max(y_fit)  # x coordinate of the text
-    y_text = mu  # y coordinate of the text
-    width = (2*sigma*3*10)/len(np_array_height_compression_flatten_width_norm) # 256=10m
-
+    # Trail width and depth - Gaussian profile across the trail, from its moments (TrailGeometry.py)
+    width, depth = trail.update(np_array_height_compression)
     widths.append(width)
-
-    ax3.text(0.05, 0.95, f"W: {width:.2f}m", transform=ax3.transAxes, fontsize=14, verticalalignment='top')
-    #ax3.text(0.05, 0.85, f"Avg.Comp: {gaussian(mu, mu, sigma, A)*100:.2f}cm", transform=ax3.transAxes, fontsize=14, verticalalignment='top')
-
-    ax3.set_xlim([0, 0.2])
-    ax3.plot(y_fit, x_fit, color='red')
-    ax3.barh(x, y)
-    '''
+    avgCompression.append(depth)
+    print(f"Width: {width:.2f}m, Avg. Compression: {depth * 100:.2f}cm")
 
     # ============================================== #
 
     # TODO: Vegetation
 
-    # Find the non-zero elements in A
-    A = np_array_initial_vegetation[np_array_initial_vegetation != 0]
-
-    # Corresponding elements in B
-    B = np_array_vegetation[np_array_initial_vegetation != 0]
-
-    # Calculate the percentage decrement
-    percentage_decrement = (B / A) * 100
-
-    # Get the average percentage decrement
-    average_percentage_remaining = np.mean(percentage_decrement).astype(float)
-    avgVegetation.append(average_percentage_remaining)
+    # Relative cover over the cells with initial vegetation, distance, passes and compression statistics
+    average_percentage_remaining = stats.update(np_array_vegetation, np_array_height_compression, distanceTravelled)
 
     # Get number of passes
 
     print(f"Remaining {average_percentage_remaining}%")
     print(f"Passes: {distanceTravelled/7}")
 
-    ax5.plot(passesArray, avgVegetation, linestyle='-', color='green', label='vegetation')
-
-    ax5.set_xlim(1, np.max(passesArray))
-
-    #ax5.set_xticks(np.arange(0, 101, 10))  # Sets x-axis ticks at 0, 10, 20, ..., 100
-    ax5.set_xticks([25, 75, 200, 500])
-
-    # Get the x-ticks (vertical gridlines)
-    xticks = ax5.get_xticks()
-
-    # Plot a marker at each vertical gridline
-    for x in xticks:
-        y = np.interp(x, passesArray, avgVegetation)  # Interpolate to find the y-value at this x
-        ax5.plot(x, y, color='green', marker='o')
-        ax5.annotate('{:.0f}'.format(y), (x, y), textcoords="offset points", xytext=(10, -10), ha='center', weight="bold")
-
-    ax5.set_xlabel('Number of passes')
-    ax5.set_ylabel('Relative cover after trampling (%)')
-    ax5.legend()  # This displays the legend
-    ax5.grid(True)
 
     '''
     # TODO: GAUSSIAN COMPRESSION
@@ -346,8 +312,8 @@ while True:
     # TODO: Accumulative data
 
     # Straight
-    #ax9.plot(distances, avgCompression, color='red', label='Avg. Compression')
-    ax9.plot(distances, widths, color='blue', label='Width')
+    #ax9.plot(stats.distances, avgCompression, color='red', label='Avg. Compression')
+    ax9.plot(stats.distances, widths, color='blue', label='Width')
     ax9.legend()  # This displays the legend
 
     ax9.set_ylim([0, 3])
@@ -358,45 +324,35 @@ while True:
 
     # ============================================== #
 
-    mapInitialVegetation = ax4.imshow(np_array_initial_vegetation_normalized, cmap="Greens", interpolation='nearest', vmin=0, vmax=255)
-
-    # ============================================== #
-
-    mapVegetation = ax6.imshow(np_array_vegetation_normalized, cmap="Greens", interpolation='nearest', vmin=0, vmax=255)
-
-    # ============================================== #
-
-    mapInitialYoung = ax7.imshow(np_array_initial_young_normalized, cmap='Blues', interpolation='nearest', vmin=0, vmax=255)
-
-    # ============================================== #
-
-    mapHeightAccumulation = ax8.imshow(np_array_height_accumulation_normalized, cmap="Blues", interpolation='nearest', vmin=0, vmax=255)
+    # Update plots - Trampling curve, maps and distance travelled
+    renderer.update({
+        "pressure": np_array_pressure_normalized,
+        "compression": np_array_height_compression_normalized,
+        "initial_vegetation": np_array_initial_vegetation_normalized,
+        "vegetation": np_array_vegetation_normalized,
+        "initial_young": np_array_initial_young_normalized,
+        "accumulation": np_array_height_accumulation_normalized,
+    }, stats.passes, stats.cover, distanceTravelled, stats.tick_values)
 
     # ============================================== #
 
     # TODO: Set min (YoungGround) and max (YoungGround + 1*YoungVegetation) values automatically
     """UNCOMMENT"""
-    if idx % 20 == 0: # 20
-        plt.savefig(dirData + str(idx) + ".png")  # save the figure to file
+    if idx % snapshotEvery == 0:
+        # Figure saved as an 8-bit PNG by the encoder, from the blitted buffer - Unless an earlier run saved it
+        figureKey = None
+        if cache is not None:
+            figureKey = cache.key([np_array_pressure, np_array_initial_vegetation, np_array_initial_young,
+                                   np_array_height_compression, np_array_vegetation, np_array_height_accumulation,
+                                   stats.passes, stats.cover],
+                                  {"ranges": imageRanges, "distance": distanceTravelled})
+        if figureKey is None or not cache.get(figureKey, [dirData + str(idx)]):
+            encoder.write([(dirData + str(idx), renderer.to_array())], encoding="uint8", kind="figure",
+                          done=None if figureKey is None else cache.on_written(figureKey))
 
 
     # ---------------------------------------------------------------------------------------------
 
-    # Stack the arrays into a single array
-    """UNCOMMENT"""
-
-    input_array = np.dstack((np_array_pressure_normalized,
-                             np_array_initial_vegetation_normalized,
-                             np_array_initial_young_normalized))
-
-
-    """UNCOMMENT"""
-
-    output_array = np.dstack((np_array_height_compression_normalized,
-                              np_array_vegetation_normalized,
-                              np_array_height_accumulation_normalized))
-
-
     # Save the images
     """UNCOMMENT"""
 
@@ -404,41 +360,49 @@ while True:
     if not os.path.exists(dirRGB):
         os.makedirs(dirRGB)
 
+    # Encoding and normalization ranges of the images, saved with the first ones
+    if encoder.ranges is None:
+        encoder.write_ranges(dirRGB, imageRanges)
 
-    # USING IMAGEIO
-    # input_array = (input_array * 65535).astype(np.uint16)
-    # output_array = (output_array * 65535).astype(np.uint16)
-    # input_array = (65535 * (input_array - input_array.min()) / input_array.ptp()).astype(np.uint16)
-    # output_array = (65535 * (output_array - output_array.min()) / output_array.ptp()).astype(np.uint16)
-    # imageio.imwrite(dirRGB + str(idx) + "-input.png", input_array, prefer_uint8=False)
-    # imageio.imwrite(dirRGB + str(idx) + "-output.png", output_array, prefer_uint8=False)
+    # Cache - Images of the same maps and settings, saved by an earlier run, are copied instead
+    imagesKey = None
+    imagesCached = False
+    if cache is not None:
+        imagesKey = cache.key([np_array_pressure, np_array_initial_vegetation, np_array_initial_young,
+                               np_array_height_compression, np_array_vegetation, np_array_height_accumulation],
+                              {"ranges": imageRanges, "encoding": encoder.encoding, "level": imageCompressLevel})
+        imagesCached = cache.get(imagesKey, [dirRGB + str(idx) + "-input", dirRGB + str(idx) + "-output"])
 
-    # USING PILLOW
-    # Convert the numpy array to a PIL Image object with int16
+    if not imagesCached:
+        start = time.perf_counter()
 
-    # input_image = Image.fromarray(np.uint8(input_array * 255))
-    
-    """UNCOMMENT"""
+        # Stack the arrays into the image buffers, in the dtype of the image encoding
+        """UNCOMMENT"""
 
-    input_image = Image.fromarray(np.uint8(input_array))
+        encoder.convert((np_array_pressure_normalized,
+                         np_array_initial_vegetation_normalized,
+                         np_array_initial_young_normalized), out=input_array)
 
 
-    # output_image = Image.fromarray(np.uint8(output_array * 255))
-    
-    """UNCOMMENT"""
+        """UNCOMMENT"""
 
-    output_image = Image.fromarray(np.uint8(output_array))
+        encoder.convert((np_array_height_compression_normalized,
+                         np_array_vegetation_normalized,
+                         np_array_height_accumulation_normalized), out=output_array)
 
 
-    """UNCOMMENT"""
+        """UNCOMMENT"""
 
-    input_image.save(dirRGB + str(idx) + "-input.png")
-    output_image.save(dirRGB + str(idx) + "-output.png")
+        # 8-bit PNG as before with imageEncoding = "uint8", 16-bit PNG or raw .npy otherwise
+        encoder.write([
+            (dirRGB + str(idx) + "-input", input_array),
+            (dirRGB + str(idx) + "-output", output_array),
+        ], done=None if imagesKey is None else cache.on_written(imagesKey, time.perf_counter() - start))
 
 
     # Fourth, animate
     '''
-    if idx % 20 == 0:
+    if idx % snapshotEvery == 0:
         fig.tight_layout()
         plt.show()
     '''
@@ -448,4 +412,4 @@ while True:
     # Try reducing sleep time to 0.01 to see how blazingly fast it communicates
     # In the real world usage, you just need to replace time.sleep() with
     # whatever work you want python to do, maybe a machine learning task?
-    time.sleep(1)
\ No newline at end of file
+    time.sleep(sleepTime)
\ No newline at end of file
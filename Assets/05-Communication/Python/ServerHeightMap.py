@@ -8,6 +8,7 @@ import time
 import zmq
 import numpy as np
 import matplotlib.pyplot as plt
+from FrameProtocol import grid_shape_from_bytes
 
 context = zmq.Context()
 socket = context.socket(zmq.REP)
@@ -27,8 +28,8 @@ while True:
     # Convert byte array back to 2D numpy array of floats
     float_array = np.frombuffer(message, dtype=np.float32)
 
-    # Reshape 1D array to 2D numpy array - TODO: Set terrain dimensions automatically
-    np_array = np.reshape(float_array, (257, 257))
+    # Reshape 1D array to 2D numpy array - Terrain dimensions from the size of the map
+    np_array = np.reshape(float_array, grid_shape_from_bytes(len(message), np.float32))
 
     fig, ax = plt.subplots()
     im = ax.imshow(np_array, cmap="coolwarm", interpolation='nearest', vmin=0.9, vmax=1.1)
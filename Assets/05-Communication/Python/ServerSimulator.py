@@ -4,37 +4,109 @@
 #   Expects b"Hello" from client, replies with b"World"
 #
 
-import random
+import atexit
 import time
 import zmq
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
 import numpy as np
 import os
-from pylab import *
-from PIL import Image
+from FrameProtocol import bind_legacy_sockets, bind_unified_socket, send_frame
+from FrameStore import FrameStore, SnapshotPool, AllocationProbe, ReferenceCapture, normalize
+from FrameAssembler import FrameAssembler
+from ReplyEncoding import DeltaEncoder
+from PayloadCompression import PayloadCompressor
+from SimulationRenderer import SimulationRenderer
+from SnapshotPipeline import SnapshotPipeline
+from TramplingStats import TramplingStats
+from RunRecorder import RunRecorder
+from ImageEncoding import ImageEncoder, ImageSink
+from VideoSink import VideoSink
+from ColormapLUT import MapTiler
+from StageMetrics import StageMetrics
+from SnapshotCache import SnapshotCache
+
+# Communication mode
+# False: legacy mode, one REP socket per map (5555, 6000, 5557, 5558, 5559) as sent by ExportXXXMap.cs
+# True: unified mode, one multipart message per step on a single socket (5560) - see FrameProtocol.py
+useUnifiedEndpoint = False
+# Unified mode: clients asking for it in their header get delta replies, only the tiles or cells changed since
+# their last reply (ReplyEncoding.py). Clients that do not ask always get the full maps
+allowDeltaReplies = True
+# Unified mode: codecs offered to the client to compress the payloads, () to disable (PayloadCompression.py)
+# Payloads compressing below compressionMinRatio are sent raw
+payloadCompression = ("lz4", "zstd", "zlib")
+compressionMinRatio = 1.5
+
+# Plots and images are produced in the background - What to do when they fall behind the simulation:
+# "drop-oldest" (never wait), "block" (never lose a snapshot) or "sample" (keep one every snapshotSampleEvery)
+snapshotPolicy = "drop-oldest"
+snapshotQueueSize = 8
+snapshotSampleEvery = 1
+
+# Encoding of the training images - "uint8" (8-bit PNG), "uint16" (16-bit PNG), "float16" or "float32" (raw .npy)
+# The normalization ranges are saved next to the images (encoding.json), see ImageEncoding.py
+imageEncoding = "uint8"
+imageEncoderThreads = 0  # > 0 writes the images of a step in parallel threads
+imageProcesses = 0  # > 0 encodes the images in a pool of processes (ImageSink), the snapshot worker does not wait
+imageMaxInFlight = 32  # Images queued in the process pool before the snapshot worker waits
+imageCompressLevel = 6  # zlib level of the PNG files, from 1 (fast) to 9 (small)
+
+# Steps saved to disk (figure and training images) - The process pool allows lower values, down to 1
+snapshotEvery = 20
+
+# True keeps the saved images in a cache keyed by the maps of the step and the settings (SnapshotCache.py)
+# Replays (ReplayRun.py) and reruns with the same frames copy them instead of computing and encoding again
+# Delete cacheDir after changing how the images or the figure are made - The keys only cover maps and settings
+useCache = False
+cacheDir = 'frames/cache/'
+cacheMaxBytes = 2 * 1024 ** 3
+
+# True prints the memory allocated per step and the peak RSS every 100 steps (tracing slows the loop down)
+reportAllocations = False
+
+# True records every received frame (raw float32 and double maps) at full rate - see RunRecorder.py
+recordRun = False
+runDir = 'frames/runs/SimulatorData-3/'  # TODO --- CHANGE! ---
+
+# True streams the rendered figure of every snapshot to ffmpeg (VideoSink.py) - No PNG files to assemble afterwards
+# Segments of videoSegmentFrames frames: videoPath-000.mp4, videoPath-001.mp4, ...
+recordVideo = False
+videoPath = 'frames/video/SimulatorData-3/run'  # TODO --- CHANGE! ---
+videoFps = 15
+videoSegmentFrames = 900
+# "maps": the six maps tiled through colormap lookup tables (MapTiler, ColormapLUT.py), 10x+ cheaper
+# "figure": the whole rendered figure, with the trampling curve and titles
+videoFrames = "maps"
+
+# Stage timers (p50/p95/p99 per stage, fps and queue depths), summarized every metricsReportEvery seconds
+# The last summary is served as JSON on http://127.0.0.1:<metricsHttpPort>/metrics and published on a ZMQ PUB socket
+metricsReportEvery = 30
+printMetrics = True
+metricsHttpPort = None  # e.g. 8765
+metricsPubPort = None  # e.g. 5570
+
+# Legacy mode: the maps are received as they arrive and each socket is answered right away (FrameAssembler.py)
+# A frame still missing maps frameTimeout seconds after its first map arrived is dropped
+frameTimeout = 5
+
+# Pause at the end of each step - Set to 0 when benchmarking with ClientSimulator.py
+sleepTime = 1
+
+# Training images and figures, in the selected encoding - Encode time and size per kind are printed on exit
+# Created first: the process pool of ImageSink is forked before the zmq context and the threads exist
+if imageProcesses > 0:
+    encoder = ImageSink(imageEncoding, processes=imageProcesses, level=imageCompressLevel, maxInFlight=imageMaxInFlight)
+else:
+    encoder = ImageEncoder(imageEncoding, workers=imageEncoderThreads, level=imageCompressLevel)
 
 context = zmq.Context()
 
-# Vegetation Socket
-socketVegetation = context.socket(zmq.REP)
-socketVegetation.bind("tcp://*:5555")
-
-# Pressure Socket
-socketPressure = context.socket(zmq.REP)
-socketPressure.bind("tcp://*:5557")
-
-# Heightmap Socket
-socketHeight = context.socket(zmq.REP)
-socketHeight.bind("tcp://*:5558")
-
-# Distance Socket
-socketDistance = context.socket(zmq.REP)
-socketDistance.bind("tcp://*:6000")
-
-# Young Socket
-socketYoung = context.socket(zmq.REP)
-socketYoung.bind("tcp://*:5559")
+if useUnifiedEndpoint:
+    # Unified Socket
+    socketFrame = bind_unified_socket(context)
+else:
+    # One REP socket per map - Vegetation 5555, distance 6000, pressure 5557, height 5558 and Young 5559
+    # Any order: the assembler polls every socket
+    legacySockets = bind_legacy_sockets(context)
 
 # Counter
 idx = 0
@@ -56,269 +128,363 @@ minAccumulation = 0.0  # instead of np_array_height_accumulation.min()
 maxVegetation = 1
 minVegetation = 0
 
-# Distance travelled in array
-distances = []
-avgCompression = []
-widths = []
-passesArray = []
-avgVegetation = []
-
-# Second, set up the figure, the axis, and the plot element we want to animate
-fig, axes = plt.subplots(nrows=3, ncols=3, figsize=(10, 10))
-ax1, ax2, ax3, ax4, ax5, ax6, ax7, ax8, ax9 = axes.flatten()
-plt.subplots_adjust(hspace=0.5, wspace=0.5)
-
-# Super title
-fig.suptitle("Simulation Maps", fontsize=14, fontweight='bold')
-
-# Single titles
-ax1.set_title('Pressure')
-ax2.set_title('Compression')
+# Normalization ranges of the images, saved next to them (encoding.json) and part of the cache keys
+imageRanges = {
+    "input": [("pressure", minPressure, maxPressure), ("vegetation", 0, 1), ("young", minYoung, maxYoung)],
+    "output": [("compression", maxCompression, minCompression), ("vegetation", 0, 1),
+               ("accumulation", minAccumulation, maxAccumulation)],
+}
 
-ax4.set_title('Initial Vegetation')
-ax6.set_title('Vegetation')
+# Stacked images and one image per channel, saved every snapshotEvery steps
+IMAGE_SUFFIXES = ("-input", "-output", "-input-pressure", "-input-vegetation", "-input-young",
+                  "-output-compression", "-output-vegetation", "-output-accumulation")
 
-ax7.set_title('Initial Young Modulus')
-ax8.set_title('Vertical Accumulation')
-
-# Initial height
-np_array_initial_height = np.ones((257, 257))  # TODO: Set initial heightmap, instead of ones (in this case is 1.0)
-np_array_height = np.random.random((257, 257))
-np_array_height_difference = np.random.random((257, 257))
-
-# Reshape 1D array to 2D numpy array - TODO: Set terrain dimensions automatically
-np_array_pressure = np.random.random((257, 257))  # ax1
-np_array_height_compression = np.random.random((257, 257))  # ax2
-np_array_initial_vegetation = np.random.random((257, 257))  # ax3
-np_array_vegetation = np.random.random((257, 257))  # ax4
-np_array_initial_young = np.random.random((257, 257))  # ax5
-np_array_height_accumulation = np.random.random((257, 257))  # ax6
+# Distance travelled in array - Distances, passes and relative cover are kept by TramplingStats
+avgCompression = []
+widths = []
 
-
-while True:
-    idx += 1
+# Legacy replies, sent by the assembler as soon as a map arrives: each one only depends on its own map
+LEGACY_REPLIES = {
+    "vegetation": "vegetation_normalized",
+    "height": "difference",
+    "pressure": "pressure",
+    "young": "initial_young",
+    "distance": "distance",
+}
+
+# Reference maps - From the 4th frame (frame 3, idx == 4), or from the first one after it if it was dropped or
+# partial. Legacy mode captures each channel map by map in the assembler thread, on the first of its maps from
+# that frame on, and the server loop takes them over once it gets a frame from REFERENCE_FRAME on
+REFERENCE_FRAME = 3
+legacyReference = ReferenceCapture(REFERENCE_FRAME)
+referenced = False
+
+
+def reply_channel(store, name, frame, slot):
+    # Assembler thread - Only reads and writes the slot of the map, and the buffers of legacyReference
+    legacyReference.capture(store, name, frame, slot)
+    store.update_derived(slot, (name,), initialHeight=legacyReference.initial(store, "height"))
+    if name == "young":
+        return legacyReference.initial(store, "young")
+    return store.map(LEGACY_REPLIES[name], slot)
+
+
+# Terrain dimensions are set by the first frame (header in unified mode, size of the height map otherwise)
+# Preallocated buffers for the received and derived maps, filled with the first frame
+# Initial height is ones until the reference step - TODO: Set initial heightmap, instead of ones (in this case is 1.0)
+print("Waiting for the first frame...")
+if useUnifiedEndpoint:
+    compressor = PayloadCompressor(payloadCompression, compressionMinRatio)
+    atexit.register(lambda: print(compressor.summary()))
+    store, step = FrameStore.from_unified_socket(socketFrame, compressor=compressor)
+else:
+    assembler = FrameAssembler(legacySockets, reply_channel, staleTimeout=frameTimeout)
+    store = assembler.wait_store()
+print(f"Terrain dimensions: {store.shape[0]}x{store.shape[1]}")
+
+# Second, set up the figure once - each step only updates the panels that changed
+# Rendered off-screen only - It is drawn by the snapshot worker thread, and GUI backends must be driven from the
+# main thread
+renderer = SimulationRenderer(store.shape, headless=True)
+
+# Image cache - Summary printed after the encoder is closed, once the last images are stored
+cache = None
+if useCache:
+    cache = SnapshotCache(cacheDir, cacheMaxBytes)
+    atexit.register(lambda: print(cache.summary()))
+
+
+def close_encoder():
+    encoder.close()
+    print(encoder.summary())
+
+
+# Encoder closed on exit, before the cache summary is printed
+atexit.register(close_encoder)
+
+# One snapshot per queued step, plus the one being processed and the one being filled
+snapshotPool = SnapshotPool(store.shape, size=snapshotQueueSize + 2, imageDtype=encoder.dtype)
+
+# Trampling statistics - Cells with vegetation are indexed again when the reference maps are captured
+stats = TramplingStats(store.initial_vegetation)
+
+probe = AllocationProbe() if reportAllocations else None
+
+# Run recorder - Closed on exit, so the index counts every recorded step
+recorder = None
+if recordRun:
+    recorder = RunRecorder(runDir, store.shape)
+    atexit.register(recorder.close)
+
+# Video sink - Closed on exit, so the last segment is finalized
+video = None
+if recordVideo:
+    video = VideoSink(videoPath, fps=videoFps, segmentFrames=videoSegmentFrames)
+    tiler = MapTiler(store.shape) if videoFrames == "maps" else None
+
+    def close_video():
+        video.close()
+        print(video.summary())
+
+    atexit.register(close_video)
+
+# Stage metrics - Timers of the server loop (laps) and of the snapshot worker
+metricsSocket = None
+if metricsPubPort is not None:
+    metricsSocket = context.socket(zmq.PUB)
+    metricsSocket.bind(f"tcp://*:{metricsPubPort}")
+metrics = StageMetrics(metricsReportEvery, printMetrics, httpPort=metricsHttpPort, pubSocket=metricsSocket)
+laps = metrics.laps()
+
+
+def save_snapshot(snapshot):
+    # Runs in the snapshot pipeline worker, after the reply has been sent to Unity
+    idx = snapshot["idx"]
+    workerLaps = metrics.laps()
 
     # =============================================================
 
-    # TODO: 1 - Retrieving data
-    # Wait for next request from client
-    messageVegetation = socketVegetation.recv()
-    messageDistance = socketDistance.recv()
-    messagePressure = socketPressure.recv()
-    messageHeight = socketHeight.recv()
-    messageYoung = socketYoung.recv()
-
-    # =============================================================
+    # Create dir
+    dirData = 'frames/cvs/CGI/SimulatorData-3/'  # TODO --- CHANGE! ---
+    if not os.path.exists(dirData):
+        os.makedirs(dirData)
+    dirRGB = dirData + r'RGB/'  # TODO --- CHANGE! ---
+    if not os.path.exists(dirRGB):
+        os.makedirs(dirRGB)
 
-    # TODO: 3 - Reconvert byte array back to 2D numpy array of floats
-    float_array_vegetation = np.frombuffer(messageVegetation, dtype=np.float32)
-    float_distance = np.frombuffer(messageDistance, dtype=np.float32)
-    float_array_pressure = np.frombuffer(messagePressure, dtype=np.float32)
-    float_array_height = np.frombuffer(messageHeight, dtype=np.float32)
-    double_array_young = np.frombuffer(messageYoung, dtype=np.double)
+    # Encoding and normalization ranges of the images, saved with the first ones
+    if idx % snapshotEvery == 0 and encoder.ranges is None:
+        encoder.write_ranges(dirRGB, imageRanges)
 
     # =============================================================
 
-    # Reshape 1D array to 2D numpy array - TODO: Set terrain dimensions automatically
-    np_array_vegetation = np.reshape(float_array_vegetation, (257, 257))  # ax4
-    np_array_pressure = np.reshape(float_array_pressure, (257, 257))  # ax1
-    np_array_height = np.reshape(float_array_height, (257, 257))
-
-    if idx == 4:
-        np_array_initial_height = np.reshape(np_array_height, (257, 257))
-        np_array_initial_vegetation = np.reshape(float_array_vegetation, (257, 257))  # ax3
-        np_array_initial_young = np.reshape(double_array_young, (257, 257))  # ax5
+    # Cache - Images already saved by an earlier run from the same maps and settings are copied
+    # Nothing left to compute when both the figure and the images are cached and no video needs the plots
+    figureKey = imagesKey = None
+    figureCached = imagesCached = False
+    if cache is not None and idx % snapshotEvery == 0:
+        imagesKey = cache.key([snapshot[name] for name in SnapshotPool.MAPS],
+                              {"ranges": imageRanges, "encoding": encoder.encoding, "level": imageCompressLevel})
+        figureKey = cache.key([stats.passes[:snapshot["steps"]], stats.cover[:snapshot["steps"]]],
+                              {"images": imagesKey, "distance": float(snapshot["distance"])})
+        figureCached = cache.get(figureKey, [dirData + str(idx)])
+        imagesCached = cache.get(imagesKey, [dirRGB + str(idx) + suffix for suffix in IMAGE_SUFFIXES])
+        workerLaps.lap("worker-cache")
+        if figureCached and imagesCached and video is None:
+            return
 
     # =============================================================
 
-    # Append distance travelled by the character
-    distanceTravelled = float_distance.item()
-    passes = distanceTravelled / 7
-    distances.append(distanceTravelled)
-    passesArray.append(passes)
-
-    # Estimate compression and accumulation maps
-    np_array_height_difference = np_array_height - np_array_initial_height
-
-
-    np_array_height_compression = np.where(np_array_height_difference < 0, np_array_height_difference, 0)  # ax2
-    np_array_height_accumulation = np.where(np_array_height_difference > 0, np_array_height_difference, 0)  # ax4
-
+    # Normalize the values in each array to the range [0.0, 1.0] or # TODO: between 0 and 255
+    # Written in place into the buffers of the snapshot
+    normalized = snapshot["normalized"]
+    np_array_initial_vegetation_normalized = np.multiply(snapshot["initial_vegetation"], 255, out=normalized["initial_vegetation"])
+    np_array_vegetation_normalized = np.multiply(snapshot["vegetation"], 255, out=normalized["vegetation"])
+    np_array_pressure_normalized = normalize(snapshot["pressure"], minPressure, maxPressure, out=normalized["pressure"])
+    np_array_height_compression_normalized = normalize(snapshot["compression"], maxCompression, minCompression, out=normalized["compression"])
+    np_array_height_accumulation_normalized = normalize(snapshot["accumulation"], minAccumulation, maxAccumulation, out=normalized["accumulation"])
+    np_array_initial_young_normalized = normalize(snapshot["initial_young"], minYoung, maxYoung, out=normalized["initial_young"])
+    workerLaps.lap("worker-normalize")
 
     # =============================================================
 
-    # Create plots
-    # Second, set up the figure, the axis, and the plot element we want to animate
-    fig, axes = plt.subplots(nrows=3, ncols=3, figsize=(10, 10))
-    ax1, ax2, ax3, ax4, ax5, ax6, ax7, ax8, ax9 = axes.flatten()
-    plt.subplots_adjust(hspace=0.5, wspace=0.5)
-
-    # Super title
-    fig.suptitle("Simulation Maps", fontsize=14, fontweight='bold')
-
-    # Single titles
-    ax1.set_title('Pressure')
-    ax2.set_title('Compression')
-    ax3.set_title('Compression Width')
-    ax4.set_title('Initial Vegetation')
-    ax5.set_title('Vegetation Trampling')
-    ax6.set_title('Vegetation')
-    ax7.set_title('Initial Young Modulus')
-    ax8.set_title('Vertical Accumulation')
-    ax9.set_title('Avg. Compression vs. Distance Travelled')
+    # Update plots - Trampling curve, maps and distance travelled
+    # The history is only appended to by the server loop, the first "steps" entries are stable
+    renderer.update({
+        "pressure": np_array_pressure_normalized,
+        "compression": np_array_height_compression_normalized,
+        "initial_vegetation": np_array_initial_vegetation_normalized,
+        "vegetation": np_array_vegetation_normalized,
+        "initial_young": np_array_initial_young_normalized,
+        "accumulation": np_array_height_accumulation_normalized,
+    }, stats.passes[:snapshot["steps"]], stats.cover[:snapshot["steps"]], snapshot["distance"], stats.tick_values)
+    workerLaps.lap("worker-plot")
+
+    if video is not None:
+        video.write(renderer.to_array() if tiler is None else tiler.render(normalized))
+        workerLaps.lap("worker-video")
 
     # =============================================================
 
-    # Create dir
-    dirData = 'frames/cvs/CGI/SimulatorData-3/'  # TODO --- CHANGE! ---
-    if not os.path.exists(dirData):
-        os.makedirs(dirData)
-    dirRGB = dirData + r'RGB/'  # TODO --- CHANGE! ---
-    if not os.path.exists(dirRGB):
-        os.makedirs(dirRGB)
-
-    # =============================================================
+    # TODO: Set min (YoungGround) and max (YoungGround + 1*YoungVegetation) values automatically
+    """UNCOMMENT"""
+    if idx % snapshotEvery == 0 and not figureCached:
+        # Figure saved as an 8-bit PNG by the encoder, from the blitted buffer
+        encoder.write([(dirData + str(idx), renderer.to_array())], encoding="uint8", kind="figure",
+                      done=None if figureKey is None else cache.on_written(figureKey))
+        workerLaps.lap("worker-figure")
 
-    # Normalize the values in each array to the range [0.0, 1.0] or # TODO: between 0 and 255
-    np_array_initial_vegetation_normalized = np_array_initial_vegetation * 255
-    np_array_vegetation_normalized = np_array_vegetation * 255
-    np_array_pressure_normalized = ((np_array_pressure - minPressure) / (maxPressure - minPressure)) * 255
-    np_array_height_compression_normalized = ((np_array_height_compression - maxCompression) / (minCompression - maxCompression)) * 255
-    np_array_height_accumulation_normalized = ((np_array_height_accumulation - minAccumulation) / (maxAccumulation - minAccumulation)) * 255
-    np_array_initial_young_normalized = ((np_array_initial_young - minYoung) / (maxYoung - minYoung)) * 255
+    # Print hex colors
+    #cmap = cm.get_cmap('Blues', 5)  # PiYG
+    #for i in range(cmap.N):
+    #    rgba = cmap(i)
+    #    # rgb2hex accepts rgb or rgba
+    #    print('Blues' + matplotlib.colors.rgb2hex(rgba))
 
     # =============================================================
 
-    # Find the non-zero elements in A
-    A = np_array_initial_vegetation[np_array_initial_vegetation != 0]
+    if idx % snapshotEvery == 0 and not imagesCached:
+        start = time.perf_counter()
+
+        # Stack the arrays into the preallocated RGB buffers, in the dtype of the image encoding
+        input_array = encoder.convert((np_array_pressure_normalized,
+                                       np_array_initial_vegetation_normalized,
+                                       np_array_initial_young_normalized), out=snapshot["input_rgb"])
+        output_array = encoder.convert((np_array_height_compression_normalized,
+                                        np_array_vegetation_normalized,
+                                        np_array_height_accumulation_normalized), out=snapshot["output_rgb"])
+
+        # Stacked images and one image per channel (IMAGE_SUFFIXES) - The extension depends on the encoding
+        images = (input_array, output_array, input_array[..., 0], input_array[..., 1], input_array[..., 2],
+                  output_array[..., 0], output_array[..., 1], output_array[..., 2])
+        encoder.write([(dirRGB + str(idx) + suffix, image) for suffix, image in zip(IMAGE_SUFFIXES, images)],
+                      done=None if imagesKey is None else cache.on_written(imagesKey, time.perf_counter() - start))
+        workerLaps.lap("worker-images")
+
+
+def process_snapshot(snapshot):
+    try:
+        save_snapshot(snapshot)
+    finally:
+        snapshotPool.release(snapshot)
+
+
+# Plots and images are produced by a single worker, so the figure is only touched by one thread
+pipeline = SnapshotPipeline(process_snapshot, maxQueue=snapshotQueueSize, policy=snapshotPolicy,
+                            sampleEvery=snapshotSampleEvery, workers=1, onDrop=snapshotPool.release)
+
+# Queue depths sampled at each metrics report
+metrics.gauge("snapshot_queue", pipeline.depth)
+metrics.gauge("snapshots_dropped", lambda: pipeline.dropped)
+if isinstance(encoder, ImageSink):
+    metrics.gauge("images_in_flight", encoder.in_flight)
+if not useUnifiedEndpoint:
+    metrics.gauge("frames_dropped", lambda: assembler.dropped)
+if cache is not None:
+    metrics.gauge("cache_hit_rate", lambda: round(cache.hit_rate(), 2))
+    metrics.gauge("cache_saved_s", lambda: round(cache.savedSeconds, 1))
+
+# Delta replies - Bytes sent per reply are printed on exit
+deltaEncoder = None
+if useUnifiedEndpoint and allowDeltaReplies:
+    deltaEncoder = DeltaEncoder()
+    atexit.register(lambda: print(deltaEncoder.summary()))
+    metrics.gauge("reply_kib", lambda: round(deltaEncoder.bytesSent / max(deltaEncoder.replies, 1) / 1024, 1))
+if useUnifiedEndpoint:
+    metrics.gauge("compression_saved_mib", lambda: round((compressor.bytesIn - compressor.bytesOut) / 1024 / 1024, 1))
+    metrics.gauge("compression_ms", lambda: round((compressor.compressNs + compressor.decompressNs) * 1e-6))
 
-    # Corresponding elements in B
-    B = np_array_vegetation[np_array_initial_vegetation != 0]
 
-    # Calculate the percentage decrement
-    percentage_decrement = (B / A) * 100
-
-    # Get the average percentage decrement
-    average_percentage_remaining = np.mean(percentage_decrement).astype(float)
-    avgVegetation.append(average_percentage_remaining)
+while True:
+    idx += 1
+    if probe is not None:
+        probe.start()
+    laps.start()
 
     # =============================================================
 
-    # Get number of passes
-    print(f"Remaining {average_percentage_remaining}%")
-    print(f"Passes: {distanceTravelled/7}")
+    # TODO: 1 - Retrieving data
+    # Wait for next request from client - Maps are received straight into the ring buffers of the store
+    # The receive of a step also measures the time spent waiting for Unity
+    if useUnifiedEndpoint:
+        # The first frame has already been received while setting the terrain dimensions
+        if idx > 1:
+            store.advance()
+            # Single multipart message, checked against the shape and dtypes announced in the header
+            step = store.recv_frame_into(socketFrame)
+            laps.lap("recv")
+        frame = idx - 1  # Every message is a complete frame
+    else:
+        # Complete frame from the assembler - Its maps arrived in any order and were answered on arrival
+        # Frame number counted from 0, with gaps after dropped frames
+        frame = assembler.next_frame()
+        laps.lap("recv")
 
     # =============================================================
 
-    ax5.plot(passesArray, avgVegetation, linestyle='-', color='green', label='vegetation')
-    ax5.set_xlim(1, np.max(passesArray))
-    ax5.set_xticks(np.arange(0, 101, 10))  # Sets x-axis ticks at 0, 10, 20, ..., 100
-    ax5.set_xticks([25, 75, 200, 500])
-    # Get the x-ticks (vertical gridlines)
-    xticks = ax5.get_xticks()
+    # Views on the current step
+    np_array_vegetation = store.vegetation  # ax4
+    np_array_pressure = store.pressure  # ax1
+    np_array_height = store.height
 
-    # Plot a marker at each vertical gridline
-    for x in xticks:
-        y = np.interp(x, passesArray, avgVegetation)  # Interpolate to find the y-value at this x
-        ax5.plot(x, y, color='green', marker='o')
-        ax5.annotate('{:.0f}'.format(y), (x, y), textcoords="offset points", xytext=(10, -10), ha='center', weight="bold")
+    if not referenced and frame >= REFERENCE_FRAME:
+        # Legacy mode: captured by reply_channel as the maps of this frame (or earlier ones) arrived
+        if useUnifiedEndpoint:
+            store.set_reference()
+        else:
+            legacyReference.apply(store)
+        stats.set_reference(store.initial_vegetation)
+        referenced = True
 
-    ax5.set_xlabel('Number of passes')
-    ax5.set_ylabel('Relative cover after trampling (%)')
-    ax5.legend()  # This displays the legend
-    ax5.grid(True)
+    np_array_initial_vegetation = store.initial_vegetation  # ax3
+    np_array_initial_young = store.initial_young  # ax5
 
     # =============================================================
 
-    mapInitialVegetation = ax4.imshow(np_array_initial_vegetation_normalized, cmap="Greens", interpolation='nearest', vmin=0, vmax=255)
-    mapVegetation = ax6.imshow(np_array_vegetation_normalized, cmap="Greens", interpolation='nearest', vmin=0, vmax=255)
-    mapPressure = ax1.imshow(np_array_pressure_normalized, cmap='Reds', interpolation='nearest', vmin=0, vmax=255)
+    # Distance travelled by the character
+    distanceTravelled = store.distance.item()
 
-    mapHeightCompression = ax2.imshow(np_array_height_compression_normalized, cmap="Reds", interpolation='nearest', vmin=0, vmax=255)
-    mapHeightAccumulation = ax8.imshow(np_array_height_accumulation_normalized, cmap="Blues", interpolation='nearest', vmin=0, vmax=255)
-    mapInitialYoung = ax7.imshow(np_array_initial_young_normalized, cmap='Blues', interpolation='nearest', vmin=0, vmax=255)
+    # Estimate compression and accumulation maps, and normalize the vegetation sent back to Unity
+    # The other maps are normalized in the background - Legacy mode: computed map by map by reply_channel
+    if useUnifiedEndpoint:
+        store.update_derived()
+        laps.lap("derived")
 
     # =============================================================
 
-    # Add text to the upper left corner of the subplot
-    ax2.text(0.05, 0.95, f"Dist: {distanceTravelled:.1f}m", transform=ax2.transAxes, fontsize=14, verticalalignment='top')
+    # TODO: 2 - Send reply to the client
+    # Reply right away, plots and images are produced by the snapshot pipeline
+    # Buffers are sent without copy, they are only rewritten once Unity has received them
+    # Legacy mode: each socket has already been answered with LEGACY_REPLIES by the assembler
+    if useUnifiedEndpoint:
+        # Single multipart reply, with the dtypes expected by the DataClientXXX.cs scripts
+        replyMaps = {
+            "vegetation": store.vegetation_normalized,
+            "height": store.difference,
+            "pressure": store.pressure,
+            "young": store.initial_young,
+            "distance": store.distance,
+        }
+        replyRequest = store.header.get("reply", {})
+        if deltaEncoder is not None and replyRequest.get("encoding") == "delta":
+            deltaEncoder.send(socketFrame, idx, store.shape, replyMaps, replyRequest, compressor)
+        else:
+            send_frame(socketFrame, idx, store.shape, replyMaps, compressor=compressor)
+        laps.lap("reply")
 
     # =============================================================
 
-    # TODO: Set min (YoungGround) and max (YoungGround + 1*YoungVegetation) values automatically
-    """UNCOMMENT"""
-    if idx % 20 == 0: # 20
-        plt.savefig(dirData + str(idx) + ".png")  # save the figure to file
+    # Relative cover over the cells with initial vegetation, distance, passes and compression statistics
+    average_percentage_remaining = stats.update(np_array_vegetation, store.compression, distanceTravelled)
 
-    # Print hex colors
-    #cmap = cm.get_cmap('Blues', 5)  # PiYG
-    #for i in range(cmap.N):
-    #    rgba = cmap(i)
-    #    # rgb2hex accepts rgb or rgba
-    #    print('Blues' + matplotlib.colors.rgb2hex(rgba))
+    # =============================================================
 
-    # TODO: 2 - Send reply to the client
-    # In the real world usage, after you finish your work, send your output here
+    # Get number of passes
+    print(f"Remaining {average_percentage_remaining}%")
+    print(f"Passes: {distanceTravelled/7}")
+    laps.lap("stats")
 
     # =============================================================
 
-    if idx % 20 == 0:
-        input_array = np.dstack((np_array_pressure_normalized,
-                             np_array_initial_vegetation_normalized,
-                             np_array_initial_young_normalized))
-        output_array = np.dstack((np_array_height_compression_normalized,
-                              np_array_vegetation_normalized,
-                              np_array_height_accumulation_normalized))
-
-        input_image = Image.fromarray(np.uint8(input_array))
-        output_image = Image.fromarray(np.uint8(output_array))
-
-        input_image.save(dirRGB + str(idx) + "-input.png")
-        output_image.save(dirRGB + str(idx) + "-output.png")
-
-        input_image_pressure = Image.fromarray(np.uint8(np_array_pressure_normalized))
-        input_image_vegetation = Image.fromarray(np.uint8(np_array_initial_vegetation_normalized))
-        input_image_young = Image.fromarray(np.uint8(np_array_initial_young_normalized))
-        input_image_pressure.save(dirRGB + str(idx) + "-input-pressure.png")
-        input_image_vegetation.save(dirRGB + str(idx) + "-input-vegetation.png")
-        input_image_young.save(dirRGB + str(idx) + "-input-young.png")
-
-        output_image_compression = Image.fromarray(np.uint8(np_array_height_compression_normalized))
-        output_image_vegetation = Image.fromarray(np.uint8(np_array_vegetation_normalized))
-        output_image_accumulation = Image.fromarray(np.uint8(np_array_height_accumulation_normalized))
-        output_image_compression.save(dirRGB + str(idx) + "-output-compression.png")
-        output_image_vegetation.save(dirRGB + str(idx) + "-output-vegetation.png")
-        output_image_accumulation.save(dirRGB + str(idx) + "-output-accumulation.png")
+    # Record the raw maps received - Legacy mode has no step id, the loop index is used instead
+    if recorder is not None:
+        recorder.append(step if useUnifiedEndpoint else idx, store.current())
+        laps.lap("record")
 
     # =============================================================
 
-    # Vegetation
-    #socketVegetation.send_string(" -> Received Vegetation!")
-    np_array_vegetation_normalized_1d = np_array_vegetation_normalized.ravel()
-    np_array_vegetation_normalized_1d_bytes = np_array_vegetation_normalized_1d.tobytes()
-    socketVegetation.send(np_array_vegetation_normalized_1d_bytes)
-
-    # Heightmap
-    #socketHeight.send_string(" -> Received Height!")
-    np_array_height_difference_1d = np_array_height_difference.ravel()
-    np_array_height_difference_1d_bytes = np_array_height_difference_1d.tobytes()
-    socketHeight.send(np_array_height_difference_1d_bytes)
-
-    # Pressure
-    #socketPressure.send_string(" -> Received Pressure!")
-    np_array_pressure_1d = np_array_pressure.ravel()
-    np_array_pressure_1d_bytes = np_array_pressure_1d.tobytes()
-    socketPressure.send(np_array_pressure_1d_bytes)
-
-    # Youngs
-    #socketYoung.send_string(" -> Received Youngs!")
-    np_array_initial_young_1d = np_array_initial_young.ravel()
-    np_array_initial_young_1d_bytes = np_array_initial_young_1d.tobytes()
-    socketYoung.send(np_array_initial_young_1d_bytes)
-
-    # Distance
-    #socketDistance.send_string(" -> Received Distance!")
-    float_distance_bytes = float_distance.tobytes()
-    socketDistance.send(float_distance_bytes)
-
-    time.sleep(1)
\ No newline at end of file
+    # Hand the step over to the snapshot pipeline - Steps saved to disk are the last ones to be dropped
+    # The maps are copied into a preallocated snapshot, the store is rewritten on the next steps
+    snapshot = snapshotPool.acquire(store)
+    if snapshot is not None:
+        snapshot["idx"] = idx
+        snapshot["distance"] = distanceTravelled
+        snapshot["steps"] = stats.length
+        pipeline.submit(snapshot, keep=(idx % snapshotEvery == 0))
+    laps.lap("snapshot")
+
+    if probe is not None:
+        probe.stop()
+    metrics.step()
+
+    time.sleep(sleepTime)
@@ -1,10 +1,13 @@
-import random
-import time
 import zmq
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-import os
+from FrameProtocol import grid_shape_from_bytes
+from ColormapLUT import colormap_lut, apply_lut
+from VideoSink import VideoSink
+
+# Video of the maps, side by side: heightmap and vegetation living ratio
+# The maps are colored through lookup tables and piped to ffmpeg, no figure is drawn - see VideoSink.py
+videoPath = 'animation'  # Segments animation-000.mp4, animation-001.mp4, ...
+videoFps = 15
 
 # Set up ZeroMQ context and sockets
 context = zmq.Context()
@@ -18,20 +21,12 @@ socketVegetation.bind("tcp://*:5555")
 # Counter
 idx = 0
 
-# Set up the figure and axes for the animation
-fig, (ax1, ax2) = plt.subplots(1, 2)
-fig.suptitle("Maps")
-ax1.set_title('Heightmap')
-ax2.set_title('Vegetation - Living Ratio')
-
-# Generate initial data for the animation
-np_array_height = np.random.random((257, 257))
-np_array_vegetation = np.random.random((257, 257))
-mapTerrain = ax1.imshow(np_array_height, cmap="coolwarm", interpolation='nearest', vmin=0.9, vmax=1.1)
-mapVegetation = ax2.imshow(np_array_vegetation, cmap="YlGn", interpolation='nearest', vmin=0, vmax=1)
+# Colormaps of the former figure: coolwarm from 0.9 to 1.1, YlGn from 0 to 1
+lutHeight = colormap_lut("coolwarm")
+lutVegetation = colormap_lut("YlGn")
+video = VideoSink(videoPath, fps=videoFps)
 
-# Define a generator function to produce frames for the animation
-def generate_frames():
+try:
     while True:
         # Retrieve data from ZeroMQ sockets
         messageVegetation = socketVegetation.recv()
@@ -41,34 +36,21 @@ def generate_frames():
         float_array_vegetation = np.frombuffer(messageVegetation, dtype=np.float32)
         float_array_height = np.frombuffer(messageHeight, dtype=np.float32)
 
-        # Reshape 1D array to 2D numpy array
-        np_array_height = np.reshape(float_array_height, (257, 257))
-        np_array_vegetation = np.reshape(float_array_vegetation, (257, 257))
-
-        # Update the plot elements with the new data
-        mapTerrain.set_array(np_array_height)
-        mapVegetation.set_array(np_array_vegetation)
+        # Reshape 1D array to 2D numpy array - Terrain dimensions from the size of the height map
+        shape = grid_shape_from_bytes(len(messageHeight), np.float32)
+        np_array_height = np.reshape(float_array_height, shape)
+        np_array_vegetation = np.reshape(float_array_vegetation, shape)
 
         # Send acknowledgement back to clients
         socketHeight.send(b"Height Map received!")
         socketVegetation.send(b"Vegetation Map received!")
 
-        # Yield the updated plot as a new frame for the animation
-        yield [mapTerrain, mapVegetation]
-
-# Define the update function for the animation
-def update_plot(frame):
-    for artist in frame:
-        artist.changed()
-    return frame
-
-# Create the animation
-ani = animation.FuncAnimation(fig, update_plot, frames=generate_frames(), blit=True)
-
-# Save the animation as a video
-Writer = animation.writers['ffmpeg']
-writer = Writer(fps=15, metadata=dict(artist='Me'), bitrate=1800)
-ani.save('animation.mp4', writer=writer)
-
-# Show the animation (this is optional)
-plt.show()
+        # Both maps in one frame
+        video.write(np.hstack((apply_lut(np_array_height, lutHeight, 0.9, 1.1),
+                               apply_lut(np_array_vegetation, lutVegetation, 0, 1))))
+        idx += 1
+except KeyboardInterrupt:
+    pass
+finally:
+    video.close()
+    print(video.summary())
@@ -0,0 +1,389 @@
+#
+#   Multi-session server: several Unity simulations (characters, seasons) against one machine
+#   A ROUTER front end on the unified port (5560) accepts the messages of any number of clients, in the
+#   unified layout of FrameProtocol.py. The session id is the "session" field of the header, or the
+#   connection of the client when it has none, and it tags every frame forwarded to the workers.
+#   Each session is pinned to one worker process on its first frame (the one with the fewest sessions),
+#   so its reference maps, statistics and dataset writes stay in that process, and the sessions spread
+#   over the workers: the throughput scales with the cores until there are more workers than sessions.
+#
+#   Broker <-> workers (DEALER, connected to the back end):
+#       worker -> [b"ready"]                                 on start
+#       broker -> [b"frame", session, client, header, payloads...]
+#       worker -> [b"reply", client, header, payloads...]   reply of the step, then stats and images
+#       broker -> [b"close", session]                        session idle for sessionTimeout seconds
+#       worker -> [b"closed", session, summary]
+#       broker -> [b"stop"], worker -> [b"stopped"]          on exit, after closing its sessions
+#   Each session writes into outputDir/<session>/run-<n>/: the images every snapshotEvery steps (RGB/, as
+#   ServerSimulator.py) and the trampling statistics (trampling.npz) when it is closed.
+#   A session seen again after being closed (or after a restart of the broker) starts over in the next run
+#   directory, the outputs of its previous runs are kept.
+#   A frame a worker cannot process (bad header, corrupt payload...) is answered with an error reply. If a
+#   worker process dies anyway, its waiting clients get an error and its sessions move to the other workers.
+#
+
+import json
+import multiprocessing
+import os
+import re
+import signal
+import time
+import numpy as np
+import zmq
+from FrameProtocol import UNIFIED_PORT, decode_header, encode_frame
+from FrameStore import FrameStore, normalize
+from ImageEncoding import ImageEncoder
+from PayloadCompression import PayloadCompressor
+from ReplyEncoding import DeltaEncoder
+from StageMetrics import StageMetrics
+from TramplingStats import TramplingStats
+
+# Settings
+frontPort = UNIFIED_PORT  # Unity connects exactly as it does to ServerSimulator.py in unified mode
+backendAddress = "tcp://127.0.0.1:5561"
+workers = os.cpu_count() or 1  # Worker processes
+sessionTimeout = 60  # Seconds without frames before a session is closed
+outputDir = 'frames/sessions/'  # TODO --- CHANGE! ---
+
+# Dataset written by each session
+snapshotEvery = 20
+imageEncoding = "uint8"  # "uint8", "uint16", "float16" or "float32", see ImageEncoding.py
+imageCompressLevel = 6
+
+# Replies, as ServerSimulator.py
+allowDeltaReplies = True
+payloadCompression = ("lz4", "zstd", "zlib")
+compressionMinRatio = 1.5
+
+# Metrics of the broker - Round trip of each step through a worker, sessions open
+metricsReportEvery = 30
+printMetrics = True
+metricsHttpPort = None  # e.g. 8766
+
+# Normalization ranges, as ServerSimulator.py
+maxPressure = 5000000
+minPressure = 0
+maxYoung = 1250000
+minYoung = 250000
+maxCompression = 0
+minCompression = -0.05
+maxAccumulation = 0.05
+minAccumulation = 0.0
+
+
+def session_directory(name):
+    return os.path.join(outputDir, re.sub(r"[^\w.-]", "_", name))
+
+
+def run_directory(name):
+    """Creates the next run directory of a session, outputDir/<session>/run-<n>/, and returns it."""
+    base = session_directory(name)
+    os.makedirs(base, exist_ok=True)
+    runs = [re.fullmatch(r"run-(\d+)", entry) for entry in os.listdir(base)]
+    number = max((int(run.group(1)) for run in runs if run), default=0) + 1
+    while True:
+        # Claimed with mkdir, in case another worker opens the same session meanwhile
+        directory = os.path.join(base, f"run-{number}")
+        try:
+            os.mkdir(directory)
+            return directory
+        except FileExistsError:
+            number += 1
+
+
+def error_frame(message):
+    """Reply without channels, sent when a frame cannot be processed, so the client is not left waiting."""
+    return [json.dumps({"step": -1, "shape": [0, 0], "channels": [], "error": message}).encode("utf-8")]
+
+
+class Session:
+    """State of one simulation, in its worker: maps, statistics and images, as in ServerSimulator.py."""
+
+    def __init__(self, name, shape):
+        self.name = name
+        self.directory = run_directory(name)
+        self.dirRGB = os.path.join(self.directory, "RGB", "")
+        os.makedirs(self.dirRGB, exist_ok=True)
+
+        # A session only holds one step: its client waits for the reply before sending the next one
+        self.store = FrameStore(shape, depth=1)
+        self.store.compressor = PayloadCompressor(payloadCompression, compressionMinRatio)
+        self.deltaEncoder = DeltaEncoder()
+        self.stats = TramplingStats(self.store.initial_vegetation)
+        self.encoder = ImageEncoder(imageEncoding, level=imageCompressLevel)
+        self.normalized = {name: np.zeros(shape, dtype=np.float32) for name in
+                           ("pressure", "compression", "accumulation", "vegetation", "initial_vegetation", "initial_young")}
+        self.inputRGB = self.encoder.empty(tuple(shape) + (3,))
+        self.outputRGB = self.encoder.empty(tuple(shape) + (3,))
+        self.idx = 0
+        self.start = time.perf_counter()
+
+    def step(self, header, payloads):
+        """Loads a frame and returns the frames of its reply."""
+        store = self.store
+        store.load_frame(header, payloads)
+        self.idx += 1
+
+        if self.idx == 4:
+            store.set_reference()
+            self.stats.set_reference(store.initial_vegetation)
+        store.update_derived()
+
+        maps = {
+            "vegetation": store.vegetation_normalized,
+            "height": store.difference,
+            "pressure": store.pressure,
+            "young": store.initial_young,
+            "distance": store.distance,
+        }
+        request = header.get("reply", {})
+        if allowDeltaReplies and request.get("encoding") == "delta":
+            return self.deltaEncoder.encode(self.idx, store.shape, maps, request.get("base", -1),
+                                            request.get("float32", False), store.compressor)
+        return encode_frame(self.idx, store.shape, maps, compressor=store.compressor)
+
+    def after_reply(self):
+        store = self.store
+        self.stats.update(store.vegetation, store.compression, store.distance.item())
+        if self.idx % snapshotEvery == 0:
+            self.save_images()
+
+    def save_images(self):
+        store, normalized, idx = self.store, self.normalized, self.idx
+        np.multiply(store.initial_vegetation, 255, out=normalized["initial_vegetation"])
+        np.multiply(store.vegetation, 255, out=normalized["vegetation"])
+        normalize(store.pressure, minPressure, maxPressure, out=normalized["pressure"])
+        normalize(store.compression, maxCompression, minCompression, out=normalized["compression"])
+        normalize(store.accumulation, minAccumulation, maxAccumulation, out=normalized["accumulation"])
+        normalize(store.initial_young, minYoung, maxYoung, out=normalized["initial_young"])
+
+        if self.encoder.ranges is None:
+            self.encoder.write_ranges(self.dirRGB, {
+                "input": [("pressure", minPressure, maxPressure), ("vegetation", 0, 1), ("young", minYoung, maxYoung)],
+                "output": [("compression", maxCompression, minCompression), ("vegetation", 0, 1),
+                           ("accumulation", minAccumulation, maxAccumulation)],
+            })
+        inputArray = self.encoder.convert((normalized["pressure"], normalized["initial_vegetation"],
+                                           normalized["initial_young"]), out=self.inputRGB)
+        outputArray = self.encoder.convert((normalized["compression"], normalized["vegetation"],
+                                            normalized["accumulation"]), out=self.outputRGB)
+        basePath = self.dirRGB + str(idx)
+        self.encoder.write([
+            (basePath + "-input", inputArray),
+            (basePath + "-output", outputArray),
+            (basePath + "-input-pressure", inputArray[..., 0]),
+            (basePath + "-input-vegetation", inputArray[..., 1]),
+            (basePath + "-input-young", inputArray[..., 2]),
+            (basePath + "-output-compression", outputArray[..., 0]),
+            (basePath + "-output-vegetation", outputArray[..., 1]),
+            (basePath + "-output-accumulation", outputArray[..., 2]),
+        ])
+
+    def close(self):
+        """Writes the trampling statistics, returns the summary of the session."""
+        self.encoder.close()
+        np.savez(os.path.join(self.directory, "trampling.npz"),
+                 **{name: getattr(self.stats, name) for name in TramplingStats.SERIES})
+        elapsed = time.perf_counter() - self.start
+        cover = self.stats.cover[-1] if self.stats.length else float("nan")
+        return (f"Session {self.name}: {self.idx} steps in {elapsed:.0f}s, {self.encoder.images} images, "
+                f"cover {cover:.1f}%, {self.directory}")
+
+
+def run_worker(index):
+    # Stopped by the broker, after its sessions are closed
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    context = zmq.Context()
+    socket = context.socket(zmq.DEALER)
+    socket.setsockopt(zmq.IDENTITY, f"worker-{index}".encode())
+    socket.connect(backendAddress)
+    socket.send(b"ready")
+
+    sessions = {}
+    while True:
+        frames = socket.recv_multipart(copy=False)
+        command = frames[0].bytes
+
+        if command == b"frame":
+            name, client = frames[1].bytes.decode("utf-8"), frames[2]
+            session = None
+            try:
+                header = decode_header(frames[3].buffer)
+                session = sessions.get(name)
+                if session is None:
+                    session = sessions[name] = Session(name, header["shape"])
+                reply = session.step(header, [frame.buffer for frame in frames[4:]])
+            except Exception as error:
+                # Any bad frame (header, shape, corrupt compressed payload...) is answered, the worker and the
+                # other sessions it holds keep running
+                print(f"Session {name}: frame rejected, {type(error).__name__}: {error}")
+                reply, session = error_frame(f"{type(error).__name__}: {error}"), None
+            socket.send_multipart([b"reply", client] + reply, copy=False)
+            if session is not None:
+                try:
+                    session.after_reply()
+                except Exception as error:
+                    print(f"Session {name}: statistics or images of step {session.idx} failed, {error}")
+
+        elif command == b"close":
+            name = frames[1].bytes.decode("utf-8")
+            session = sessions.pop(name, None)
+            if session is not None:
+                socket.send_multipart([b"closed", name.encode("utf-8"), session.close().encode("utf-8")])
+
+        elif command == b"stop":
+            for name, session in sessions.items():
+                socket.send_multipart([b"closed", name.encode("utf-8"), session.close().encode("utf-8")])
+            socket.send(b"stopped")
+            break
+
+    socket.close(linger=1000)
+    context.term()
+
+
+class SessionBroker:
+    """Routes the frames of the clients to the worker of their session, and the replies back."""
+
+    def __init__(self, frontend, backend, metrics, processes=None):
+        self.frontend = frontend
+        self.backend = backend
+        self.metrics = metrics
+        self.processes = processes or {}  # worker id -> process, checked every poll
+        self.workers = {}  # worker id -> sessions
+        self.sessions = {}  # session -> worker id
+        self.lastSeen = {}  # session -> time of its last frame
+        self.inFlight = {}  # client -> (time its frame was received, worker id)
+        self.closed = 0
+
+        metrics.gauge("sessions", lambda: len(self.sessions))
+        metrics.gauge("workers", lambda: len(self.workers))
+
+    def run(self):
+        poller = zmq.Poller()
+        poller.register(self.backend, zmq.POLLIN)
+        while True:
+            # Frames wait in the front end until a worker is ready
+            if self.workers and self.frontend not in dict(poller.sockets):
+                poller.register(self.frontend, zmq.POLLIN)
+            events = dict(poller.poll(1000))
+            if self.backend in events:
+                self._from_worker(self.backend.recv_multipart(copy=False))
+            if self.frontend in events:
+                self._from_client(self.frontend.recv_multipart(copy=False))
+            self._check_workers()
+            self._close_idle()
+
+    def stop(self, timeout=30):
+        """Closes every session and waits for the workers to write their outputs."""
+        for worker in self.workers:
+            self.backend.send_multipart([worker, b"stop"])
+        stopping, deadline = set(self.workers), time.perf_counter() + timeout
+        while stopping and time.perf_counter() < deadline:
+            if self.backend.poll(100):
+                frames = self.backend.recv_multipart(copy=False)
+                if frames[1].bytes == b"stopped":
+                    stopping.discard(frames[0].bytes)
+                else:
+                    self._from_worker(frames)
+        self.sessions.clear()
+
+    # =============================================================
+
+    def _from_client(self, frames):
+        # REQ envelope: [client, b"", header, payloads...]
+        client = frames[0].bytes
+        try:
+            header = json.loads(frames[2].bytes)
+            name = str(header.get("session") or client.hex())
+        except (IndexError, ValueError) as error:
+            self.frontend.send_multipart([client, b""] + error_frame(f"Not a unified frame: {error}"))
+            return
+
+        worker = self.sessions.get(name)
+        if worker is None:
+            worker = self._assign(name)
+        self.lastSeen[name] = time.perf_counter()
+        self.inFlight[client] = (time.perf_counter_ns(), worker)
+        self.backend.send_multipart([worker, b"frame", name.encode("utf-8"), client] + frames[2:], copy=False)
+
+    def _from_worker(self, frames):
+        worker, command = frames[0].bytes, frames[1].bytes
+        if command == b"reply":
+            client = frames[2].bytes
+            self.frontend.send_multipart([client, b""] + frames[3:], copy=False)
+            inFlight = self.inFlight.pop(client, None)
+            if inFlight is not None:
+                self.metrics.add("session-step", time.perf_counter_ns() - inFlight[0])
+            self.metrics.step()
+        elif command == b"ready":
+            self.workers[worker] = set()
+        elif command == b"closed":
+            self.closed += 1
+            print(frames[3].bytes.decode("utf-8"))
+
+    def _assign(self, name):
+        worker = min(self.workers, key=lambda candidate: len(self.workers[candidate]))
+        self.workers[worker].add(name)
+        self.sessions[name] = worker
+        print(f"Session {name} -> {worker.decode()} ({session_directory(name)})")
+        return worker
+
+    def _check_workers(self):
+        """
+        A worker process that died is forgotten: its clients waiting for a reply get an error, and its sessions
+        are assigned to the other workers on their next frame (starting over, in a new run directory).
+        """
+        for worker, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+            del self.processes[worker]
+            sessions = self.workers.pop(worker, set())
+            print(f"{worker.decode()} died (exit code {process.exitcode}), "
+                  f"sessions {', '.join(sorted(sessions)) or '-'} are reassigned")
+            for name in sessions:
+                self.sessions.pop(name, None)
+                self.lastSeen.pop(name, None)
+            for client, (_, owner) in list(self.inFlight.items()):
+                if owner == worker:
+                    del self.inFlight[client]
+                    self.frontend.send_multipart([client, b""] + error_frame(f"{worker.decode()} died"))
+            if not self.processes:
+                raise RuntimeError("Every worker process died")
+
+    def _close_idle(self):
+        now = time.perf_counter()
+        for name in [name for name, seen in self.lastSeen.items() if now - seen > sessionTimeout]:
+            worker = self.sessions.pop(name)
+            self.workers[worker].discard(name)
+            del self.lastSeen[name]
+            self.backend.send_multipart([worker, b"close", name.encode("utf-8")])
+
+
+if __name__ == "__main__":
+    # Workers forked before the broker creates its zmq context, so they do not inherit its threads
+    processes = {f"worker-{index}".encode(): multiprocessing.Process(target=run_worker, args=(index,), daemon=True)
+                 for index in range(workers)}
+    for process in processes.values():
+        process.start()
+
+    context = zmq.Context()
+    frontend = context.socket(zmq.ROUTER)
+    frontend.bind(f"tcp://*:{frontPort}")
+    backend = context.socket(zmq.ROUTER)
+    backend.bind(backendAddress)
+    print(f"Session broker on port {frontPort}, {workers} workers")
+
+    metrics = StageMetrics(metricsReportEvery, printMetrics, httpPort=metricsHttpPort)
+    broker = SessionBroker(frontend, backend, metrics, dict(processes))
+    try:
+        broker.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # The sessions are written out, a second Ctrl+C does not interrupt it
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        broker.stop()
+        for process in processes.values():
+            process.join(5)
+        metrics.close()
+        context.destroy(linger=0)
@@ -0,0 +1,175 @@
+#
+#   Persistent 3x3 "Simulation Maps" figure used by ServerSimulator.py and ServerDataCollection.py
+#   The figure and its artists are built once; each step only updates the data of the panels that
+#   changed and blits them, so the cost per step stays flat however long the simulation runs.
+#
+
+import numpy as np
+from PIL import Image
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# Map panels: name -> (panel index in the 3x3 grid, colormap, title)
+MAP_PANELS = {
+    "pressure": (0, "Reds", "Pressure"),
+    "compression": (1, "Reds", "Compression"),
+    "initial_vegetation": (3, "Greens", "Initial Vegetation"),
+    "vegetation": (5, "Greens", "Vegetation"),
+    "initial_young": (6, "Blues", "Initial Young Modulus"),
+    "accumulation": (7, "Blues", "Vertical Accumulation"),
+}
+
+# Number of passes where the trampling curve is annotated
+PASSES_TICKS = [25, 75, 200, 500]
+
+
+class SimulationRenderer:
+    """
+    Renders the normalized maps (0..255) and the trampling curve.
+    headless=True draws on an Agg canvas and never opens a window.
+    """
+
+    def __init__(self, shape=(257, 257), headless=True):
+        self.headless = headless
+        if headless:
+            self.fig = Figure(figsize=(10, 10))
+            FigureCanvasAgg(self.fig)
+        else:
+            import matplotlib.pyplot as plt
+            self.fig = plt.figure(figsize=(10, 10))
+            plt.show(block=False)
+        self.canvas = self.fig.canvas
+
+        axes = self.fig.subplots(nrows=3, ncols=3).flatten()
+        self.fig.subplots_adjust(hspace=0.5, wspace=0.5)
+        self.axes = axes
+
+        # Super title
+        self.fig.suptitle("Simulation Maps", fontsize=14, fontweight='bold')
+
+        # Single titles
+        axes[2].set_title('Compression Width')
+        axes[4].set_title('Vegetation Trampling')
+        axes[8].set_title('Avg. Compression vs. Distance Travelled')
+
+        # =============================================================
+
+        # Maps - Artists are animated so the cached backgrounds do not contain them
+        self.images = {}
+        self._lastData = {}
+        for name, (panel, cmap, title) in MAP_PANELS.items():
+            axes[panel].set_title(title)
+            self.images[name] = axes[panel].imshow(np.zeros(shape), cmap=cmap, interpolation='nearest',
+                                                   vmin=0, vmax=255, animated=True)
+            self._lastData[name] = None
+
+        self.textDistance = axes[1].text(0.05, 0.95, "", transform=axes[1].transAxes, fontsize=14,
+                                         verticalalignment='top', animated=True)
+
+        # =============================================================
+
+        # Trampling curve
+        axTrampling = axes[4]
+        self.lineVegetation, = axTrampling.plot([], [], linestyle='-', color='green', label='vegetation', animated=True)
+        self.markersVegetation, = axTrampling.plot([], [], linestyle='', color='green', marker='o', animated=True)
+        self.annotations = [axTrampling.annotate('', (x, 0), textcoords="offset points", xytext=(10, -10),
+                                                 ha='center', weight="bold", animated=True) for x in PASSES_TICKS]
+        axTrampling.set_xticks(PASSES_TICKS)
+        axTrampling.set_xlim(1, PASSES_TICKS[0])
+        axTrampling.set_ylim(0, 105)
+        axTrampling.set_xlabel('Number of passes')
+        axTrampling.set_ylabel('Relative cover after trampling (%)')
+        axTrampling.legend()  # This displays the legend
+        axTrampling.grid(True)
+
+        # Artists redrawn when their panel is dirty
+        self._artists = {axes[panel]: [self.images[name]] for name, (panel, _, _) in MAP_PANELS.items()}
+        self._artists[axes[1]].append(self.textDistance)
+        self._artists[axTrampling] = [self.lineVegetation, self.markersVegetation] + self.annotations
+
+        self._backgrounds = None
+
+    def update(self, maps, passesArray=None, avgVegetation=None, distanceTravelled=None, tickValues=None):
+        """
+        maps: {panel name: normalized 2D array}, missing panels keep their previous image.
+        tickValues: cover at each of PASSES_TICKS (NaN if not reached yet), e.g. TramplingStats.tick_values.
+        Returns the number of panels redrawn.
+        """
+        dirty = set()
+
+        for name, data in maps.items():
+            last = self._lastData[name]
+            if last is not None and np.array_equal(last, data):
+                continue
+            if last is None or last.shape != data.shape:
+                self._lastData[name] = np.array(data)
+            else:
+                np.copyto(last, data)
+            self.images[name].set_data(self._lastData[name])
+            dirty.add(self.axes[MAP_PANELS[name][0]])
+
+        if distanceTravelled is not None:
+            self.textDistance.set_text(f"Dist: {distanceTravelled:.1f}m")
+            dirty.add(self.axes[1])
+
+        if passesArray is not None and len(passesArray) > 0:
+            self._update_trampling(passesArray, avgVegetation, tickValues)
+            dirty.add(self.axes[4])
+
+        return self.draw(dirty)
+
+    def _update_trampling(self, passesArray, avgVegetation, tickValues=None):
+        axTrampling = self.axes[4]
+        passes = np.asarray(passesArray)
+        remaining = np.asarray(avgVegetation)
+        self.lineVegetation.set_data(passes, remaining)
+
+        # Curve at each vertical gridline - Interpolated here unless already known
+        maxPasses = passes.max()
+        ticks = np.asarray(PASSES_TICKS, dtype=float)
+        if tickValues is None:
+            values = np.interp(ticks, passes, remaining)
+            visible = ticks <= maxPasses
+        else:
+            values = np.asarray(tickValues)
+            visible = ~np.isnan(values) & (ticks <= maxPasses)
+        self.markersVegetation.set_data(ticks[visible], values[visible])
+        for annotation, x, y, show in zip(self.annotations, ticks, values, visible):
+            annotation.xy = (x, y)
+            annotation.set_text('{:.0f}'.format(y))
+            annotation.set_visible(bool(show))
+
+        # Limits grow geometrically, so the full (non-blitted) redraw only happens a few times per run
+        left, right = axTrampling.get_xlim()
+        if maxPasses > right:
+            axTrampling.set_xlim(left, max(2 * right, maxPasses))
+            self._backgrounds = None
+        bottom, top = axTrampling.get_ylim()
+        if remaining.max() > top:
+            axTrampling.set_ylim(bottom, remaining.max() * 1.05)
+            self._backgrounds = None
+
+    def draw(self, dirty=None):
+        if self._backgrounds is None:
+            # Full redraw: static content only, then cache the background of each animated panel
+            self.canvas.draw()
+            self._backgrounds = {ax: self.canvas.copy_from_bbox(ax.bbox) for ax in self._artists}
+            dirty = set(self._artists)
+
+        for ax in dirty or ():
+            self.canvas.restore_region(self._backgrounds[ax])
+            for artist in self._artists[ax]:
+                ax.draw_artist(artist)
+            self.canvas.blit(ax.bbox)
+
+        if not self.headless:
+            self.canvas.flush_events()
+        return len(dirty or ())
+
+    def to_array(self):
+        """Current figure as an RGB uint8 array."""
+        return np.asarray(self.canvas.buffer_rgba())[..., :3]
+
+    def save(self, path):
+        # Saves the blitted buffer as-is instead of re-rendering the whole figure like plt.savefig
+        Image.fromarray(self.to_array()).save(path)
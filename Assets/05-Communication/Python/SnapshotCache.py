@@ -0,0 +1,180 @@
+#
+#   Content-addressed cache of the images saved by the servers (training images and figures)
+#   An entry is keyed by the hash of the maps the images are computed from and of every parameter that
+#   changes them (normalization ranges, image encoding, ...). When a replay or a rerun sends the same frames
+#   with the same settings, the files of the entry are copied to the new paths instead of normalizing,
+#   converting and encoding the images again.
+#   Entries are folders <directory>/<key>/ with the files and entry.json (encode time, to report the time
+#   saved). The cache is bounded in size: the least recently used entries are deleted first.
+#   Files are always copied (never hardlinked): the servers rewrite their images in place on the next run.
+#
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+ENTRY_FILE = "entry.json"
+
+
+def copy_file(src, dst):
+    # Written under a temporary name, so a reader never sees a partial image
+    tmp = dst + ".tmp"
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+class SnapshotCache:
+    """
+    key(arrays, params) -> hex key. get(key, basePaths) copies the files of an entry, put(key, paths, seconds)
+    stores written files. on_written(key) gives the done callback of ImageEncoder.write, which puts the images
+    once they are on disk (also when they are encoded in the processes of ImageSink).
+    """
+
+    def __init__(self, directory, maxBytes=2 * 1024 ** 3):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.savedSeconds = 0.0
+
+        # key -> (size, encode seconds), least recently used first - Rebuilt from the folder on start
+        self._entries = OrderedDict()
+        self.size = 0
+        found = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                info = os.path.join(entry.path, ENTRY_FILE)
+                if entry.is_dir() and os.path.exists(info):
+                    with open(info) as file:
+                        seconds = json.load(file)["seconds"]
+                    found.append((os.path.getmtime(info), entry.name, self._folder_size(entry.path), seconds))
+                elif entry.name.endswith(".tmp"):
+                    # Left by an interrupted put
+                    shutil.rmtree(entry.path, ignore_errors=True)
+        for _, key, size, seconds in sorted(found):
+            self._entries[key] = (size, seconds)
+            self.size += size
+        self._evict()
+
+    @staticmethod
+    def key(arrays, params=None):
+        """Hash of the arrays (values, dtype and shape) and of the parameters (JSON serializable)."""
+        digest = hashlib.blake2b(digest_size=16)
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            digest.update(f"{array.dtype.str}{array.shape}".encode())
+            digest.update(array)
+        digest.update(json.dumps(params, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def get(self, key, basePaths):
+        """Copies the files of the entry to basePaths (extension of the cached files). False on a miss."""
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+        if cached is None:
+            with self._lock:
+                self.misses += 1
+            return False
+
+        start = time.perf_counter()
+        folder = os.path.join(self.directory, key)
+        try:
+            with open(os.path.join(folder, ENTRY_FILE)) as file:
+                files = json.load(file)["files"]
+            if len(files) != len(basePaths):
+                raise ValueError(f"{len(files)} files cached, {len(basePaths)} expected")
+            for name, basePath in zip(files, basePaths):
+                copy_file(os.path.join(folder, name), basePath + os.path.splitext(name)[1])
+            os.utime(os.path.join(folder, ENTRY_FILE))
+        except (OSError, ValueError, KeyError):
+            # Evicted meanwhile, or damaged - Computed again and put back
+            self._remove(key)
+            with self._lock:
+                self.misses += 1
+            return False
+
+        with self._lock:
+            self.hits += 1
+            self.savedSeconds += max(cached[1] - (time.perf_counter() - start), 0.0)
+        return True
+
+    def put(self, key, paths, seconds=0.0):
+        """Stores the files (paths with extension), seconds: time it took to produce them."""
+        with self._lock:
+            if key in self._entries:
+                return
+        folder = os.path.join(self.directory, key)
+        tmp = f"{folder}.{os.getpid()}-{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(tmp)
+            files = []
+            for i, path in enumerate(paths):
+                name = f"{i}{os.path.splitext(path)[1]}"
+                shutil.copyfile(path, os.path.join(tmp, name))
+                files.append(name)
+            with open(os.path.join(tmp, ENTRY_FILE), "w") as file:
+                json.dump({"files": files, "seconds": seconds}, file)
+            size = self._folder_size(tmp)
+            os.rename(tmp, folder)
+        except OSError:
+            # Source already rewritten, or the same entry put by another thread
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+
+        with self._lock:
+            self._entries[key] = (size, seconds)
+            self.size += size
+        self._evict()
+
+    def on_written(self, key, seconds=0.0):
+        """done callback of ImageEncoder.write, puts the images; seconds is added to their encode time."""
+        return lambda paths, encodeSeconds: self.put(key, paths, seconds + encodeSeconds)
+
+    def hit_rate(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return self.hits / lookups if lookups else 0.0
+
+    def summary(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            rate = self.hits / lookups * 100 if lookups else 0.0
+            return (f"Cache: {self.hits}/{lookups} hits ({rate:.0f}%), {self.savedSeconds:.1f}s saved, "
+                    f"{len(self._entries)} entries, {self.size / 1024 / 1024:.0f}MB, {self.evicted} evicted")
+
+    # =============================================================
+
+    @staticmethod
+    def _folder_size(folder):
+        with os.scandir(folder) as entries:
+            return sum(entry.stat().st_size for entry in entries if entry.is_file())
+
+    def _remove(self, key):
+        with self._lock:
+            cached = self._entries.pop(key, None)
+            if cached is not None:
+                self.size -= cached[0]
+        shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+        return cached is not None
+
+    def _evict(self):
+        while True:
+            with self._lock:
+                if self.size <= self.maxBytes or not self._entries:
+                    return
+                key = next(iter(self._entries))
+            if self._remove(key):
+                with self._lock:
+                    self.evicted += 1
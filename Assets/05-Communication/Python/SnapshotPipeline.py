@@ -0,0 +1,159 @@
+#
+#   Background pipeline for everything the Unity client does not wait for (plots, PNG files, ...)
+#   The server loop submits a snapshot after replying; worker threads consume them from a bounded
+#   queue. When the workers fall behind, the back-pressure policy decides what happens:
+#       "drop-oldest" -> the oldest queued snapshot is discarded, the server never waits
+#       "block"       -> the server waits for a free slot, no snapshot is lost
+#       "sample"      -> only one snapshot every sampleEvery is kept, overflow drops the oldest
+#   Snapshots submitted with keep=True (the steps saved to disk) are never sampled out nor dropped: with a
+#   queue full of kept snapshots, a new one waits for a free slot and a snapshot not kept is dropped instead.
+#
+
+import atexit
+import collections
+import threading
+import traceback
+
+POLICIES = ("drop-oldest", "block", "sample")
+
+
+class SnapshotPipeline:
+    """
+    handler(snapshot) is called from the worker threads, in submission order when workers=1.
+    onDrop(snapshot), if given, is called for every snapshot that never reaches the handler.
+    Submitted arrays must not be modified afterwards by the producer.
+    """
+
+    def __init__(self, handler, maxQueue=8, policy="drop-oldest", sampleEvery=1, workers=1, onDrop=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown back-pressure policy '{policy}', expected one of {POLICIES}")
+        if maxQueue < 1 or sampleEvery < 1 or workers < 1:
+            raise ValueError("maxQueue, sampleEvery and workers must be at least 1")
+
+        self.handler = handler
+        self.onDrop = onDrop
+        self.maxQueue = maxQueue
+        self.policy = policy
+        self.sampleEvery = sampleEvery
+
+        self._queue = collections.deque()
+        self._lock = threading.Condition()
+        self._closed = False
+        self._busy = 0
+
+        # Counters
+        self.submitted = 0
+        self.skipped = 0  # Not sampled
+        self.dropped = 0  # Discarded because the queue was full
+        self.processed = 0
+        self.failed = 0
+
+        self._threads = [threading.Thread(target=self._work, name=f"SnapshotWorker-{i}", daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+        # Flush what is left when the server is stopped
+        atexit.register(self.close)
+
+    def submit(self, snapshot, keep=False):
+        """Queue a snapshot. Returns False if it was not sampled."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("SnapshotPipeline is closed")
+
+            self.submitted += 1
+            if self.policy == "sample" and not keep and (self.submitted - 1) % self.sampleEvery != 0:
+                self.skipped += 1
+                if self.onDrop is not None:
+                    self.onDrop(snapshot)
+                return False
+
+            if len(self._queue) >= self.maxQueue:
+                if self.policy != "block" and not self._drop_oldest():
+                    if not keep:
+                        self._drop(snapshot)
+                        return False
+                self._lock.wait_for(lambda: len(self._queue) < self.maxQueue)
+
+            self._queue.append((snapshot, keep))
+            self._lock.notify_all()
+            return True
+
+    def _drop_oldest(self):
+        """Drops the oldest queued snapshot not kept. False if every queued snapshot is kept."""
+        for i, (snapshot, keep) in enumerate(self._queue):
+            if not keep:
+                del self._queue[i]
+                self._drop(snapshot)
+                return True
+        return False
+
+    def _drop(self, snapshot):
+        self.dropped += 1
+        if self.onDrop is not None:
+            self.onDrop(snapshot)
+
+    def depth(self):
+        with self._lock:
+            return len(self._queue)
+
+    def join(self):
+        """Wait until every queued snapshot has been processed."""
+        with self._lock:
+            self._lock.wait_for(lambda: not self._queue and self._busy == 0)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._lock.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def summary(self):
+        return (f"snapshots: {self.submitted} submitted, {self.processed} processed, "
+                f"{self.dropped} dropped, {self.skipped} skipped, {self.failed} failed")
+
+    def _work(self):
+        while True:
+            with self._lock:
+                self._lock.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    return
+                snapshot, _ = self._queue.popleft()
+                self._busy += 1
+                self._lock.notify_all()
+
+            ok = True
+            try:
+                self.handler(snapshot)
+            except Exception:
+                # A failing plot or write must not stop the pipeline
+                ok = False
+                traceback.print_exc()
+            finally:
+                with self._lock:
+                    if ok:
+                        self.processed += 1
+                    else:
+                        self.failed += 1
+                    self._busy -= 1
+                    self._lock.notify_all()
+
+
+if __name__ == "__main__":
+    # Self-check: every snapshot submitted with keep=True reaches the handler, whatever the policy,
+    # with a slow worker and a small queue (snapshotEvery = 20, snapshotSampleEvery = 3 as in the servers)
+    import time
+    for policy in POLICIES:
+        handled = []
+        pipeline = SnapshotPipeline(lambda step: (time.sleep(0.002), handled.append(step)), maxQueue=2,
+                                    policy=policy, sampleEvery=3)
+        for step in range(1, 201):
+            pipeline.submit(step, keep=(step % 20 == 0))
+        pipeline.close()
+        missing = [step for step in range(20, 201, 20) if step not in handled]
+        assert not missing, f"{policy}: kept steps {missing} never processed"
+        print(f"{policy}: all kept steps processed - {pipeline.summary()}")
@@ -0,0 +1,195 @@
+#
+#   Per-stage latency metrics of the server loop and of the background workers
+#   Each thread times its stages with laps (one clock read per stage), the durations go into fixed
+#   log-spaced histograms (10 buckets per decade, 1us..10s), so recording costs a bisect and an increment
+#   and the p50/p95/p99 are read from the histograms. Queue depths are sampled from gauges at report time.
+#   Every reportEvery seconds the window is printed (or not), merged into the totals and published:
+#       HTTP     -> GET http://127.0.0.1:<httpPort>/metrics returns the last report as JSON
+#       ZMQ PUB  -> topic b"metrics" followed by the same JSON, on tcp://*:<pubPort>
+#
+
+import bisect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Bucket upper bounds in nanoseconds, 10 per decade from 1us to 10s
+BUCKETS = [int(10 ** (3 + i / 10)) for i in range(71)]
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, ns):
+        self.counts[bisect.bisect_left(BUCKETS, ns)] += 1
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile, in ns (at most 26% above the value)."""
+        if self.count == 0:
+            return 0
+        rank = q / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(BUCKETS[i] if i < len(BUCKETS) else self.max, self.max)
+        return self.max
+
+    def summary(self):
+        ms = 1e-6
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * ms if self.count else 0.0,
+            "p50_ms": self.percentile(50) * ms,
+            "p95_ms": self.percentile(95) * ms,
+            "p99_ms": self.percentile(99) * ms,
+            "max_ms": self.max * ms,
+        }
+
+
+class Laps:
+    """Stage timer of one thread: lap(name) records the time since the previous lap (or start)."""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self._last = time.perf_counter_ns()
+
+    def start(self):
+        self._last = time.perf_counter_ns()
+
+    def lap(self, name):
+        now = time.perf_counter_ns()
+        self.metrics.add(name, now - self._last)
+        self._last = now
+
+
+class StageMetrics:
+    """
+    laps() gives a stage timer per thread, step() counts the frames of the server loop.
+    gauge(name, function) registers a queue depth (or any number) sampled at each report.
+    """
+
+    def __init__(self, reportEvery=30, printReport=True, httpPort=None, pubSocket=None):
+        self.reportEvery = reportEvery
+        self.printReport = printReport
+        self.pubSocket = pubSocket
+
+        self._lock = threading.Lock()
+        self._window = {}
+        self._totals = {}
+        self._gauges = {}
+        self._steps = 0
+        self._totalSteps = 0
+        self._windowStart = self._start = time.perf_counter()
+        self.last = {}
+
+        self._http = None
+        if httpPort is not None:
+            self._http = serve_http(self, httpPort)
+
+    def laps(self):
+        return Laps(self)
+
+    def add(self, name, ns):
+        with self._lock:
+            histogram = self._window.get(name)
+            if histogram is None:
+                histogram = self._window[name] = Histogram()
+            histogram.add(ns)
+
+    def gauge(self, name, function):
+        self._gauges[name] = function
+
+    def step(self):
+        """End of a step of the server loop - Reports when reportEvery seconds have passed."""
+        self._steps += 1
+        if time.perf_counter() - self._windowStart >= self.reportEvery:
+            self.report()
+
+    def report(self):
+        now = time.perf_counter()
+        with self._lock:
+            window, self._window = self._window, {}
+            steps, self._steps = self._steps, 0
+            for name, histogram in window.items():
+                self._totals.setdefault(name, Histogram()).merge(histogram)
+            totals = {name: histogram.summary() for name, histogram in self._totals.items()}
+        self._totalSteps += steps
+        elapsed, self._windowStart = now - self._windowStart, now
+
+        report = {
+            "time": time.time(),
+            "window_s": elapsed,
+            "fps": steps / elapsed if elapsed > 0 else 0.0,
+            "steps": self._totalSteps,
+            "fps_total": self._totalSteps / (now - self._start),
+            "stages": {name: histogram.summary() for name, histogram in window.items()},
+            "stages_total": totals,
+            "gauges": {name: function() for name, function in self._gauges.items()},
+        }
+        self.last = report
+
+        if self.printReport:
+            print(format_report(report))
+        if self.pubSocket is not None:
+            self.pubSocket.send_multipart([b"metrics", json.dumps(report).encode("utf-8")])
+        return report
+
+    def close(self):
+        if self._http is not None:
+            self._http.shutdown()
+
+
+def format_report(report):
+    lines = [f"Metrics: {report['fps']:.1f} fps over {report['window_s']:.0f}s ({report['steps']} steps, "
+             f"{report['fps_total']:.1f} fps overall)"]
+    for name, stage in report["stages"].items():
+        lines.append(f"    {name:<22} mean {stage['mean_ms']:7.2f}ms  p50 {stage['p50_ms']:7.2f}ms  "
+                     f"p95 {stage['p95_ms']:7.2f}ms  p99 {stage['p99_ms']:7.2f}ms  ({stage['count']})")
+    if report["gauges"]:
+        lines.append("    " + ", ".join(f"{name}: {value}" for name, value in report["gauges"].items()))
+    return "\n".join(lines)
+
+
+def serve_http(metrics, port, host="127.0.0.1"):
+    """Local HTTP endpoint serving the last report, in a daemon thread. None if the port cannot be bound."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = json.dumps(metrics.last, indent=2).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), Handler)
+    except OSError as error:
+        # Port taken (another server running) - The metrics are still printed and published
+        print(f"Metrics HTTP endpoint disabled, cannot bind {host}:{port}: {error}")
+        return None
+    threading.Thread(target=server.serve_forever, name="MetricsHTTP", daemon=True).start()
+    return server
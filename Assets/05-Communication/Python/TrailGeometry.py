@@ -0,0 +1,136 @@
+#
+#   Trail geometry: width and depth of the trail from the compression map, every step
+#   The compression summed along the trail gives a marginal profile across it, modelled as a Gaussian
+#   A * exp(-(x - mu)^2 / (2 sigma^2)). Instead of a curve_fit per step (slow, and it sometimes does not
+#   converge), mu, sigma and A come from the moments of the profile, optionally refined by a few damped
+#   Gauss-Newton iterations seeded from the previous step. Both work on a batch of profiles (..., n) at once,
+#   e.g. the (angles, radius) profiles of RadialProfiles.py, without a Python loop over the profiles.
+#
+
+import math
+import numpy as np
+
+
+def gaussian(x, mu, sigma, A):
+    return A * np.exp(-(x - mu) ** 2 / (2 * sigma ** 2))
+
+
+def moments(profiles, x=None, floor=0.05):
+    """
+    mu, sigma and A of the Gaussian with the same mass, mean and variance as each profile (..., n).
+    The sign of the profiles is ignored (compression is negative). Only the values around the peak down to
+    floor * peak are used, so the noise away from the trail does not widen it, and sigma and A are corrected
+    for that truncation (exact for a Gaussian profile). NaN for an empty profile.
+    """
+    profiles = np.abs(np.asarray(profiles, dtype=np.float64))
+    x = np.arange(profiles.shape[-1], dtype=np.float64) if x is None else np.asarray(x, dtype=np.float64)
+    spacing = x[1] - x[0] if len(x) > 1 else 1.0
+
+    if floor > 0:
+        # Only the run of values above floor * peak around the peak, so noise elsewhere is not counted
+        index = np.arange(profiles.shape[-1])
+        peak = profiles.argmax(axis=-1)[..., None]
+        below = profiles < floor * np.take_along_axis(profiles, peak, axis=-1)
+        left = np.where(below & (index < peak), index, -1).max(axis=-1, keepdims=True)
+        right = np.where(below & (index > peak), index, len(index)).min(axis=-1, keepdims=True)
+        profiles = np.where((index > left) & (index < right), profiles, 0)
+        # A Gaussian cut at floor * peak keeps |x - mu| < c sigma
+        c = np.sqrt(-2 * np.log(floor))
+        kept = math.erf(c / np.sqrt(2))
+        varianceKept = 1 - 2 * c * np.exp(-c * c / 2) / np.sqrt(2 * np.pi) / kept
+    else:
+        kept, varianceKept = 1.0, 1.0
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mass = profiles.sum(axis=-1)
+        mu = (profiles @ x) / mass
+        variance = (profiles @ (x * x)) / mass - mu * mu
+        sigma = np.sqrt(np.maximum(variance, 0) / varianceKept)
+        A = mass * spacing / (sigma * np.sqrt(2 * np.pi) * kept)
+    empty = ~(mass > 0) | ~(sigma > 0)
+    return np.where(empty, np.nan, mu), np.where(empty, np.nan, sigma), np.where(empty, np.nan, A)
+
+
+def fit(profiles, x=None, p0=None, iterations=5, damping=1e-3):
+    """
+    Gaussian least squares fit of each profile (..., n), from p0 = (mu, sigma, A) or from the moments.
+    Damped Gauss-Newton, vectorized over the profiles: a fixed number of iterations, so it never stalls.
+    Profiles whose fit does not improve on the start keep their starting parameters, NaN for empty ones.
+    """
+    y = np.abs(np.asarray(profiles, dtype=np.float64))
+    batchShape = y.shape[:-1]
+    y = y.reshape(-1, y.shape[-1])
+    x = np.arange(y.shape[-1], dtype=np.float64) if x is None else np.asarray(x, dtype=np.float64)
+
+    def residuals(p):
+        return gaussian(x, p[:, 0:1], p[:, 1:2], p[:, 2:3]) - y
+
+    def error(p):
+        r = residuals(p)
+        return np.where(np.all(np.isfinite(p), axis=-1) & (p[:, 1] > 0), np.einsum("ij,ij->i", r, r), np.inf)
+
+    # Start from the moments, or from p0 where it is closer (e.g. the previous step)
+    params = np.stack(moments(y, x), axis=-1)  # (profiles, 3): mu, sigma, A
+    valid = np.all(np.isfinite(params), axis=-1)
+    if p0 is not None:
+        seed = np.stack([np.broadcast_to(value, batchShape).reshape(-1) for value in p0], axis=-1).astype(np.float64)
+        closer = error(seed) < error(params)
+        params[closer] = seed[closer]
+    params[~valid] = (0.0, 1.0, 0.0)
+
+    best = params.copy()
+    bestError = error(best)
+    for _ in range(iterations):
+        mu, sigma, A = params[:, 0:1], params[:, 1:2], params[:, 2:3]
+        e = np.exp(-(x - mu) ** 2 / (2 * sigma ** 2))
+        r = A * e - y
+        # Jacobian (profiles, n, 3)
+        J = np.stack([A * e * (x - mu) / sigma ** 2, A * e * (x - mu) ** 2 / sigma ** 3, e], axis=-1)
+        JtJ = np.einsum("pni,pnj->pij", J, J)
+        JtJ += damping * np.eye(3) * np.trace(JtJ, axis1=1, axis2=2)[:, None, None] + 1e-12 * np.eye(3)
+        step = np.linalg.solve(JtJ, np.einsum("pni,pn->pi", J, r)[..., None])[..., 0]
+        params = params - step
+        params[:, 1] = np.abs(params[:, 1])
+
+        stepError = error(params)
+        better = stepError < bestError
+        best[better] = params[better]
+        bestError[better] = stepError[better]
+        params = np.where(np.all(np.isfinite(params), axis=-1, keepdims=True), params, best)
+
+    best[~valid] = np.nan
+    best = best.reshape(batchShape + (3,))
+    return best[..., 0], best[..., 1], best[..., 2]
+
+
+class TrailEstimator:
+    """
+    Width (m) and depth (m) of a trail running along the columns of the compression map, one update per step.
+    width = widthSigmas * sigma of the profile across the trail, as the former "GAUSSIAN WIDTH" block (6 sigma).
+    depth = A of the same profile averaged along the trail: the mean compression on the trail center line.
+    method: "moments", or "fit" to refine them, seeded from the previous step.
+    """
+
+    def __init__(self, terrainSize=10.0, widthSigmas=6, method="moments", iterations=5):
+        if method not in ("moments", "fit"):
+            raise ValueError(f"Unknown method '{method}', expected 'moments' or 'fit'")
+        self.terrainSize = terrainSize
+        self.widthSigmas = widthSigmas
+        self.method = method
+        self.iterations = iterations
+        self.params = (np.nan, np.nan, np.nan)  # mu, sigma, A of the last step, in cells
+
+    def update(self, compression):
+        """Returns (width, depth), 0 until the terrain is compressed."""
+        compression = np.asarray(compression)
+        profile = compression.sum(axis=1)  # Across the trail, one value per row
+        mu, sigma, A = moments(profile)
+        if self.method == "fit" and np.isfinite(mu):
+            seed = self.params if np.all(np.isfinite(self.params)) else (mu, sigma, A)
+            mu, sigma, A = fit(profile, p0=seed, iterations=self.iterations)
+        self.params = (float(mu), float(sigma), float(A))
+
+        if not np.isfinite(sigma):
+            return 0.0, 0.0
+        cellSize = self.terrainSize / len(profile)
+        return self.widthSigmas * float(sigma) * cellSize, float(A) / compression.shape[1]
@@ -0,0 +1,154 @@
+#
+#   Trampling statistics: relative vegetation cover and compression of the terrain over the passes
+#   The cells with vegetation are indexed once, when the reference maps are captured, and every step
+#   only gathers those cells into a preallocated buffer. The history is kept in growing arrays, and the
+#   cover at each tick of the trampling curve is interpolated once, when the passes cross that tick.
+#   cover_curve() and compression_curve() compute the same series for a whole archived run (T, H, W).
+#
+
+import numpy as np
+from SimulationRenderer import PASSES_TICKS
+
+# Distance travelled (m) for one pass over the terrain
+PASS_LENGTH = 7
+
+
+class TramplingStats:
+    """
+    update() is called once per step by the server loop, after the derived maps are computed.
+    passes, distances, cover, compression_mean, compression_max and compressed_area are views on the
+    history (one value per step); they stay valid when the history grows.
+    """
+
+    SERIES = ("distances", "passes", "cover", "compression_mean", "compression_max", "compressed_area")
+
+    def __init__(self, initialVegetation, ticks=PASSES_TICKS, capacity=1024):
+        self.ticks = np.asarray(ticks, dtype=float)
+        self.length = 0
+        self._history = {name: np.zeros(capacity) for name in self.SERIES}
+
+        # Cover at each tick, NaN until the passes reach it
+        self.tick_values = np.full(len(self.ticks), np.nan)
+        self._nextTick = 0
+
+        self.set_reference(initialVegetation)
+
+    def set_reference(self, initialVegetation):
+        """Index of the cells with vegetation and their inverse, in percent."""
+        initial = np.asarray(initialVegetation).reshape(-1)
+        self.index = np.flatnonzero(initial)
+        self._inverse = (100 / initial[self.index]).astype(np.float32)
+        self._selected = np.empty(len(self.index), dtype=np.float32)
+
+    # =============================================================
+
+    # History of each series, up to the last step
+    @property
+    def distances(self):
+        return self._history["distances"][:self.length]
+
+    @property
+    def passes(self):
+        return self._history["passes"][:self.length]
+
+    @property
+    def cover(self):
+        return self._history["cover"][:self.length]
+
+    @property
+    def compression_mean(self):
+        return self._history["compression_mean"][:self.length]
+
+    @property
+    def compression_max(self):
+        return self._history["compression_max"][:self.length]
+
+    @property
+    def compressed_area(self):
+        return self._history["compressed_area"][:self.length]
+
+    def update(self, vegetation, compression, distanceTravelled):
+        """Append the statistics of one step. Returns the relative cover (%)."""
+        if self.length == len(self._history["passes"]):
+            # Double the capacity, the views handed out before keep the old arrays
+            self._history = {name: np.concatenate([series, np.zeros_like(series)])
+                             for name, series in self._history.items()}
+
+        # Relative cover of the cells that had vegetation in the reference maps
+        np.take(np.asarray(vegetation).reshape(-1), self.index, out=self._selected)
+        np.multiply(self._selected, self._inverse, out=self._selected)
+        cover = float(self._selected.mean(dtype=np.float64)) if len(self.index) else float("nan")
+
+        # Compression: the map is <= 0, only compressed cells count
+        compressedCells = np.count_nonzero(compression)
+        depthSum = -float(compression.sum(dtype=np.float64))
+        i = self.length
+        self._history["distances"][i] = distanceTravelled
+        self._history["passes"][i] = distanceTravelled / PASS_LENGTH
+        self._history["cover"][i] = cover
+        self._history["compression_mean"][i] = depthSum / compressedCells if compressedCells else 0.0
+        self._history["compression_max"][i] = -float(compression.min())
+        self._history["compressed_area"][i] = compressedCells / compression.size
+        self.length += 1
+
+        self._update_ticks()
+        return cover
+
+    def _update_ticks(self):
+        # The distance travelled only grows, so a tick is interpolated once, between the two steps around it
+        passes = self._history["passes"]
+        cover = self._history["cover"]
+        i = self.length - 1
+        while self._nextTick < len(self.ticks) and passes[i] >= self.ticks[self._nextTick]:
+            tick = self.ticks[self._nextTick]
+            if i == 0 or passes[i] == passes[i - 1]:
+                value = cover[i]
+            else:
+                weight = (tick - passes[i - 1]) / (passes[i] - passes[i - 1])
+                value = cover[i - 1] + max(weight, 0.0) * (cover[i] - cover[i - 1])
+            self.tick_values[self._nextTick] = value
+            self._nextTick += 1
+
+
+# =============================================================
+
+# Archived runs - One vectorized pass over a stack of maps (T, H, W), processed in chunks of frames
+
+def cover_curve(vegetation, initialVegetation, chunk=64):
+    """Relative cover (%) of each frame, over the cells with vegetation in initialVegetation."""
+    vegetation = np.asarray(vegetation)
+    index = np.flatnonzero(np.asarray(initialVegetation).reshape(-1))
+    inverse = (100 / np.asarray(initialVegetation).reshape(-1)[index]).astype(np.float32)
+
+    frames = vegetation.reshape(len(vegetation), -1)
+    cover = np.empty(len(frames))
+    for start in range(0, len(frames), chunk):
+        selected = np.take(frames[start:start + chunk], index, axis=1) * inverse
+        cover[start:start + chunk] = selected.mean(axis=1, dtype=np.float64)
+    return cover
+
+
+def compression_curve(height, initialHeight, chunk=64):
+    """Mean and max depth of the compressed cells and compressed area of each frame."""
+    height = np.asarray(height)
+    frames = height.reshape(len(height), -1)
+    initial = np.asarray(initialHeight, dtype=np.float32).reshape(-1)
+
+    curve = {name: np.empty(len(frames)) for name in ("compression_mean", "compression_max", "compressed_area")}
+    for start in range(0, len(frames), chunk):
+        depth = np.maximum(initial - frames[start:start + chunk], 0)
+        cells = np.count_nonzero(depth, axis=1)
+        sums = depth.sum(axis=1, dtype=np.float64)
+        curve["compression_mean"][start:start + chunk] = np.divide(sums, cells, out=np.zeros(len(cells)),
+                                                                   where=cells > 0)
+        curve["compression_max"][start:start + chunk] = depth.max(axis=1)
+        curve["compressed_area"][start:start + chunk] = cells / frames.shape[1]
+    return curve
+
+
+def tick_values(passes, cover, ticks=PASSES_TICKS):
+    """Cover at each tick of the trampling curve, NaN for the ticks the run never reached."""
+    ticks = np.asarray(ticks, dtype=float)
+    values = np.interp(ticks, passes, cover)
+    values[ticks > np.max(passes)] = np.nan
+    return values
@@ -0,0 +1,156 @@
+#
+#   Live video of a run: the frames rendered by the server loop are piped straight to an ffmpeg subprocess
+#   (raw RGB on its stdin), without writing and reading back PNG files. A background thread feeds the
+#   encoder from a bounded queue, so the loop only copies the frame into a preallocated buffer; when the
+#   encoder falls behind, frames are dropped (and counted) instead of stalling the loop.
+#   The video is written in segments of segmentFrames frames (<path>-000.mp4, <path>-001.mp4, ...), each
+#   a fragmented mp4: a crash loses at most the fragment being written, every earlier frame stays playable.
+#   ffmpeg must be installed and on the PATH (or given with ffmpeg=...).
+#
+
+import os
+import queue
+import subprocess
+import threading
+import time
+import numpy as np
+from ColormapLUT import apply_lut
+
+
+class VideoSink:
+    """
+    write(frame) takes an RGB or RGBA uint8 frame (H, W, 3|4), e.g. SimulationRenderer.to_array(); the size
+    of the first frame sets the size of the video. write_map() colors a raw map through a colormap LUT.
+    """
+
+    def __init__(self, path, fps=15, segmentFrames=900, codec="libx264", crf=23, preset="veryfast",
+                 maxQueue=32, ffmpeg="ffmpeg"):
+        self.path = path
+        self.fps = fps
+        self.segmentFrames = segmentFrames
+        self.codec = codec
+        self.crf = crf
+        self.preset = preset
+        self.ffmpeg = ffmpeg
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        self._queue = queue.Queue()
+        self._free = queue.Queue()
+        self._maxQueue = maxQueue
+        self._shape = None
+        self._process = None
+        self._segmentFrames = 0
+        self.error = None
+
+        # Counters
+        self.frames = 0
+        self.dropped = 0
+        self.segments = 0
+        self.encodeSeconds = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="VideoSink", daemon=True)
+        self._thread.start()
+
+    def write(self, frame, block=False):
+        """
+        Queues a copy of the frame. Returns False if it was dropped (encoder behind, or failed).
+        block=True waits for the encoder instead of dropping, for offline use (e.g. png2video.py).
+        """
+        frame = np.asarray(frame)
+        if self.error is not None or self._thread is None:
+            self.dropped += 1
+            return False
+        if self._shape is None:
+            self._shape = frame.shape[:2]
+            for _ in range(self._maxQueue):
+                self._free.put(np.empty(self._shape + (3,), dtype=np.uint8))
+        if frame.shape[:2] != self._shape:
+            raise ValueError(f"Frame of {frame.shape[:2]}, the video is {self._shape}")
+
+        try:
+            buffer = self._free.get(block=block)
+        except queue.Empty:
+            self.dropped += 1
+            return False
+        np.copyto(buffer, frame[..., :3])
+        self._queue.put(buffer)
+        return True
+
+    def write_map(self, array, lut, low, high, block=False):
+        """Raw map (H, W) colored through a colormap LUT, see ColormapLUT.py."""
+        return self.write(apply_lut(array, lut, low, high), block=block)
+
+    def close(self):
+        """Encodes the frames still queued and finalizes the last segment."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def summary(self):
+        status = f", failed: {self.error}" if self.error else ""
+        return (f"Video: {self.frames} frames in {self.segments} segments, {self.dropped} dropped, "
+                f"{self.encodeSeconds * 1000 / max(self.frames, 1):.1f}ms per frame{status}")
+
+    # =============================================================
+
+    def segment_path(self, segment):
+        return f"{self.path}-{segment:03d}.mp4"
+
+    def _command(self, segment):
+        height, width = self._shape
+        return [
+            self.ffmpeg, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(self.fps), "-i", "-",
+            # yuv420p needs even sizes, the terrain maps are odd (257, 513, ...)
+            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            "-c:v", self.codec, "-preset", self.preset, "-crf", str(self.crf), "-pix_fmt", "yuv420p",
+            "-movflags", "frag_keyframe+empty_moov",
+            self.segment_path(segment),
+        ]
+
+    def _open_segment(self):
+        self._process = subprocess.Popen(self._command(self.segments), stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        self._segmentFrames = 0
+
+    def _close_segment(self):
+        if self._process is None:
+            return
+        self._process.stdin.close()
+        stderr = self._process.stderr.read().decode(errors="replace").strip()
+        if self._process.wait() != 0 and self.error is None:
+            self.error = stderr.splitlines()[-1] if stderr else f"ffmpeg exited with {self._process.returncode}"
+        self._process = None
+        self.segments += 1
+
+    def _run(self):
+        while True:
+            buffer = self._queue.get()
+            if buffer is None:
+                break
+            try:
+                if self.error is None:
+                    if self._process is None:
+                        self._open_segment()
+                    start = time.perf_counter()
+                    self._process.stdin.write(buffer.data)
+                    self.encodeSeconds += time.perf_counter() - start
+                    self.frames += 1
+                    self._segmentFrames += 1
+                    if self._segmentFrames >= self.segmentFrames:
+                        self._close_segment()
+            except (OSError, ValueError) as error:
+                # ffmpeg missing or exited - The frames are dropped from now on
+                self.error = str(error)
+                if self._process is not None:
+                    self._process.kill()
+                    self._process = None
+            finally:
+                self._free.put(buffer)
+
+        try:
+            self._close_segment()
+        except OSError as error:
+            self.error = str(error)
+        if self.error is not None:
+            print(f"Video sink failed: {self.error}")
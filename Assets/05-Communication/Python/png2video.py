@@ -1,35 +1,33 @@
-import cv2
+#
+#   Video of a folder of PNG frames (1.png, 2.png, 3.png, ...), for runs already saved to disk
+#   New runs can stream their frames to the video directly (recordVideo in ServerSimulator.py)
+#
+
 import os
+import numpy as np
+from PIL import Image
+from VideoSink import VideoSink
 
 # Directory containing input images
 input_dir = "frames/SimulatorData-8/TestData-1-Summer-v3"
 #input_dir = "frames/TrainData-12/dataset/test_AB_shuf/ForVideo"
 
+fps = 1
+
 # Get list of image files in directory
 img_files = [f for f in os.listdir(input_dir) if f.endswith('.png')]
 
 # Sort files in natural order (1.png, 2.png, 3.png, etc.)
 img_files.sort(key=lambda x: int(os.path.splitext(x)[0]))
 
-# Get image dimensions
-img = cv2.imread(os.path.join(input_dir, img_files[0]))
-height, width, layers = img.shape
-
-# Create VideoWriter object
-fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-
-dir = input_dir + '/Video/'
-if not os.path.exists(dir):
-    os.makedirs(dir)
-
-video = cv2.VideoWriter(dir + 'output.mp4', fourcc, 1, (width, height))
+# Single segment: Video/output-000.mp4
+video = VideoSink(input_dir + '/Video/output', fps=fps, segmentFrames=len(img_files), maxQueue=4)
 
 # Loop over input images and write to video
 for img_file in img_files:
-    img_path = os.path.join(input_dir, img_file)
-    img = cv2.imread(img_path)
-    video.write(img)
+    img = np.asarray(Image.open(os.path.join(input_dir, img_file)).convert('RGB'))
+    video.write(img, block=True)  # Waits for the encoder, no frame dropped
 
 # Release resources
-video.release()
-cv2.destroyAllWindows()
+video.close()
+print(video.summary())